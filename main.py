@@ -1,223 +1,2482 @@
 from astrbot.api.event import filter, AstrMessageEvent, MessageEventResult
-from astrbot.api.star import Context, Star, register
+from astrbot.api.star import Context, Star, StarTools, register
 from astrbot.api import logger
 from astrbot.api import AstrBotConfig
+from astrbot.api.message_components import File
 import aiohttp
-import time
+import asyncio
+import base64
+import bisect
+import calendar
+import codecs
+import hashlib
+import difflib
+import functools
+import gzip
+import itertools
 import json
+import math
+import os
+import random
+import re
+import struct
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
 
-@register("astrbot_portainer_plugin", "RC", "简单查看portainer的情况", "1.0")
-class MyPlugin(Star):
-    def __init__(self, context: Context, config: AstrBotConfig):
-        super().__init__(context)
-        self.config = config
-        portainer_config = config.get("portainer", {})
+try:
+    import zstandard
+except ImportError:  # zstd压缩导出为可选功能
+    zstandard = None
+
+# Docker多路复用日志帧头：1字节流类型 + 3字节填充 + 4字节大端负载长度
+_LOG_FRAME_HEADER = struct.Struct(">BxxxL")
+_LOG_STREAM_NAMES = {0: "stdin", 1: "stdout", 2: "stderr"}
+_CJK_PATTERN = re.compile("[\u4e00-\u9fff]")
+# 双字节编码按字符对齐切分出的(首字节, 尾字节)
+_DBCS_PAIR = re.compile(rb"[\x81-\xfe][\x40-\xfe]")
+_DBCS_LOW_TRAILS = bytes(range(0x40, 0x7f))
+_ACTION_NAMES = {"start": "启动", "stop": "停止", "restart": "重启"}
+# 没有进程在运行的容器状态；paused和restarting时Docker的State.Running仍为true，可以被停止
+_STOPPED_STATES = ("created", "exited", "dead")
+
+
+def _as_bool(value):
+    """兼容LLM以字符串形式传入的布尔参数"""
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes", "y", "是")
+    return bool(value)
+
+
+def _jwt_expiry(token):
+    """读取JWT中的exp声明（不校验签名），失败时返回None"""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+
+def detect_encoding(data, sample_size=65536):
+    """基于采样的编码检测，只检查前sample_size字节"""
+    sample = bytes(data[:sample_size])
+
+    # 检查UTF-8 BOM
+    if sample[:3] == b'\xef\xbb\xbf':
+        return 'utf-8-sig'
+
+    # 检查UTF-16 BOM
+    if sample[:2] == b'\xff\xfe':
+        return 'utf-16'
+    if sample[:2] == b'\xfe\xff':
+        return 'utf-16-be'
+
+    if sample.isascii() and b'\x00' not in sample:
+        return 'utf-8'
+
+    # 无BOM的UTF-16：ASCII字符的高位字节为0，集中出现在奇数或偶数位置
+    if len(sample) >= 4:
+        odd_zeros = sample[1::2].count(0)
+        even_zeros = sample[0::2].count(0)
+        half = len(sample) // 2
+        if odd_zeros > half * 0.3 and even_zeros < half * 0.05:
+            return 'utf-16-le'
+        if even_zeros > half * 0.3 and odd_zeros < half * 0.05:
+            return 'utf-16-be'
+
+    # 采样可能截断多字节字符，使用增量解码器且不结束输入
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+
+    # 启发式检测中文编码：统计解码后的中文字符占比
+    # Big5字节序列大多也是合法的GB18030，不能只看能否解码。常用简体字(GB2312区)的尾字节都不低于0xA1，
+    # 而Big5约四成汉字的尾字节落在0x40-0x7E，据此区分
+    trails = b"".join(_DBCS_PAIR.findall(sample))[1::2]
+    low_trails = len(trails) - len(trails.translate(None, _DBCS_LOW_TRAILS))
+    candidates = ('big5', 'gb18030') if low_trails > len(trails) * 0.15 else ('gb18030',)
+    for encoding in candidates:
+        try:
+            decoded = codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+        except UnicodeDecodeError:
+            continue
+        if len(_CJK_PATTERN.findall(decoded)) > len(decoded) * 0.1:  # 中文字符占比超过10%
+            return encoding
+
+    # 默认返回UTF-8
+    return 'utf-8'
+
+
+class DockerLogStream:
+    """增量解析Docker容器日志流
+
+    按块读取响应体，拆分多路复用帧头并区分stdout/stderr，
+    每个流使用独立的增量解码器，保证每个字节只解码一次。
+    容器开启TTY时日志不带帧头，此时全部数据按stdout处理。
+    """
+
+    def __init__(self, content, encoding=None, detect=None, chunk_size=65536, sample_size=65536):
+        self.content = content
+        self.encoding = encoding
+        self.detect = detect
+        self.chunk_size = chunk_size
+        self.sample_size = sample_size
+        self.bytes_read = 0
+
+    async def frames(self):
+        """逐块产出(流名称, 负载字节)
+
+        同一读取块内相邻的同流帧合并后一起产出，单个大帧会被切成多段，内存占用与块大小相当。
+        """
+        multiplexed = None
+        pending = b""
+        stream = "stdout"
+        remaining = 0
+        async for chunk in self.content.iter_chunked(self.chunk_size):
+            self.bytes_read += len(chunk)
+            data = pending + chunk if pending else chunk
+            pending = b""
+
+            if multiplexed is None:
+                if len(data) < _LOG_FRAME_HEADER.size:
+                    pending = data
+                    continue
+                multiplexed = data[0] in _LOG_STREAM_NAMES and data[1:4] == b"\x00\x00\x00"
+
+            if not multiplexed:
+                yield "stdout", data
+                continue
+
+            pos = 0
+            size = len(data)
+            pieces = []
+            while pos < size:
+                if remaining:
+                    end = min(pos + remaining, size)
+                    pieces.append(data[pos:end])
+                    remaining -= end - pos
+                    pos = end
+                    continue
+                if size - pos < _LOG_FRAME_HEADER.size:
+                    pending = data[pos:]
+                    break
+                stream_type, remaining = _LOG_FRAME_HEADER.unpack_from(data, pos)
+                next_stream = _LOG_STREAM_NAMES.get(stream_type, "stdout")
+                if next_stream != stream and pieces:
+                    yield stream, b"".join(pieces)
+                    pieces = []
+                stream = next_stream
+                pos += _LOG_FRAME_HEADER.size
+            if pieces:
+                yield stream, b"".join(pieces)
+
+        # 流结束时残留的不足一个帧头的数据：无帧头格式时原样输出
+        if pending and not multiplexed:
+            yield "stdout", pending
+
+    async def batches(self):
+        """在帧解析之上按批产出(流名称, [文本行])，每批对应一次解码
+
+        编码未知时，从第一段非ASCII负载起跨帧累积样本，达到sample_size或流结束后再检测编码，
+        检测结果用于全部流。此前的纯ASCII负载在各候选编码下解码结果相同，直接输出。
+        """
+        decoders = {}
+        partial = {}
+        pending = []  # 编码确定前暂存的(流名称, 负载)
+        sampled = 0
+
+        def split(stream, text):
+            if stream in partial:
+                text = partial.pop(stream) + text
+            if "\r" in text:
+                text = text.replace("\r\n", "\n")
+            lines = text.split("\n")
+            tail = lines.pop()
+            if tail:
+                partial[stream] = tail
+            return lines
+
+        def decode(stream, payload):
+            decoder = decoders.get(stream)
+            if decoder is None:
+                decoder = decoders[stream] = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+            return split(stream, decoder.decode(payload))
+
+        def detect():
+            sample = b"".join(payload for _, payload in pending)[:self.sample_size]
+            self.encoding = self.detect(sample) if self.detect else "utf-8"
+
+        async for stream, payload in self.frames():
+            if self.encoding is None:
+                if not pending and payload.isascii() and b"\x00" not in payload:
+                    lines = split(stream, payload.decode("ascii"))
+                    if lines:
+                        yield stream, lines
+                    continue
+                pending.append((stream, payload))
+                sampled += len(payload)
+                if sampled < self.sample_size:
+                    continue
+                detect()
+                for pending_stream, pending_payload in pending:
+                    lines = decode(pending_stream, pending_payload)
+                    if lines:
+                        yield pending_stream, lines
+                pending.clear()
+                continue
+
+            lines = decode(stream, payload)
+            if lines:
+                yield stream, lines
+
+        if pending:
+            detect()
+            for pending_stream, pending_payload in pending:
+                lines = decode(pending_stream, pending_payload)
+                if lines:
+                    yield pending_stream, lines
+
+        for stream in dict.fromkeys([*partial, *decoders]):
+            decoder = decoders.get(stream)
+            rest = partial.pop(stream, "") + (decoder.decode(b"", final=True) if decoder else "")
+            if rest:
+                yield stream, [rest.rstrip("\r")]
+
+    async def lines(self):
+        """按行产出(流名称, 文本行)"""
+        async for stream, lines in self.batches():
+            for line in lines:
+                yield stream, line
+
+
+def _split_log_timestamp(line):
+    """拆分timestamps=1时行首的RFC3339时间戳，返回((秒, 纳秒)或None, 正文)"""
+    ts, sep, text = line.partition(" ")
+    if not sep or len(ts) < 20 or ts[10:11] != "T":
+        return None, line
+    try:
+        seconds = calendar.timegm(time.strptime(ts[:19], "%Y-%m-%dT%H:%M:%S"))
+    except ValueError:
+        return None, line
+    fraction = ts[19:].rstrip("Z")
+    nanos = int(fraction[1:10].ljust(9, "0")) if fraction[1:].isdigit() else 0
+    return (seconds, nanos), text
+
+
+_LOG_LEVELS = ("trace", "debug", "info", "warn", "error", "fatal")
+_LOG_LEVEL_KEYWORDS = {
+    "trace": "TRACE",
+    "debug": "DEBUG|DBG",
+    "info": "INFO",
+    "warn": "WARN|WARNING",
+    "error": "ERROR|ERR|EXCEPTION|Traceback",
+    "fatal": "FATAL|CRITICAL|CRIT|PANIC",
+}
+
+
+class LogFilter:
+    """在日志流上逐行过滤，输出命中行及其上下文，达到匹配上限后停止
+
+    只保留context行的前文缓冲，内存占用与日志总量无关。
+    """
+
+    def __init__(self, pattern=None, level=None, context=0, max_matches=50):
+        self.pattern = None
+        if pattern:
+            try:
+                self.pattern = re.compile(pattern, re.IGNORECASE | re.MULTILINE)
+            except re.error:
+                self.pattern = re.compile(re.escape(pattern), re.IGNORECASE)
+        self.level = None
+        if level:
+            level = level.strip().lower()
+            level = {"warning": "warn", "err": "error", "critical": "fatal"}.get(level, level)
+            if level not in _LOG_LEVELS:
+                raise ValueError(f"不支持的日志级别：{level}，可选值为{'、'.join(_LOG_LEVELS)}")
+            keywords = "|".join(_LOG_LEVEL_KEYWORDS[lv] for lv in _LOG_LEVELS[_LOG_LEVELS.index(level):])
+            self.level = re.compile(rf"\b(?:{keywords})\b", re.IGNORECASE)
+        self.context = max(0, context)
+        self.max_matches = max_matches
+        self.matches = 0
+        self.scanned = 0
+        self._before = deque(maxlen=self.context)
+        self._after = 0
+        self._last_emitted = None
+
+    def match(self, line):
+        if self.level and not self.level.search(line):
+            return False
+        return not self.pattern or bool(self.pattern.search(line))
+
+    def feed_batch(self, lines, prefix=""):
+        """批量处理日志行，输出行为prefix加原始行；达到匹配上限后停止，scanned反映实际处理的行数
+
+        整批文本都不含匹配时一次跳过，只保留上下文所需的末尾几行。
+        """
+        if not self._after and self.matches < self.max_matches and not self.match("\n".join(lines)):
+            self.scanned += len(lines)
+            if self.context:
+                self._before.extend(prefix + line for line in lines[-self.context:])
+            return []
+        output = []
+        for line in lines:
+            if self.done:
+                break
+            output.extend(self.feed(line, prefix + line))
+        return output
+
+    @property
+    def done(self):
+        return self.matches >= self.max_matches and not self._after
+
+    def feed(self, line, display=None):
+        """处理一行原始日志，返回需要输出的行；display为输出时使用的文本"""
+        self.scanned += 1
+        display = line if display is None else display
+        if self.matches < self.max_matches and self.match(line):
+            self.matches += 1
+            output = []
+            # 与上一段输出不连续时插入分隔符
+            if self._last_emitted is not None and self._last_emitted < self.scanned - len(self._before) - 1:
+                output.append("--")
+            output.extend(self._before)
+            output.append(display)
+            self._before.clear()
+            self._after = self.context
+            self._last_emitted = self.scanned
+            return output
+        if self._after:
+            self._after -= 1
+            self._last_emitted = self.scanned
+            return [display]
+        if self.context:
+            self._before.append(display)
+        return []
+
+
+def _parse_time_arg(value):
+    """把UNIX时间戳、相对时长(30m/2h/1d)或"YYYY-MM-DD HH:MM:SS"(本地时间)转换为Docker接受的UNIX时间戳"""
+    if value is None or str(value).strip() == "":
+        return None
+    text = str(value).strip()
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    if text[-1:].lower() in units and text[:-1].replace(".", "", 1).isdigit():
+        return str(int(time.time() - float(text[:-1]) * units[text[-1].lower()]))
+    if text.replace(".", "", 1).isdigit():
+        return text
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return str(int(time.mktime(time.strptime(text, fmt))))
+        except ValueError:
+            continue
+    raise ValueError(f"无法识别的时间：{value}")
+
+
+class LogFollower:
+    """容器日志的持续订阅，新行写入有界的环形缓冲区"""
+
+    def __init__(self, maxlen):
+        self.lines = deque(maxlen=maxlen)
+        self.written = 0  # 累计写入的行数
+        self.read = 0  # 已被工具读取到的位置
+        self.task = None
+        self.error = None
+
+    def push(self, line):
+        self.lines.append(line)
+        self.written += 1
+
+    def read_new(self):
+        """返回(上次读取后的新行, 因缓冲区溢出而丢弃的行数)"""
+        pending = self.written - self.read
+        available = min(pending, len(self.lines))
+        self.read = self.written
+        if not available:
+            return [], pending
+        return list(itertools.islice(self.lines, len(self.lines) - available, None)), pending - available
+
+
+_LOG_EXPORT_SUFFIXES = {"gzip": ".log.gz", "zstd": ".log.zst"}
+# 本插件生成的导出文件名：<容器名>_<YYYYmmdd-HHMMSS>[-n].log.gz|.log.zst，清理时只处理这类文件
+_LOG_EXPORT_NAME = re.compile(r"[\w.-]+_\d{8}-\d{6}(?:-\d+)?\.log\.(?:gz|zst)")
+
+
+class CompressedLogWriter:
+    """把日志行分块写入gzip/zstd压缩文件
+
+    内存中只保留待写入的缓冲块和首尾几行摘要，压缩与磁盘写入在线程中执行，不阻塞事件循环。
+    写入过程中使用带.part后缀的临时文件，close成功后才重命名为path，中途失败不会留下不完整的导出。
+    """
+
+    def __init__(self, path, compression="gzip", summary_lines=5, flush_bytes=1048576):
+        self.path = path
+        self._tmp_path = path + ".part"
+        if compression == "zstd":
+            if zstandard is None:
+                raise ValueError("未安装zstandard，无法使用zstd压缩，请改用gzip")
+            self._raw = open(self._tmp_path, "wb")
+            self._file = zstandard.ZstdCompressor(level=3).stream_writer(self._raw)
+        elif compression == "gzip":
+            self._raw = None
+            self._file = gzip.open(self._tmp_path, "wb", compresslevel=6)
+        else:
+            raise ValueError(f"不支持的压缩格式：{compression}，可选值为{'、'.join(_LOG_EXPORT_SUFFIXES)}")
+        self.lines = 0
+        self.raw_bytes = 0
+        self.head = []
+        self.tail = deque(maxlen=summary_lines)
+        self._summary_lines = summary_lines
+        self._flush_bytes = flush_bytes
+        self._buffer = []
+        self._buffered = 0
+
+    async def write_lines(self, lines, prefix=""):
+        if not lines:
+            return
+        if prefix:
+            lines = [prefix + line for line in lines]
+        if len(self.head) < self._summary_lines:
+            self.head.extend(lines[:self._summary_lines - len(self.head)])
+        self.tail.extend(lines[-self._summary_lines:])
+        self.lines += len(lines)
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        self.raw_bytes += len(data)
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self._flush_bytes:
+            await asyncio.to_thread(self._file.write, self._take())
+
+    def _take(self):
+        data = b"".join(self._buffer)
+        self._buffer.clear()
+        self._buffered = 0
+        return data
+
+    def _finish(self, data):
+        self._file.write(data)
+        self._file.close()
+        if self._raw is not None:
+            self._raw.close()
+        os.replace(self._tmp_path, self.path)
+
+    async def close(self):
+        """写出剩余缓冲、关闭文件并重命名为最终路径，返回压缩后的文件大小"""
+        await asyncio.to_thread(self._finish, self._take())
+        return os.path.getsize(self.path)
+
+    def abort(self):
+        """出错时关闭并删除不完整的临时文件"""
+        for f in (self._file, self._raw):
+            try:
+                if f is not None:
+                    f.close()
+            except Exception:
+                pass
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+
+def _format_bytes(size):
+    """将字节数格式化为易读的字符串"""
+    size = float(size or 0)
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}" if unit != "B" else f"{int(size)} B"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class ImagePullProgress:
+    """增量汇总/images/create返回的NDJSON进度事件
+
+    只保存每个层的最新进度，内存占用与层数相关而与事件数量无关。
+    """
+
+    def __init__(self):
+        self.layers = {}  # 层ID -> [状态, 已下载字节, 已解压字节, 总字节]
+        self.status = ""
+        self.error = None
+
+    def feed(self, event):
+        """处理一条进度事件，遇到error事件时记录错误信息"""
+        if "error" in event:
+            self.error = event.get("errorDetail", {}).get("message") or event["error"]
+            return
+        status = event.get("status", "")
+        layer_id = event.get("id")
+        # 没有层ID的事件或"Pulling from ..."（ID为标签名）是整体状态
+        if not layer_id or status.startswith("Pulling from"):
+            self.status = status
+            return
+
+        layer = self.layers.setdefault(layer_id, ["", 0, 0, 0])
+        layer[0] = status
+        detail = event.get("progressDetail") or {}
+        if status == "Downloading":
+            layer[1] = detail.get("current", layer[1])
+            layer[3] = detail.get("total", layer[3])
+        elif status == "Extracting":
+            layer[2] = detail.get("current", layer[2])
+            layer[3] = detail.get("total", layer[3])
+        elif status in ("Download complete", "Pull complete"):
+            layer[1] = max(layer[1], layer[3])
+            if status == "Pull complete":
+                layer[2] = max(layer[2], layer[3])
+
+    @property
+    def downloaded(self):
+        return sum(layer[1] for layer in self.layers.values())
+
+    @property
+    def extracted(self):
+        return sum(layer[2] for layer in self.layers.values())
+
+    def summary(self):
+        done = sum(1 for layer in self.layers.values() if layer[0] in ("Pull complete", "Already exists"))
+        return (
+            f"{done}/{len(self.layers)} 个层完成，"
+            f"已下载 {_format_bytes(self.downloaded)}，已解压 {_format_bytes(self.extracted)}"
+        )
+
+
+_STACK_TYPES = {1: "swarm", 2: "compose", 3: "kubernetes"}
+_STACK_STATUS = {1: "运行中", 2: "已停止"}
+_COMPOSE_IMAGE = re.compile(r"^\s*image:\s*[\"']?([^\s\"'#]+)", re.MULTILINE)
+_ENV_REFERENCE = re.compile(r"\$\{(\w+)(?::?-([^}]*))?\}|\$(\w+)")
+_ENV_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def compose_images(content, env=None):
+    """从compose文件中提取去重后的镜像列表，按env替换${VAR}、${VAR:-默认值}和$VAR引用
+
+    返回(镜像列表, 含未解析变量的镜像列表)。
+    """
+    env = env or {}
+
+    def substitute(m):
+        name = m.group(1) or m.group(3)
+        if env.get(name):
+            return env[name]
+        if m.group(2) is not None:
+            return m.group(2)
+        return env.get(name, m.group(0))
+
+    images, unresolved = [], []
+    for ref in _COMPOSE_IMAGE.findall(content):
+        image = _ENV_REFERENCE.sub(substitute, ref)
+        target = unresolved if "$" in image else images
+        if image not in target:
+            target.append(image)
+    return images, unresolved
+
+
+def parse_env_assignments(items):
+    """解析KEY=VALUE形式的环境变量列表，也接受按换行或分号分隔的字符串"""
+    if isinstance(items, str):
+        items = re.split(r"[\n;]", items)
+    result = {}
+    for item in items or []:
+        item = str(item).strip()
+        if not item:
+            continue
+        key, sep, value = item.partition("=")
+        key = key.strip()
+        if not sep or not _ENV_NAME.match(key):
+            raise ValueError(f"无效的环境变量：{item}，格式应为KEY=VALUE")
+        result[key] = value
+    return result
+
+
+def _image_digest(image):
+    """镜像的内容标识：优先取仓库摘要，没有推送过的本地镜像退回镜像ID"""
+    for ref in image.get("RepoDigests") or []:
+        _, sep, digest = ref.partition("@")
+        if sep:
+            return digest
+    return image.get("Id", "")
+
+
+def _image_tags(image):
+    return [tag for tag in image.get("RepoTags") or [] if tag != "<none>:<none>"]
+
+
+def _image_label(image):
+    tags = _image_tags(image)
+    short_id = image.get("Id", "").split(":")[-1][:12]
+    return f"{tags[0] if tags else '<none>'} ({short_id})"
+
+
+def _image_reclaimable(image):
+    """删除镜像能释放的空间，与其他镜像共享的层不计入
+
+    SharedSize为-1（未计算）时无法知道独占部分有多大，按0计，避免高估可回收空间。
+    """
+    shared = image.get("SharedSize")
+    if shared is None or shared < 0:
+        return 0
+    return max((image.get("Size") or 0) - shared, 0)
+
+
+class ImageInventory:
+    """跨节点的镜像清单与磁盘占用汇总，镜像按内容摘要建立索引
+
+    同一摘要出现在多个节点上视为重复存储；没有标签的为悬空镜像，没有容器引用的为未使用镜像，
+    未使用镜像独占的大小（Size - SharedSize）计为可回收空间。
+    """
+
+    def __init__(self):
+        self.by_digest = {}  # 摘要 -> {节点: 镜像条目}
+        self.nodes = {}  # 节点 -> 磁盘占用汇总
+
+    def add(self, node, images, df):
+        """加入一个节点的/images/json和/system/df结果"""
+        # images/json默认不计算引用数和共享大小(Containers、SharedSize为-1)，从df中补齐
+        usage = {img.get("Id"): img for img in df.get("Images") or []}
+        summary = {
+            "images": 0,
+            "image_bytes": df.get("LayersSize") or 0,
+            "container_bytes": sum(c.get("SizeRw") or 0 for c in df.get("Containers") or []),
+            "volume_bytes": sum(max((v.get("UsageData") or {}).get("Size", 0), 0) for v in df.get("Volumes") or []),
+            "cache_bytes": sum(b.get("Size") or 0 for b in df.get("BuildCache") or [] if not b.get("InUse")),
+            "dangling": [],
+            "unused": [],
+            "reclaimable": 0,
+        }
+        for img in images:
+            img = dict(img)
+            for key in ("Containers", "SharedSize"):
+                if img.get(key) is None or img[key] < 0:
+                    img[key] = (usage.get(img.get("Id")) or {}).get(key, -1)
+            containers = img["Containers"]
+            summary["images"] += 1
+            self.by_digest.setdefault(_image_digest(img), {})[node] = img
+            # 引用数未知时按使用中处理，不计入可回收空间
+            if containers != 0:
+                continue
+            summary["dangling" if not _image_tags(img) else "unused"].append(img)
+            summary["reclaimable"] += _image_reclaimable(img)
+        if not summary["image_bytes"]:
+            summary["image_bytes"] = sum(img.get("Size") or 0 for img in images)
+        self.nodes[node] = summary
+
+    def duplicates(self):
+        """返回[(摘要, {节点: 镜像条目}, 重复占用字节数)]，按重复占用从大到小排序"""
+        result = []
+        for digest, nodes in self.by_digest.items():
+            if len(nodes) > 1:
+                size = max(img.get("Size") or 0 for img in nodes.values())
+                result.append((digest, nodes, size * (len(nodes) - 1)))
+        return sorted(result, key=lambda item: item[2], reverse=True)
+
+    def candidates(self, node, dangling_only=True):
+        """返回节点上可被清理的镜像"""
+        summary = self.nodes.get(node) or {}
+        return summary.get("dangling", []) + ([] if dangling_only else summary.get("unused", []))
+
+
+def parse_container_filters(filters):
+    """将"status=running,name=web"形式的字符串或字典转换为Docker API的filters格式"""
+    if not filters:
+        return None
+    if isinstance(filters, str):
+        text = filters.strip()
+        if text.startswith("{"):
+            filters = json.loads(text)
+        else:
+            parsed = {}
+            for item in text.replace(";", ",").split(","):
+                key, sep, value = item.strip().partition("=")
+                if key and sep:
+                    parsed.setdefault(key.strip(), []).append(value.strip())
+            return parsed or None
+    return {k: v if isinstance(v, list) else [v] for k, v in filters.items()}
+
+
+def _container_name(c):
+    names = c.get("Names") or [""]
+    return names[0].lstrip("/")
+
+
+def format_containers(containers, compact=False, group_by=None):
+    """将容器列表格式化为文本行，compact为紧凑表格，group_by可为state或image"""
+    if compact:
+        def fmt(c):
+            return "|".join((
+                _container_name(c), c.get("Id", "")[:12], c.get("State", "?"),
+                c.get("Image", "?"), c.get("Status", "?")
+            ))
+    else:
+        def fmt(c):
+            return (
+                f"容器 {_container_name(c)} (ID: {c.get('Id', '')[:12]}): "
+                f"状态 {c.get('State', '未知')}, "
+                f"镜像 {c.get('Image', '未知')}, "
+                f"详情: {c.get('Status', '未知')}"
+            )
+
+    lines = ["名称|ID|状态|镜像|详情"] if compact else []
+    if group_by in ("state", "image"):
+        key = "State" if group_by == "state" else "Image"
+        groups = {}
+        for c in containers:
+            groups.setdefault(c.get(key) or "未知", []).append(c)
+        for name, members in sorted(groups.items(), key=lambda item: -len(item[1])):
+            lines.append(f"[{name}] {len(members)} 个")
+            lines.extend(fmt(c) for c in members)
+    else:
+        lines.extend(fmt(c) for c in containers)
+    return lines
+
+
+def truncate_lines(lines, max_chars):
+    """按字符预算拼接文本行，超出部分用一行汇总代替，汇总行也计入预算"""
+    if not max_chars or sum(len(line) + 1 for line in lines) <= max_chars:
+        return "\n".join(lines)
+    budget = max_chars - 64  # 为汇总行预留空间
+    used = 0
+    kept = 0
+    for line in lines:
+        used += len(line) + 1
+        if used > budget:
+            break
+        kept += 1
+    return "\n".join(lines[:kept] + [f"……另有 {len(lines) - kept} 行未显示，请使用filters或group_by缩小范围"])
+
+
+class ContainerIndex:
+    """单个节点的容器名称/ID/标签索引，由容器列表构建并增量更新
+
+    用于在本地把用户输入的名称、ID前缀解析为完整容器ID，避免把模糊输入直接交给Docker。
+    """
+
+    def __init__(self):
+        self.by_id = {}  # 完整ID -> 容器列表中的条目
+        self.by_name = {}  # 名称 -> 完整ID
+        self._names = {}  # 完整ID -> 建立索引时的名称元组
+        self._sorted_names = None
+        self._sorted_ids = None
+        self._source = None
+
+    def update(self, containers, complete=True):
+        """用容器列表更新索引；complete为False时表示列表经过过滤，只增改不删除"""
+        if containers is self._source:
+            return
+        seen = set()
+        for c in containers:
+            cid = c.get("Id")
+            if not cid:
+                continue
+            seen.add(cid)
+            # 与索引自己保存的名称比较：条目可能被原地修改，不能和by_id中的旧对象比较
+            names = tuple(name.lstrip("/") for name in c.get("Names") or [])
+            self.by_id[cid] = c
+            old_names = self._names.get(cid)
+            if old_names == names:
+                continue
+            if old_names is not None:
+                self._drop_names(cid)
+            self._names[cid] = names
+            for name in names:
+                self.by_name[name] = cid
+            self._sorted_names = self._sorted_ids = None
+        if complete:
+            for cid in [cid for cid in self.by_id if cid not in seen]:
+                del self.by_id[cid]
+                self._drop_names(cid)
+                self._sorted_names = self._sorted_ids = None
+            self._source = containers
+
+    def _drop_names(self, cid):
+        for name in self._names.pop(cid, ()):
+            if self.by_name.get(name) == cid:
+                del self.by_name[name]
+
+    @staticmethod
+    def _prefixed(keys, prefix):
+        start = bisect.bisect_left(keys, prefix)
+        result = []
+        for key in keys[start:]:
+            if not key.startswith(prefix):
+                break
+            result.append(key)
+        return result
+
+    def resolve(self, ref, strict=False):
+        """解析容器引用，返回(匹配的容器条目列表, 候选名称)
+
+        依次尝试完整ID、完整名称、ID前缀、名称前缀；都未命中时给出相近名称作为候选。
+        strict为True时（用于会改变容器状态的操作）只接受完整名称、完整ID或至少12位的ID前缀，
+        其余前缀命中只作为候选返回，避免"db"误中"db-backup"。
+        """
+        ref = ref.strip().lstrip("/")
+        if ref in self.by_id:
+            return [self.by_id[ref]], []
+        if ref in self.by_name:
+            return [self.by_id[self.by_name[ref]]], []
+
+        if self._sorted_ids is None:
+            self._sorted_ids = sorted(self.by_id)
+            self._sorted_names = sorted(self.by_name)
+        ids = self._prefixed(self._sorted_ids, ref)
+        if ids and (not strict or len(ref) >= 12):
+            return [self.by_id[cid] for cid in ids], []
+        names = self._prefixed(self._sorted_names, ref)
+        if strict and (ids or names):
+            candidates = names + [_container_name(self.by_id[cid]) or cid[:12] for cid in ids]
+            return [], list(dict.fromkeys(candidates))[:5]
+        if names:
+            return [self.by_id[cid] for cid in dict.fromkeys(self.by_name[n] for n in names)], []
+        return [], difflib.get_close_matches(ref, self._sorted_names, n=3, cutoff=0.6)
+
+    def with_label(self, key, value=None):
+        """返回带有指定标签（及取值）的容器条目"""
+        return [
+            c for c in self.by_id.values()
+            if key in (c.get("Labels") or {}) and (value is None or c["Labels"][key] == value)
+        ]
+
+
+class ContainerStats:
+    """单个容器一次stats采样的精简记录"""
+
+    __slots__ = (
+        "id", "name", "time", "cpu_total", "system_cpu", "online_cpus", "cpu_percent", "cpu_window",
+        "mem_usage", "mem_limit", "net_rx", "net_tx", "blk_read", "blk_write"
+    )
+
+    def __init__(self, container_id, name, raw):
+        self.id = container_id
+        self.name = name
+        self.time = time.monotonic()
+
+        cpu = raw.get("cpu_stats") or {}
+        precpu = raw.get("precpu_stats") or {}
+        self.cpu_total = (cpu.get("cpu_usage") or {}).get("total_usage", 0)
+        self.system_cpu = cpu.get("system_cpu_usage", 0)
+        self.online_cpus = cpu.get("online_cpus") or len((cpu.get("cpu_usage") or {}).get("percpu_usage") or []) or 1
+        # one-shot采样不含上一次的CPU计数，此时CPU占用要等与下一次采样比较才能得出
+        self.cpu_percent = None
+        self.cpu_window = None  # 计算CPU占用的采样间隔(秒)，None表示由Docker的precpu_stats给出
+        if precpu.get("system_cpu_usage"):
+            self.cpu_percent = self._cpu_percent(
+                (precpu.get("cpu_usage") or {}).get("total_usage", 0), precpu["system_cpu_usage"]
+            )
+
+        memory = raw.get("memory_stats") or {}
+        detail = memory.get("stats") or {}
+        # 与docker stats一致，扣除页缓存（cgroup v1为cache，v2为inactive_file）
+        self.mem_usage = memory.get("usage", 0) - detail.get("inactive_file", detail.get("cache", 0))
+        self.mem_limit = memory.get("limit", 0)
+
+        networks = (raw.get("networks") or {}).values()
+        self.net_rx = sum(n.get("rx_bytes", 0) for n in networks)
+        self.net_tx = sum(n.get("tx_bytes", 0) for n in networks)
+
+        self.blk_read = self.blk_write = 0
+        for entry in (raw.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []:
+            op = entry.get("op", "").lower()
+            if op == "read":
+                self.blk_read += entry.get("value", 0)
+            elif op == "write":
+                self.blk_write += entry.get("value", 0)
+
+    def _cpu_percent(self, cpu_total, system_cpu):
+        cpu_delta = self.cpu_total - cpu_total
+        system_delta = self.system_cpu - system_cpu
+        return cpu_delta / system_delta * self.online_cpus * 100 if cpu_delta > 0 and system_delta > 0 else 0.0
+
+    def apply_previous(self, previous):
+        """没有precpu_stats时用本插件上一次的采样计算CPU占用"""
+        if self.cpu_percent is None and previous is not None and previous.system_cpu:
+            self.cpu_percent = self._cpu_percent(previous.cpu_total, previous.system_cpu)
+            self.cpu_window = self.time - previous.time
+
+    def format(self, previous=None):
+        mem_percent = self.mem_usage / self.mem_limit * 100 if self.mem_limit else 0
+        if self.cpu_percent is None:
+            cpu = "待下次采样"
+        elif self.cpu_window is not None:
+            cpu = f"{self.cpu_percent:.1f}%（近 {self.cpu_window:.1f} 秒）"
+        else:
+            cpu = f"{self.cpu_percent:.1f}%"
+        text = (
+            f"{self.name} ({self.id[:12]}): CPU {cpu}, "
+            f"内存 {_format_bytes(self.mem_usage)} / {_format_bytes(self.mem_limit)} ({mem_percent:.1f}%), "
+            f"网络 收 {_format_bytes(self.net_rx)} 发 {_format_bytes(self.net_tx)}, "
+            f"磁盘 读 {_format_bytes(self.blk_read)} 写 {_format_bytes(self.blk_write)}"
+        )
+        # 与上一次采样比较得出各项速率
+        if previous is not None and self.time > previous.time:
+            elapsed = self.time - previous.time
+            rates = [
+                (self.net_rx - previous.net_rx) / elapsed, (self.net_tx - previous.net_tx) / elapsed,
+                (self.blk_read - previous.blk_read) / elapsed, (self.blk_write - previous.blk_write) / elapsed,
+            ]
+            if all(rate >= 0 for rate in rates):
+                text += (
+                    f"；近 {int(elapsed)} 秒速率: 网络 收 {_format_bytes(rates[0])}/s 发 {_format_bytes(rates[1])}/s, "
+                    f"磁盘 读 {_format_bytes(rates[2])}/s 写 {_format_bytes(rates[3])}/s"
+                )
+        return text
+
+
+_EVENT_STATES = {
+    "create": "created",
+    "start": "running",
+    "restart": "running",
+    "unpause": "running",
+    "pause": "paused",
+    "die": "exited",
+    "stop": "exited",
+}
+
+
+class EndpointState:
+    """单个节点的容器状态模型，由全量列表初始化并随Docker事件增量更新
+
+    条目格式与/containers/json返回的一致，可直接交给列表格式化和容器索引使用。
+    """
+
+    def __init__(self):
+        self.containers = {}  # 容器ID -> 容器条目
+        self.synced_at = 0  # 最近一次全量同步的时间
+        self.updated_at = 0  # 最近一次同步或收到事件的时间
+        self.connected = False  # 事件流是否处于连接状态
+        self._snapshot = None
+
+    def sync(self, containers):
+        self.containers = {c["Id"]: dict(c) for c in containers if c.get("Id")}
+        self.synced_at = self.updated_at = time.monotonic()
+        self._snapshot = None
+
+    def apply(self, event):
+        """应用一条容器事件，返回状态是否发生变化"""
+        if event.get("Type", "container") != "container":
+            return False
+        action = (event.get("Action") or event.get("status") or "").split(":")[0]
+        actor = event.get("Actor") or {}
+        container_id = actor.get("ID") or event.get("id")
+        attributes = actor.get("Attributes") or {}
+        if not container_id:
+            return False
+        self.updated_at = time.monotonic()
+
+        if action == "destroy":
+            changed = self.containers.pop(container_id, None) is not None
+        elif action == "rename":
+            # 替换为新的条目而不是原地修改，已交给容器索引和调用方的快照不受影响
+            c = self.containers.get(container_id)
+            changed = c is not None
+            if changed:
+                self.containers[container_id] = dict(c, Names=["/" + attributes.get("name", "").lstrip("/")])
+        elif action in _EVENT_STATES:
+            c = self.containers.get(container_id)
+            if c is not None:
+                c = self.containers[container_id] = dict(c)
+            else:
+                c = self.containers[container_id] = {
+                    "Id": container_id,
+                    "Names": ["/" + attributes.get("name", container_id[:12])],
+                    "Image": attributes.get("image") or event.get("from", ""),
+                    "Labels": {
+                        k: v for k, v in attributes.items()
+                        if k not in ("name", "image", "exitCode", "signal")
+                    },
+                }
+            c["State"] = _EVENT_STATES[action]
+            c["Status"] = f"{c['State']}（{time.strftime('%H:%M:%S')} 由事件更新）"
+            changed = True
+        else:
+            return False
+
+        if changed:
+            self._snapshot = None
+        return changed
+
+    def snapshot(self):
+        """返回容器列表，状态未变化时复用同一个列表对象"""
+        if self._snapshot is None:
+            self._snapshot = list(self.containers.values())
+        return self._snapshot
+
+    def is_fresh(self, max_age, max_sync_age):
+        """最近一次全量同步在max_sync_age秒以内，且事件流在线或最近一次同步/事件在max_age秒以内
+
+        Docker事件流没有心跳，半开的连接看起来仍然在线，因此同步时间必须单独设上限。
+        """
+        if not self.synced_at:
+            return False
+        now = time.monotonic()
+        if now - self.synced_at >= max_sync_age:
+            return False
+        return self.connected or now - self.updated_at < max_age
+
+
+class ResponseCache:
+    """只读API响应的短时缓存
+
+    以(节点ID, 路径)为键，超过ttl秒的条目失效，超出容量时按LRU淘汰。
+    相同键的并发请求共享同一次进行中的调用（single-flight）。
+    """
+
+    def __init__(self, ttl, max_entries=256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (过期时间, 值)
+        self._inflight = {}  # key -> 进行中的Future
+        self.hits = 0  # 命中缓存或合并到进行中的请求
+        self.misses = 0
+
+    async def get(self, key, loader):
+        """返回缓存值，未命中时调用loader()加载"""
+        if self.ttl <= 0:
+            return await loader()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            future = asyncio.ensure_future(loader())
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._finish(key, f))
+        # shield避免某个调用方被取消时连带取消其他调用方共享的请求
+        return await asyncio.shield(future)
+
+    def _finish(self, key, future):
+        # 加载期间被invalidate的结果不再写入缓存
+        if self._inflight.get(key) is not future:
+            return
+        del self._inflight[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, future.result())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, endpoint=None, prefix=""):
+        """使指定节点下路径以prefix开头的条目失效，endpoint为None时清空全部"""
+        for store in (self._entries, self._inflight):
+            for key in list(store):
+                if endpoint is None or (key[0] == str(endpoint) and key[1].startswith(prefix)):
+                    del store[key]
+
+
+class CircuitBreaker:
+    """单个节点的熔断器
+
+    连续失败达到threshold次后打开，cooldown秒内的请求直接失败；冷却结束后放行一个探测请求，
+    成功则恢复，失败则重新进入冷却。threshold为0时不熔断。
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._probe_at = None
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def check(self, name):
+        """熔断打开时抛出异常；冷却结束后只放行一个探测请求"""
+        if self.opened_at is None:
+            return
+        now = time.monotonic()
+        remaining = self.opened_at + self.cooldown - now
+        # 探测请求迟迟没有结果（例如调用方被取消）时，下一个冷却期后再放行新的探测
+        if remaining <= 0 and (self._probe_at is None or now - self._probe_at >= self.cooldown):
+            self._probe_at = now
+            return
+        raise Exception(
+            f"{name}暂时不可用（连续失败 {self.failures} 次，{max(1, math.ceil(remaining))} 秒内不再尝试）"
+        )
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_at = None
+        if self.threshold and self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+# 上游URL归一化为路由模板，避免按容器ID、节点ID把指标拆得过细
+_ROUTE_PATTERNS = (
+    (re.compile(r"^\w+://[^/]+|\?.*$"), ""),
+    (re.compile(r"/(endpoints|stacks)/\d+"), r"/\1/{id}"),
+    (re.compile(r"/containers/[^/]+/"), "/containers/{id}/"),
+    (re.compile(r"/images/(?!json$|create$).+/(\w+)$"), r"/images/{name}/\1"),
+)
+
+
+def _route_of(url):
+    """把请求URL转换为路由模板"""
+    route = str(url)
+    for pattern, repl in _ROUTE_PATTERNS:
+        route = pattern.sub(repl, route)
+    return route
+
+
+def _timed_tool(func):
+    """记录LLM工具的调用次数与耗时，保留原函数的名称和文档供AstrBot解析参数"""
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(self, *args, **kwargs)
+        finally:
+            self._metrics.observe_tool(func.__name__, time.perf_counter() - start)
+    return wrapper
+
+
+class LatencyHistogram:
+    """固定分桶的延迟直方图（秒），分位数按桶上界估算"""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)  # 最后一个桶为+Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(self.BUCKETS[i], self.max) if i < len(self.BUCKETS) else self.max
+        return self.max
+
+    def format(self):
+        """次数 平均/p50/p95/最大(毫秒)"""
+        if not self.count:
+            return "0"
+        return (
+            f"{self.count} 次 {self.total / self.count * 1000:.1f}/{self.quantile(0.5) * 1000:.0f}/"
+            f"{self.quantile(0.95) * 1000:.0f}/{self.max * 1000:.0f} ms"
+        )
+
+
+class RouteMetrics:
+    """单个上游路由的统计：响应头耗时、状态码分布、响应字节数和连接错误"""
+
+    __slots__ = ("latency", "statuses", "bytes", "errors")
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.statuses = {}
+        self.bytes = 0
+        self.errors = 0
+
+
+class PluginMetrics:
+    """插件运行指标：LLM工具耗时、上游各路由的请求情况以及Token刷新次数
+
+    工具耗时减去其间上游请求的耗时即为插件自身的开销，可据此区分是Portainer慢还是插件慢。
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.tools = {}  # 工具名 -> LatencyHistogram
+        self.routes = {}  # (实例名称, 方法, 路由模板) -> RouteMetrics
+        self.token_refreshes = 0
+        self.retries = 0
+        self.hedged = 0
+        self.rejected = 0  # 熔断期间直接拒绝的请求
+
+    def observe_tool(self, name, seconds):
+        histogram = self.tools.get(name)
+        if histogram is None:
+            histogram = self.tools[name] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def route(self, instance, method, url):
+        key = (instance, method.upper(), _route_of(url))
+        metrics = self.routes.get(key)
+        if metrics is None:
+            metrics = self.routes[key] = RouteMetrics()
+        return metrics
+
+    def format(self, instances):
+        """生成面向聊天窗口的文本摘要，instances为各PortainerInstance"""
+        uptime = int(time.time() - self.started_at)
+        hits = sum(inst.cache.hits for inst in instances)
+        lookups = hits + sum(inst.cache.misses for inst in instances)
+        hit_rate = f"{hits / lookups:.0%}" if lookups else "-"
+        lines = [
+            f"运行 {uptime // 3600}小时{uptime % 3600 // 60}分，Token刷新 {self.token_refreshes} 次，"
+            f"响应缓存命中 {hits}/{lookups} ({hit_rate})",
+            f"重试 {self.retries} 次，对冲请求 {self.hedged} 次，熔断拒绝 {self.rejected} 次",
+            "工具耗时（次数 平均/p50/p95/最大）：",
+        ]
+        for name, histogram in sorted(self.tools.items(), key=lambda kv: -kv[1].total):
+            lines.append(f"  {name}: {histogram.format()}")
+        if not self.tools:
+            lines.append("  暂无调用")
+        lines.append("上游请求（响应头耗时，状态码，响应流量）：")
+        multiple = len(instances) > 1
+        for (instance, method, route), metrics in sorted(self.routes.items(), key=lambda kv: -kv[1].latency.total):
+            prefix = f"[{instance}] " if multiple else ""
+            statuses = " ".join(f"{status}×{n}" for status, n in sorted(metrics.statuses.items()))
+            if metrics.errors:
+                statuses += f" 连接错误×{metrics.errors}"
+            lines.append(
+                f"  {prefix}{method} {route}: {metrics.latency.format()}，{statuses}，{_format_bytes(metrics.bytes)}"
+            )
+        if not self.routes:
+            lines.append("  暂无请求")
+        return "\n".join(lines)
+
+    def prometheus(self, instances):
+        """导出Prometheus文本格式"""
+        lines = []
+
+        def histogram(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, h in series:
+                cumulative = 0
+                for bound, n in zip(LatencyHistogram.BUCKETS + ("+Inf",), h.counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {h.total:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {h.count}")
+
+        def counter(name, help_text, series):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series:
+                lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+
+        routes = sorted(self.routes.items())
+        route_labels = [
+            (f'portainer="{instance}",method="{method}",route="{route}"', m) for (instance, method, route), m in routes
+        ]
+        histogram(
+            "portainer_plugin_tool_duration_seconds", "LLM tool call duration.",
+            [(f'tool="{name}"', h) for name, h in sorted(self.tools.items())],
+        )
+        histogram(
+            "portainer_plugin_upstream_duration_seconds", "Time until Portainer response headers.",
+            [(labels, m.latency) for labels, m in route_labels],
+        )
+        counter(
+            "portainer_plugin_upstream_requests_total", "Upstream responses by status code.",
+            [(f'{labels},status="{status}"', n) for labels, m in route_labels for status, n in sorted(m.statuses.items())],
+        )
+        counter(
+            "portainer_plugin_upstream_errors_total", "Upstream requests that failed without a response.",
+            [(labels, m.errors) for labels, m in route_labels],
+        )
+        counter(
+            "portainer_plugin_upstream_response_bytes_total", "Response body bytes received.",
+            [(labels, m.bytes) for labels, m in route_labels],
+        )
+        counter(
+            "portainer_plugin_cache_hits_total", "Response cache hits.",
+            [(f'portainer="{inst.name}"', inst.cache.hits) for inst in instances],
+        )
+        counter(
+            "portainer_plugin_cache_misses_total", "Response cache misses.",
+            [(f'portainer="{inst.name}"', inst.cache.misses) for inst in instances],
+        )
+        counter("portainer_plugin_token_refreshes_total", "Portainer logins.", [("", self.token_refreshes)])
+        counter("portainer_plugin_retries_total", "Upstream request retries.", [("", self.retries)])
+        counter("portainer_plugin_hedged_requests_total", "Hedged requests sent for slow reads.", [("", self.hedged)])
+        counter("portainer_plugin_circuit_rejections_total", "Requests rejected by an open circuit.", [("", self.rejected)])
+        return "\n".join(lines) + "\n"
+
+
+class PortainerInstance:
+    """单个Portainer实例的连接与状态
+
+    每个实例拥有独立的连接池、Token生命周期、默认节点、响应缓存、节点熔断器、容器索引和后台状态跟踪，
+    多个实例之间互不影响。
+
+    Args:
+        name: 实例名称，用于路由和指标
+        conn: 该实例的连接配置(url/username/password/verify_ssl)
+        settings: 所有实例共用的插件配置
+        metrics: 插件的PluginMetrics
+        timeout: 会话默认超时
+        state_dir: 持久化缓存目录，为None时不持久化
+    """
+
+    def __init__(self, name, conn, settings, metrics, timeout, state_dir=None):
+        self.name = name
+        self.url = conn.get("url", "")
+        self.username = conn.get("username", "")
+        self.password = conn.get("password", "")
+        self.verify_ssl = conn.get("verify_ssl", True)
+        self.metrics = metrics
         self.session = aiohttp.ClientSession(
             trust_env=True,
+            connector=aiohttp.TCPConnector(
+                limit=settings.get("connection_limit", 100),
+                limit_per_host=settings.get("connection_limit_per_host", 20),
+                keepalive_timeout=settings.get("keepalive_timeout", 30),
+                ttl_dns_cache=settings.get("dns_cache_ttl", 300)
+            ),
+            timeout=timeout,
             headers={
-                'Referer': portainer_config.get("url", ""),
-                'Origin': portainer_config.get("url", "")
+                'Referer': self.url,
+                'Origin': self.url
             }
         )
-        # Portainer配置初始化
-        portainer_config = config.get("portainer", {})
-        self.portainer_url = portainer_config.get("url", "")
-        self.username = portainer_config.get("username", "")
-        self.password = portainer_config.get("password", "")
-        self.verify_ssl = portainer_config.get("verify_ssl", True)
-        self.token_cache_ttl = portainer_config.get("token_cache_ttl", 3600)
+        self.token_cache_ttl = settings.get("token_cache_ttl", 3600)
+        self.cache = ResponseCache(
+            settings.get("cache_ttl", 5),
+            settings.get("cache_max_entries", 256)
+        )
+        # 容错：GET请求的退避重试、按节点熔断、只读请求的可选对冲
+        self.retry_attempts = settings.get("retry_attempts", 2)
+        self.retry_base_delay = settings.get("retry_base_delay", 0.2)
+        self.retry_max_delay = settings.get("retry_max_delay", 2)
+        self.circuit_failure_threshold = settings.get("circuit_failure_threshold", 3)
+        self.circuit_cooldown = settings.get("circuit_cooldown", 30)
+        self.hedge_delay = settings.get("hedge_delay", 0)
+        self.breakers = {}  # 节点ID（Portainer自身为None）-> CircuitBreaker
         self._token = None
         self._token_time = 0
+        self._token_expires_at = 0
+        self._token_refresh_at = 0
+        self._token_lock = asyncio.Lock()
+        self._refresh_task = None
+        self._auth_headers = {}
         self._endpoint_id = None
-    
+        self.indexes = {}  # 节点ID -> ContainerIndex
+
+        # 持久化缓存：重启后沿用未过期的Token和上次的节点列表，由实际请求惰性验证
+        self.state_path = None
+        self._endpoints = None  # 最近一次获取的节点列表
+        self._endpoints_digest = None  # 节点列表内容摘要，变化时才重写磁盘文件
+        self._stored_endpoints = None  # 从磁盘读取、尚未重新验证的节点列表
+        self._revalidate_task = None
+        if state_dir:
+            filename = re.sub(r"[^\w.-]", "_", name)
+            self.state_path = os.path.join(state_dir, f"instance_{filename}.json")
+            self._load_state()
+
+        # 可选的后台状态跟踪：订阅各节点的Docker事件，在内存中维护容器状态
+        self.fleet_state_max_age = settings.get("fleet_state_max_age", 30)
+        self.fleet_resync_interval = settings.get("fleet_resync_interval", 300)
+        # 重新同步本身需要时间，给全量同步的有效期留出fleet_state_max_age的余量
+        self._fleet_sync_max_age = self.fleet_resync_interval + self.fleet_state_max_age
+        self.fleet = {}  # 节点ID -> EndpointState
+        self.fleet_tasks = {}  # 节点ID -> 事件订阅任务
+        self.fleet_task = None
+        if settings.get("fleet_watch", False):
+            self.fleet_task = asyncio.create_task(self.watch_fleet())
+
+    async def close(self):
+        for task in (self._refresh_task, self._revalidate_task):
+            if task and not task.done():
+                task.cancel()
+        if self.fleet_task:
+            self.fleet_task.cancel()
+        for task in self.fleet_tasks.values():
+            task.cancel()
+        await self.session.close()
+
+    def _load_state(self):
+        """读取持久化状态，只采用与当前url和用户名一致的部分，不发起任何请求
+
+        未过期的Token直接沿用，若已被服务端吊销，第一次请求收到401后会自动重新登录。
+        """
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if state.get("url") != self.url or state.get("username") != self.username:
+            return
+
+        now = time.time()
+        expires_at = state.get("expires_at", 0)
+        if state.get("token") and state.get("headers") and expires_at - now > 60:
+            token_time = state.get("token_time", now)
+            self._token = state["token"]
+            self._auth_headers = state["headers"]
+            self._token_time = token_time
+            self._token_expires_at = expires_at
+            self._token_refresh_at = expires_at - min(60, (expires_at - token_time) * 0.1)
+
+        endpoints = state.get("endpoints")
+        if isinstance(endpoints, list) and endpoints:
+            self._endpoints = self._stored_endpoints = endpoints
+            self._endpoints_digest = state.get("endpoints_digest")
+            self._endpoint_id = state.get("endpoint_id") or endpoints[0]["Id"]
+
+    def _save_state(self):
+        """把Token和节点列表写入持久化文件，先写临时文件再替换，文件仅属主可读"""
+        if not self.state_path:
+            return
+        state = {
+            "url": self.url,
+            "username": self.username,
+            "token": self._token,
+            "headers": self._auth_headers,
+            "token_time": self._token_time,
+            "expires_at": self._token_expires_at,
+            "endpoints": self._endpoints,
+            "endpoints_digest": self._endpoints_digest,
+            "endpoint_id": self._endpoint_id,
+        }
+        tmp_path = self.state_path + ".tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"写入Portainer持久化缓存失败：{e}")
+
+    async def _get_csrf_token(self):
+        """从/settings端点获取CSRF令牌"""
+        url = f"{self.url}/api/settings"
+        async with self.send("GET", url) as resp:
+            return resp.headers.get('X-Csrf-Token', '')
+
+    async def _login(self):
+        """登录Portainer获取JWT Token和CSRF Token，返回(token, 认证请求头)
+
+        登录过程不修改session的公共headers，避免影响同时进行中的其他请求。
+        """
+        url = f"{self.url}/api/auth"
+        data = {"Username": self.username, "Password": self.password}
+        
+        # 先获取CSRF令牌
+        headers = {}
+        csrf_token = await self._get_csrf_token()
+        if csrf_token:
+            headers['X-Csrf-Token'] = csrf_token
+        
+        async with self.send("POST", url, json=data, headers=headers) as response:
+            if response.status == 200:
+                json_data = await response.json()
+                token = json_data.get("jwt")
+                if not token:
+                    raise Exception("登录Portainer失败：未返回JWT令牌")
+                
+                # 更新CSRF令牌
+                csrf_token = response.headers.get('X-CSRF-TOKEN', '') or await self._get_csrf_token()
+                if not csrf_token:
+                    raise Exception("登录Portainer失败：未获取到CSRF令牌")
+                
+                return token, {
+                    'Authorization': f"Bearer {token}",
+                    'X-CSRF-TOKEN': csrf_token
+                }
+            else:
+                text = await response.text()
+                raise Exception(f"登录Portainer失败：{response.status} {text}")
+
+    async def refresh_token(self, stale_token=None):
+        """加锁刷新Token，同一时刻只有一个登录在进行
+
+        stale_token不为空时表示该Token已被服务端拒绝；若锁内发现Token已被其他调用刷新则直接返回。
+        """
+        async with self._token_lock:
+            if stale_token is not None and self._token != stale_token:
+                return self._token
+            if stale_token is None and self._token is not None and time.time() < self._token_refresh_at:
+                return self._token
+
+            token, headers = await self._login()
+            now = time.time()
+            expires_at = now + self.token_cache_ttl
+            jwt_exp = _jwt_expiry(token)
+            if jwt_exp:
+                expires_at = min(expires_at, jwt_exp)
+            # 在到期前留出余量提前刷新
+            margin = min(60, (expires_at - now) * 0.1)
+
+            self.metrics.token_refreshes += 1
+            self._auth_headers = headers
+            self._token = token
+            self._token_time = now
+            self._token_expires_at = expires_at
+            self._token_refresh_at = expires_at - margin
+            self._save_state()
+            logger.debug(f"Portainer Token已刷新，{int(expires_at - now)}秒后过期")
+            return token
+
+    async def get_token(self):
+        """获取有效的JWT Token
+
+        Token有效时直接返回；临近过期时在后台刷新并先返回当前Token；已过期或不存在时加锁重新登录。
+        """
+        now = time.time()
+        if self._token is not None and now < self._token_expires_at:
+            if now >= self._token_refresh_at and (self._refresh_task is None or self._refresh_task.done()):
+                self._refresh_task = asyncio.create_task(self.refresh_token())
+                self._refresh_task.add_done_callback(self._on_refresh_done)
+            return self._token
+        return await self.refresh_token()
+
+    def _on_refresh_done(self, task):
+        """后台刷新失败时仅记录日志，Token过期后的下一次请求会重新登录"""
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"后台刷新Portainer Token失败：{task.exception()}")
+
+    async def _open(self, method, url, **kwargs):
+        """通过session发送请求并返回响应，记录所属路由的响应头耗时和状态码"""
+        kwargs.setdefault("ssl", self.verify_ssl)
+        metrics = self.metrics.route(self.name, method, url)
+        start = time.perf_counter()
+        try:
+            resp = await self.session.request(method, url, **kwargs)
+        except Exception:
+            metrics.errors += 1
+            raise
+        metrics.latency.observe(time.perf_counter() - start)
+        metrics.statuses[resp.status] = metrics.statuses.get(resp.status, 0) + 1
+        return resp
+
+    def _close(self, resp):
+        """释放响应并计入所属路由的响应字节数"""
+        resp.release()
+        self.metrics.route(self.name, resp.method, resp.url).bytes += resp.content.total_bytes
+
+    @asynccontextmanager
+    async def send(self, method, url, **kwargs):
+        """_open的上下文管理器形式，不携带认证信息，退出时释放响应"""
+        resp = await self._open(method, url, **kwargs)
+        try:
+            yield resp
+        finally:
+            self._close(resp)
+
+    async def _open_hedged(self, method, url, **kwargs):
+        """hedge_delay秒内没有响应头时再发一个相同的请求，采用先成功返回的响应"""
+        tasks = [asyncio.ensure_future(self._open(method, url, **kwargs))]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay)
+            if done:
+                winner = tasks[0].result()
+                return winner
+
+            self.metrics.hedged += 1
+            tasks.append(asyncio.ensure_future(self._open(method, url, **kwargs)))
+            error = None
+            for completed in asyncio.as_completed(tasks):
+                try:
+                    winner = await completed
+                    return winner
+                except Exception as e:
+                    error = e
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception() is None and task.result() is not winner:
+                    self._close(task.result())
+
+    def _breaker(self, url):
+        """按URL中的节点ID取得熔断器，Portainer自身的API共用一个"""
+        match = re.search(r"/api/endpoints/(\d+)/", str(url))
+        endpoint = match.group(1) if match else None
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers[endpoint] = CircuitBreaker(self.circuit_failure_threshold, self.circuit_cooldown)
+        return breaker, f"节点 {endpoint} " if endpoint else "Portainer "
+
+    @asynccontextmanager
+    async def request(self, method, url, hedge=False, **kwargs):
+        """携带认证信息请求Portainer
+
+        节点连续失败后在冷却期内直接报错，不再等待超时；GET请求遇到连接被拒/重置或502/503时按带抖动的
+        指数退避重试，超时不重试；hedge为True时对只读请求启用对冲；遇到401时刷新Token并透明重试一次。
+        """
+        breaker, name = self._breaker(url)
+        try:
+            breaker.check(name)
+        except Exception:
+            self.metrics.rejected += 1
+            raise
+        retries = self.retry_attempts if method == "GET" else 0
+        hedge = hedge and method == "GET" and self.hedge_delay > 0
+        token = await self.get_token()
+        refreshed = False
+        attempt = 0
+        while True:
+            try:
+                if hedge:
+                    resp = await self._open_hedged(method, url, headers=self._auth_headers, **kwargs)
+                else:
+                    resp = await self._open(method, url, headers=self._auth_headers, **kwargs)
+            except asyncio.TimeoutError:
+                breaker.record_failure()
+                raise
+            except aiohttp.ClientConnectionError:
+                breaker.record_failure()
+                if attempt >= retries or breaker.is_open:
+                    raise
+            else:
+                if resp.status == 401 and not refreshed:
+                    self._close(resp)
+                    refreshed = True
+                    await self.refresh_token(stale_token=token)
+                    continue
+                if resp.status not in (502, 503, 504):
+                    breaker.record_success()
+                    break
+                breaker.record_failure()
+                # 重试用尽时把错误响应交给调用方，由其给出具体的错误信息
+                if resp.status == 504 or attempt >= retries or breaker.is_open:
+                    break
+                self._close(resp)
+            self.metrics.retries += 1
+            await asyncio.sleep(random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt)))
+            attempt += 1
+        try:
+            yield resp
+        finally:
+            self._close(resp)
+
+    async def get_endpoint_id(self):
+        """获取默认的Portainer环境ID（首个环境）"""
+        if self._endpoint_id is None:
+            endpoints = await self.fetch_endpoints()
+            if not endpoints:
+                raise Exception("未找到任何Portainer环境")
+            self._endpoint_id = endpoints[0]["Id"]
+        return self._endpoint_id
+
+    async def cached_get(self, endpoint, path, params=None, timeout=None, error="请求失败"):
+        """带短时缓存的只读GET请求
+
+        endpoint不为None时path为该节点docker代理下的路径，否则为Portainer API路径。
+        """
+        if endpoint is None:
+            url = f"{self.url}{path}"
+        else:
+            url = f"{self.url}/api/endpoints/{endpoint}/docker{path}"
+
+        async def load():
+            async with self.request("GET", url, params=params, timeout=timeout, hedge=True) as resp:
+                if resp.status != 200:
+                    text = await resp.text()
+                    raise Exception(f"{error}：{resp.status} {text}")
+                return await resp.json()
+
+        key = (None if endpoint is None else str(endpoint), path)
+        if params:
+            key += (tuple(sorted(params.items())),)
+        return await self.cache.get(key, load)
+
+    async def fetch_endpoints(self):
+        """获取Portainer环境列表
+
+        启用持久化缓存时，启动后的第一次调用直接返回磁盘上的列表，同时在后台重新获取。
+        """
+        if self._stored_endpoints is not None:
+            endpoints, self._stored_endpoints = self._stored_endpoints, None
+            self._revalidate_task = asyncio.create_task(self._revalidate_endpoints())
+            return endpoints
+        endpoints = await self.cached_get(None, "/api/endpoints", error="获取节点列表失败")
+        self._remember_endpoints(endpoints)
+        return endpoints
+
+    async def _revalidate_endpoints(self):
+        try:
+            await self.fetch_endpoints()
+        except Exception as e:
+            logger.warning(f"重新获取Portainer实例 {self.name} 的节点列表失败：{e}")
+
+    def _remember_endpoints(self, endpoints):
+        """记录最新的节点列表，内容变化时修正默认节点并写入持久化文件"""
+        if endpoints is self._endpoints:
+            return
+        self._endpoints = endpoints
+        digest = hashlib.sha1(json.dumps(endpoints, sort_keys=True).encode()).hexdigest()
+        if digest == self._endpoints_digest:
+            return
+        self._endpoints_digest = digest
+        # 磁盘上记录的默认节点已被删除时改用当前的第一个节点
+        if endpoints and self._endpoint_id not in {ep["Id"] for ep in endpoints}:
+            self._endpoint_id = endpoints[0]["Id"]
+        self._save_state()
+
+    async def fetch_containers(self, endpoint, timeout=None, filters=None, allow_fleet=True):
+        """获取指定节点上的全部容器，filters为Docker API的过滤条件字典
+
+        后台状态跟踪开启且该节点状态足够新时直接从内存返回，不发起请求。
+        """
+        if allow_fleet and not filters:
+            state = self.fleet.get(str(endpoint))
+            if state is not None and state.is_fresh(self.fleet_state_max_age, self._fleet_sync_max_age):
+                containers = state.snapshot()
+                self.index(endpoint).update(containers)
+                return containers
+
+        params = {"all": "true"}
+        if filters:
+            params["filters"] = json.dumps(filters, sort_keys=True)
+        containers = await self.cached_get(
+            endpoint, "/containers/json", params, timeout, error="获取容器列表失败"
+        )
+        self.index(endpoint).update(containers, complete=not filters)
+        return containers
+
+    def index(self, endpoint):
+        """获取指定节点的容器索引"""
+        index = self.indexes.get(str(endpoint))
+        if index is None:
+            index = self.indexes[str(endpoint)] = ContainerIndex()
+        return index
+
+    async def resolve_container(self, endpoint, ref, strict=False):
+        """通过本地索引把容器名称/ID前缀解析为完整容器ID
+
+        索引为空或未命中时刷新一次容器列表；列表获取失败时原样返回，交由Docker自行解析。
+        strict的含义见ContainerIndex.resolve。
+        """
+        index = self.index(endpoint)
+        fresh = False
+
+        def passthrough():
+            # Docker会把短的十六进制串当作ID前缀解析，严格模式下不能原样交给它
+            if strict and re.fullmatch(r"[0-9a-f]{1,11}", ref.strip()):
+                raise Exception(f"无法获取容器列表，无法确认 {ref} 指向哪个容器，请提供完整的名称或ID")
+            return ref
+
+        if not index.by_id:
+            try:
+                await self.fetch_containers(endpoint)
+            except Exception:
+                return passthrough()
+            fresh = True
+
+        while True:
+            matches, candidates = index.resolve(ref, strict)
+            if len(matches) == 1:
+                return matches[0]["Id"]
+            if len(matches) > 1:
+                names = "、".join(_container_name(c) or c["Id"][:12] for c in matches[:5])
+                raise Exception(f"{ref} 匹配到多个容器：{names}，请提供更完整的名称或ID")
+            if fresh:
+                break
+            self.cache.invalidate(endpoint, "/containers/json")
+            try:
+                await self.fetch_containers(endpoint, allow_fleet=False)
+            except Exception:
+                return passthrough()
+            fresh = True
+
+        hint = f"，您是否指：{'、'.join(candidates)}" if candidates else ""
+        if strict:
+            raise Exception(f"没有名称或ID为 {ref} 的容器，未执行任何操作（需要完整名称、完整ID或至少12位的ID前缀）{hint}")
+        raise Exception(f"未找到容器 {ref}{hint}")
+
+    def known_running(self, endpoint, container_id):
+        """从后台状态模型判断容器是否运行中(与inspect的State.Running一致，paused、restarting也算)，未知或状态过旧时返回None"""
+        state = self.fleet.get(str(endpoint))
+        if state is None or not state.is_fresh(self.fleet_state_max_age, self._fleet_sync_max_age):
+            return None
+        c = state.containers.get(container_id)
+        return None if c is None else c.get("State") not in _STOPPED_STATES
+
+    async def watch_fleet(self):
+        """后台任务：为每个节点维持一个事件订阅，并定期刷新节点列表"""
+        while True:
+            try:
+                endpoints = await self.fetch_endpoints()
+                ids = {str(ep["Id"]) for ep in endpoints}
+                for endpoint in ids - self.fleet_tasks.keys():
+                    self.fleet_tasks[endpoint] = asyncio.create_task(self._watch_endpoint(endpoint))
+                for endpoint in set(self.fleet_tasks) - ids:
+                    self.fleet_tasks.pop(endpoint).cancel()
+                    self.fleet.pop(endpoint, None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"刷新Portainer实例 {self.name} 的节点列表失败：{e}")
+            await asyncio.sleep(self.fleet_resync_interval)
+
+    async def _watch_endpoint(self, endpoint):
+        """订阅单个节点的/docker/events，断线后退避重连并重新全量同步"""
+        state = self.fleet.setdefault(endpoint, EndpointState())
+        url = f"{self.url}/api/endpoints/{endpoint}/docker/events"
+        params = {"filters": json.dumps({"type": ["container"]})}
+        timeout = aiohttp.ClientTimeout(connect=self.session.timeout.connect, sock_read=None)
+        failures = 0
+        while True:
+            try:
+                async with self.request("GET", url, params=params, timeout=timeout) as resp:
+                    if resp.status != 200:
+                        raise Exception(f"{resp.status} {await resp.text()}")
+                    # 先建立事件流再全量同步，同步期间发生的事件随后按顺序应用
+                    self.cache.invalidate(endpoint, "/containers/json")
+                    state.sync(await self.fetch_containers(endpoint, allow_fleet=False))
+                    state.connected = True
+                    failures = 0
+                    resync_at = time.monotonic() + self.fleet_resync_interval
+                    # 节点可能长时间没有事件，按定时器而不是在收到事件时检查同步期限
+                    while True:
+                        remaining = resync_at - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        try:
+                            line = await asyncio.wait_for(resp.content.readline(), remaining)
+                        except asyncio.TimeoutError:
+                            break
+                        if not line:
+                            break
+                        try:
+                            event = json.loads(line)
+                        except ValueError:
+                            continue
+                        if state.apply(event):
+                            self.cache.invalidate(endpoint, "/containers")
+            except asyncio.CancelledError:
+                state.connected = False
+                raise
+            except Exception as e:
+                failures += 1
+                logger.warning(f"Portainer实例 {self.name} 节点 {endpoint} 的Docker事件订阅中断：{e}")
+            state.connected = False
+            await asyncio.sleep(min(60, 2 ** failures) if failures else 1)
+
+    async def inspect_container(self, endpoint, container):
+        """获取容器详情"""
+        return await self.cached_get(endpoint, f"/containers/{container}/json", error="获取容器状态失败")
+
+
+@register("astrbot_portainer_plugin", "RC", "简单查看portainer的情况", "1.0")
+class MyPlugin(Star):
+    def __init__(self, context: Context, config: AstrBotConfig):
+        super().__init__(context)
+        self.config = config
+        portainer_config = config.get("portainer", {})
+        # 连接池与超时：快速调用使用会话默认超时，拉取镜像、读取日志、停止/重启容器等慢调用使用slow_timeout
+        connect_timeout = portainer_config.get("connect_timeout", 5)
+        self.quick_timeout = aiohttp.ClientTimeout(
+            connect=connect_timeout,
+            sock_read=portainer_config.get("read_timeout", 30)
+        )
+        self.slow_timeout = aiohttp.ClientTimeout(
+            connect=connect_timeout,
+            sock_read=portainer_config.get("slow_read_timeout", 300)
+        )
+        self.log_max_bytes = portainer_config.get("log_max_bytes", 1048576)
+        self.log_max_lines = portainer_config.get("log_max_lines", 2000)
+        self.encoding_sample_size = portainer_config.get("encoding_sample_size", 65536)
+        self.log_buffer_lines = portainer_config.get("log_buffer_lines", 1000)
+        self.log_follow_max = portainer_config.get("log_follow_max", 5)
+        self.log_max_matches = portainer_config.get("log_max_matches", 50)
+        self.log_scan_max_bytes = portainer_config.get("log_scan_max_bytes", 67108864)
+        self.log_export_dir = portainer_config.get("log_export_dir", "")
+        self.log_export_max_bytes = portainer_config.get("log_export_max_bytes", 1073741824)
+        self.log_export_keep = portainer_config.get("log_export_keep", 20)
+        self.fanout_concurrency = portainer_config.get("fanout_concurrency", 8)
+        self.fanout_timeout = portainer_config.get("fanout_timeout", 10)
+        self.batch_concurrency = portainer_config.get("batch_concurrency", 5)
+        self.output_max_chars = portainer_config.get("output_max_chars", 4000)
+        self.stats_concurrency = portainer_config.get("stats_concurrency", 10)
+        self.stats_timeout = portainer_config.get("stats_timeout", 10)
+        self.stats_cpu_window = portainer_config.get("stats_cpu_window", 1)
+        self.stats_sample_max_age = portainer_config.get("stats_sample_max_age", 60)
+        self._metrics = PluginMetrics()
+        self._encoding_cache = OrderedDict()  # (实例, 节点ID, 容器) -> 日志编码
+        self._log_cursors = OrderedDict()  # (实例, 节点ID, 容器ID) -> 最新日志时间戳(秒, 纳秒)
+        self._log_followers = {}  # (实例, 节点ID, 容器ID) -> LogFollower
+        self._stats_samples = {}  # (实例, 节点ID) -> {容器ID: 上一次的ContainerStats}
+
+        # Portainer实例：portainer下的url等为主实例，instances为其余实例，第一个实例为默认实例
+        connections = []
+        if portainer_config.get("url") or not portainer_config.get("instances"):
+            connections.append(dict(portainer_config, name=portainer_config.get("name") or "default"))
+        connections.extend(portainer_config.get("instances") or [])
+        state_dir = None
+        if portainer_config.get("persistent_cache", False):
+            try:
+                state_dir = portainer_config.get("persistent_cache_dir") or str(
+                    StarTools.get_data_dir("astrbot_portainer_plugin")
+                )
+                os.makedirs(state_dir, exist_ok=True)
+            except Exception as e:
+                state_dir = None
+                logger.warning(f"无法创建Portainer持久化缓存目录，已关闭持久化：{e}")
+        self._instances = OrderedDict()  # 实例名称 -> PortainerInstance
+        for conn in connections:
+            name = str(conn.get("name") or "").strip() or conn.get("url", "")
+            if name in self._instances:
+                logger.warning(f"Portainer实例名称重复，已忽略：{name}")
+                continue
+            self._instances[name] = PortainerInstance(
+                name, conn, portainer_config, self._metrics, self.quick_timeout, state_dir
+            )
+
+    def _instance(self, name=None):
+        """按名称取得Portainer实例，未指定时返回默认实例"""
+        if not name:
+            return next(iter(self._instances.values()))
+        inst = self._instances.get(str(name).strip())
+        if inst is None:
+            raise Exception(f"未找到Portainer实例 {name}，可用实例：{'、'.join(self._instances)}")
+        return inst
+
     @filter.command("portainer_test")
     async def portainer_test(self, event: AstrMessageEvent):
         '''调用配置信息测试portainer连接性''' # 这是 handler 的描述，将会被解析方便用户了解插件内容。建议填写。
         user_name = event.get_sender_name()
+
+        async def check(inst):
+            try:
+                await inst.get_token()
+                await inst.get_endpoint_id()
+            except Exception as e:
+                return e
+
+        instances = list(self._instances.values())
+        errors = await asyncio.gather(*(check(inst) for inst in instances))
+        if len(instances) == 1:
+            if errors[0] is None:
+                yield event.plain_result(f"Portainer连接测试成功！{user_name}，已获取有效JWT Token")
+            else:
+                yield event.plain_result(f"Portainer连接测试失败：{str(errors[0])}")
+            return
+        lines = [f"{user_name}，Portainer连接测试结果："]
+        for inst, error in zip(instances, errors):
+            lines.append(f"- {inst.name}: " + ("连接成功" if error is None else f"连接失败：{error}"))
+        yield event.plain_result("\n".join(lines))
+
+    @filter.command("portainer_stats")
+    async def portainer_stats(self, event: AstrMessageEvent, export: str = ""):
+        '''查看插件的调用耗时与上游请求统计，参数为prometheus时导出Prometheus文本格式'''
+        instances = list(self._instances.values())
+        if export.strip().lower() == "prometheus":
+            yield event.plain_result(self._metrics.prometheus(instances))
+        else:
+            yield event.plain_result(self._metrics.format(instances))
+
+    def _detect_encoding(self, data, cache_key=None):
+        """采样检测日志编码，样本足以判断时按容器缓存结果"""
+        encoding = detect_encoding(data, self.encoding_sample_size)
+        sample = data[:self.encoding_sample_size]
+        # 纯ASCII的短样本无法说明容器的真实编码，不缓存
+        if cache_key is not None and (not sample.isascii() or len(sample) >= self.encoding_sample_size):
+            self._encoding_cache[cache_key] = encoding
+            if len(self._encoding_cache) > 256:
+                self._encoding_cache.popitem(last=False)
+        return encoding
+
+    def _log_stream(self, resp, cache_key, sample_size=None):
+        """为日志响应创建DockerLogStream，使用按容器缓存的编码"""
+        encoding = self._encoding_cache.get(cache_key)
+        if encoding:
+            self._encoding_cache.move_to_end(cache_key)
+        return DockerLogStream(
+            resp.content,
+            encoding=encoding,
+            detect=lambda data: self._detect_encoding(data, cache_key),
+            sample_size=sample_size or self.encoding_sample_size,
+        )
+
+    def _set_log_cursor(self, cache_key, cursor):
+        self._log_cursors[cache_key] = cursor
+        self._log_cursors.move_to_end(cache_key)
+        if len(self._log_cursors) > 256:
+            self._log_cursors.popitem(last=False)
+
+    async def _follow_logs(self, inst, endpoint, container_id, follower):
+        """长连接订阅容器日志(follow=1)，新行写入follower的环形缓冲区"""
+        cache_key = (inst.name, str(endpoint), container_id)
+        url = f"{inst.url}/api/endpoints/{endpoint}/docker/containers/{container_id}/logs"
+        params = {"stdout": 1, "stderr": 1, "follow": 1, "timestamps": 1, "tail": 0}
+        cursor = self._log_cursors.get(cache_key)
+        if cursor:
+            params["since"] = f"{cursor[0]}.{cursor[1]:09d}"
+        # 订阅可能长时间没有新日志，不设置读取超时
+        timeout = aiohttp.ClientTimeout(connect=self.quick_timeout.connect, sock_read=None)
         try:
-            token = await self._get_portainer_token()
-            yield event.plain_result(f"Portainer连接测试成功！{user_name}，已获取有效JWT Token")
+            async with inst.request("GET", url, params=params, timeout=timeout) as resp:
+                if resp.status != 200:
+                    follower.error = f"{resp.status} {await resp.text()}"
+                    return
+                # 持续订阅不能等样本攒满才输出，收到第一段非ASCII负载即检测编码
+                async for name, line in self._log_stream(resp, cache_key, sample_size=1).lines():
+                    ts, line = _split_log_timestamp(line)
+                    if ts:
+                        if cursor and ts <= cursor:
+                            continue
+                        cursor = ts
+                        self._set_log_cursor(cache_key, ts)
+                    follower.push(f"[stderr] {line}" if name == "stderr" else line)
+            follower.error = "日志流已结束（容器可能已停止）"
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            yield event.plain_result(f"Portainer连接测试失败：{str(e)}")
+            follower.error = str(e)
+
+    @filter.llm_tool(name="get_container_logs")
+    @_timed_tool
+    async def get_container_logs(
+        self, 
+        event: AstrMessageEvent,
+        container_id: str,
+        endpoint_id: str = None,
+        tail: str = 100,
+        incremental: bool = False,
+        subscribe: bool = False,
+        pattern: str = None,
+        level: str = None,
+        since: str = None,
+        until: str = None,
+        context: int = 2,
+        max_matches: int = None,
+        instance: str = None
+    ) -> str:
+        '''获取指定容器的日志。用户反复询问同一容器的新日志（例如"有没有新的报错"）时应使用incremental；只关心特定内容时应使用pattern或level过滤，避免返回完整日志。
+        
+        Args:
+            container_id (string): 容器ID或名称
+            endpoint_id (string): 可选，指定节点ID，默认为当前默认节点
+            tail (string): 可选，要获取的日志行数(默认100)
+            incremental (boolean): 可选，为true时只返回上次查询之后的新日志
+            subscribe (boolean): 可选，为true时对该容器建立持续订阅，之后的incremental查询直接读取本地缓冲，无需再请求服务器
+            pattern (string): 可选，只返回匹配该正则表达式的行(不区分大小写)
+            level (string): 可选，只返回不低于该级别的行，可选值为trace、debug、info、warn、error、fatal
+            since (string): 可选，起始时间，支持UNIX时间戳、相对时长(如30m、2h、1d)或"YYYY-MM-DD HH:MM:SS"
+            until (string): 可选，截止时间，格式同since
+            context (number): 可选，过滤时每个匹配行前后附带的上下文行数(默认2)
+            max_matches (number): 可选，过滤时最多返回的匹配数，达到后停止读取
+            instance (string): 可选，Portainer实例名称，默认为第一个实例
+            
+        Returns:
+            string: 格式化后的日志内容或错误信息，stderr输出的行带有[stderr]前缀
+        '''
+        try:
+            inst = self._instance(instance)
+            endpoint = endpoint_id if endpoint_id else await inst.get_endpoint_id()
+            container_id = await inst.resolve_container(endpoint, container_id)
+            cache_key = (inst.name, str(endpoint), container_id)
+            incremental = _as_bool(incremental)
+            log_filter = None
+            if pattern or level:
+                log_filter = LogFilter(
+                    pattern, level, int(context or 0), int(max_matches or self.log_max_matches)
+                )
+
+            follower = self._log_followers.get(cache_key)
+            if _as_bool(subscribe):
+                if follower is None or follower.task.done():
+                    active = sum(1 for f in self._log_followers.values() if not f.task.done())
+                    if active >= self.log_follow_max:
+                        return f"日志订阅数已达上限({self.log_follow_max})，请先取消其他订阅"
+                    follower = LogFollower(self.log_buffer_lines)
+                    follower.task = asyncio.create_task(self._follow_logs(inst, endpoint, container_id, follower))
+                    self._log_followers[cache_key] = follower
+                    return f"已订阅容器 {container_id[:12]} 的日志，之后使用incremental查询即可获取新日志"
+                return f"容器 {container_id[:12]} 的日志已在订阅中"
+
+            if follower is not None and incremental:
+                # 订阅中的容器直接读取本地缓冲区
+                lines, dropped = follower.read_new()
+                if log_filter:
+                    lines = [out for line in lines if not log_filter.done for out in log_filter.feed(line)]
+                if dropped:
+                    lines.insert(0, f"……缓冲区已满，丢弃了 {dropped} 行较早的日志")
+                if follower.task.done():
+                    del self._log_followers[cache_key]
+                    lines.append(f"（日志订阅已断开：{follower.error}）")
+                return "\n".join(lines) if lines else "自上次查询以来没有新日志"
+            
+            # 超出行数预算的部分不必让Docker发送；过滤模式下输出量由匹配数决定，按请求的行数扫描
+            if log_filter and str(tail).strip().lower() == "all":
+                tail = "all"
+            else:
+                try:
+                    tail = int(tail)
+                except (TypeError, ValueError):
+                    tail = self.log_max_lines
+                if not log_filter:
+                    tail = min(tail, self.log_max_lines)
+
+            url = f"{inst.url}/api/endpoints/{endpoint}/docker/containers/{container_id}/logs"
+            params = {
+                "stdout": 1,
+                "stderr": 1,
+                "tail": tail
+            }
+            # 时间范围交给Docker在服务端过滤
+            if _parse_time_arg(since):
+                params["since"] = _parse_time_arg(since)
+            if _parse_time_arg(until):
+                params["until"] = _parse_time_arg(until)
+            cursor = None
+            if incremental:
+                params["timestamps"] = 1
+                cursor = self._log_cursors.get(cache_key)
+                if cursor:
+                    params["since"] = f"{cursor[0]}.{cursor[1]:09d}"
+                    # 有游标时tail会丢掉两次查询之间超出tail的新日志，改为读取游标之后的全部日志，
+                    # 由log_max_lines限制返回量，游标只前进到已返回的最后一行
+                    params["tail"] = "all"
+            
+            async with inst.request("GET", url, params=params, timeout=self.slow_timeout) as resp:
+                if resp.status != 200:
+                    error_msg = await resp.text() or "Unknown error"
+                    return f"获取容器日志失败：{resp.status} {error_msg}"
+
+                stream = self._log_stream(resp, cache_key)
+                result = []
+                truncated = False
+                newest = cursor
+                # 按tail读取时要保留最新的行：用环形缓冲按行数和字节数从头部淘汰较早的行；
+                # 带游标的增量读取则从头消费，游标只前进到已返回的行，不会丢失日志
+                window = not log_filter and not cursor
+                if window:
+                    result = deque()
+                    sizes = deque()
+                result_bytes = 0
+                dropped = 0
+                async for name, lines in stream.batches():
+                    stamps = None
+                    if incremental:
+                        stamps, kept = [], []
+                        for line in lines:
+                            ts, line = _split_log_timestamp(line)
+                            # since参数按秒粒度过滤，边界上的行需要再按时间戳去重
+                            if ts and cursor and ts <= cursor:
+                                continue
+                            stamps.append(ts)
+                            kept.append(line)
+                        lines = kept
+                    prefix = "[stderr] " if name == "stderr" else ""
+
+                    if log_filter:
+                        if log_filter.done or stream.bytes_read > self.log_scan_max_bytes:
+                            truncated = True
+                            break
+                        scanned = log_filter.scanned
+                        result.extend(log_filter.feed_batch(lines, prefix))
+                        consumed = log_filter.scanned - scanned
+                    elif window:
+                        for line in lines:
+                            line = prefix + line
+                            size = len(line.encode("utf-8", "replace")) + 1
+                            result.append(line)
+                            sizes.append(size)
+                            result_bytes += size
+                            while len(result) > 1 and (
+                                len(result) > self.log_max_lines or result_bytes > self.log_max_bytes
+                            ):
+                                result.popleft()
+                                result_bytes -= sizes.popleft()
+                                dropped += 1
+                        consumed = len(lines)
+                        if stream.bytes_read > self.log_scan_max_bytes:
+                            truncated = True
+                    else:
+                        consumed = 0
+                        for line in lines:
+                            line = prefix + line
+                            size = len(line.encode("utf-8", "replace")) + 1
+                            # 至少返回一行，保证单行超出预算时游标仍能前进
+                            if result and (
+                                len(result) >= self.log_max_lines or result_bytes + size > self.log_max_bytes
+                            ):
+                                truncated = True
+                                break
+                            result.append(line)
+                            result_bytes += size
+                            consumed += 1
+                    if stamps:
+                        for ts in stamps[:consumed]:
+                            if ts:
+                                newest = max(newest, ts) if newest else ts
+                    if truncated:
+                        break
+
+                if incremental and newest:
+                    self._set_log_cursor(cache_key, newest)
+                if window:
+                    result = list(result)
+                    if dropped:
+                        result.insert(0, f"……日志较长，已省略较早的 {dropped} 行，以下为最新的 {len(result)} 行")
+                if log_filter:
+                    if not log_filter.matches:
+                        return f"没有匹配的日志（已扫描 {log_filter.scanned} 行）"
+                    summary = f"共 {log_filter.matches} 处匹配，已扫描 {log_filter.scanned} 行"
+                    if truncated:
+                        summary += "，已达到匹配或扫描上限，后续日志未读取"
+                    result.append(f"……{summary}")
+                elif truncated and cursor:
+                    result.append(f"……新日志超过本次返回上限，仅返回了最早的 {len(result)} 行，再次增量查询可继续读取后续日志")
+                elif truncated:
+                    result.append(f"……日志读取量超过上限，已停止读取（已读取 {stream.bytes_read} 字节），以上并非最新日志")
+                if incremental and not result:
+                    return "自上次查询以来没有新日志"
+                return "\n".join(result)
+                
+        except Exception as e:
+            return f"获取容器日志出错: {str(e)}"
 
-    def _detect_encoding(self, data):
-        """简单的编码检测实现"""
-        # 检查UTF-8 BOM
-        if len(data) >= 3 and data[:3] == b'\xef\xbb\xbf':
-            return 'utf-8-sig'
+    @filter.llm_tool(name="unsubscribe_container_logs")
+    @_timed_tool
+    async def unsubscribe_container_logs(self, event: AstrMessageEvent, container_id: str, endpoint_id: str = None, instance: str = None) -> str:
+        '''取消对指定容器日志的持续订阅
         
-        # 检查UTF-16/UTF-32 BOM
-        if len(data) >= 2:
-            if data[:2] == b'\xff\xfe':
-                return 'utf-16'
-            if data[:2] == b'\xfe\xff':
-                return 'utf-16-be'
-        
-        # 启发式检测中文编码
+        Args:
+            container_id (string): 容器ID或名称
+            endpoint_id (string): 可选，指定节点ID，默认为当前默认节点
+            instance (string): 可选，Portainer实例名称，默认为第一个实例
+            
+        Returns:
+            string: 操作结果信息
+        '''
         try:
-            # 尝试GB18030解码，统计有效中文字符
-            decoded = data.decode('gb18030', errors='strict')
-            chinese_chars = sum(1 for c in decoded if '\u4e00' <= c <= '\u9fff')
-            if chinese_chars > len(decoded) * 0.1:  # 中文字符占比超过10%
-                return 'gb18030'
-        except:
-            pass
-        
-        # 默认返回UTF-8
-        return 'utf-8'
+            inst = self._instance(instance)
+            endpoint = endpoint_id if endpoint_id else await inst.get_endpoint_id()
+            container_id = await inst.resolve_container(endpoint, container_id)
+            follower = self._log_followers.pop((inst.name, str(endpoint), container_id), None)
+            if follower is None:
+                return f"容器 {container_id[:12]} 没有日志订阅"
+            follower.task.cancel()
+            return f"已取消容器 {container_id[:12]} 的日志订阅"
+        except Exception as e:
+            return f"取消日志订阅出错: {str(e)}"
 
-    @filter.llm_tool(name="get_container_logs")
-    async def get_container_logs(
-        self, 
+    def _log_export_path(self, container_name, compression):
+        """在导出目录中为本次导出生成不与已有文件冲突的路径"""
+        export_dir = self.log_export_dir or os.path.join(
+            str(StarTools.get_data_dir("astrbot_portainer_plugin")), "log_exports"
+        )
+        os.makedirs(export_dir, exist_ok=True)
+        safe_name = re.sub(r"[^\w.-]", "_", container_name) or "container"
+        stem = os.path.join(export_dir, f"{safe_name}_{time.strftime('%Y%m%d-%H%M%S')}")
+        suffix = _LOG_EXPORT_SUFFIXES[compression]
+        path = stem + suffix
+        n = 1
+        while os.path.exists(path) or os.path.exists(path + ".part"):
+            path = f"{stem}-{n}{suffix}"
+            n += 1
+        return path
+
+    def _prune_log_exports(self, export_dir):
+        """按log_export_keep清理较早的导出文件，只在新的导出成功写入后调用
+
+        log_export_dir可能指向已有的日志目录，只清理文件名符合本插件命名格式的文件。
+        """
+        exports = sorted(
+            (entry for entry in os.scandir(export_dir)
+             if entry.is_file() and _LOG_EXPORT_NAME.fullmatch(entry.name)),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in exports[:max(len(exports) - max(self.log_export_keep, 1), 0)]:
+            try:
+                os.remove(entry.path)
+            except OSError as e:
+                logger.warning(f"删除过期的日志导出文件失败：{e}")
+
+    @filter.llm_tool(name="export_container_logs")
+    @_timed_tool
+    async def export_container_logs(
+        self,
         event: AstrMessageEvent,
         container_id: str,
         endpoint_id: str = None,
-        tail: str = 100
+        tail: str = "all",
+        since: str = None,
+        until: str = None,
+        pattern: str = None,
+        level: str = None,
+        compression: str = "gzip",
+        send_file: bool = False,
+        instance: str = None
     ) -> str:
-        '''获取指定容器的日志
+        '''把容器日志流式导出为压缩文件，只返回文件路径、大小、行数和首尾几行摘要。排查事故需要完整或大量日志时应使用该工具，而不是get_container_logs。
         
         Args:
             container_id (string): 容器ID或名称
             endpoint_id (string): 可选，指定节点ID，默认为当前默认节点
-            tail (string): 可选，要获取的日志行数(默认100)
+            tail (string): 可选，导出最后多少行，默认all导出全部
+            since (string): 可选，起始时间，支持UNIX时间戳、相对时长(如30m、2h、1d)或"YYYY-MM-DD HH:MM:SS"
+            until (string): 可选，截止时间，格式同since
+            pattern (string): 可选，只导出匹配该正则表达式的行(不区分大小写)
+            level (string): 可选，只导出不低于该级别的行，可选值为trace、debug、info、warn、error、fatal
+            compression (string): 可选，压缩格式，可选值为gzip(默认)、zstd(需要安装zstandard)
+            send_file (boolean): 可选，为true时把导出的文件作为附件发送到当前会话
+            instance (string): 可选，Portainer实例名称，默认为第一个实例
             
         Returns:
-            string: 格式化后的日志内容或错误信息
+            string: 导出文件的路径、压缩后大小、原始大小、行数以及开头和结尾的几行日志
         '''
         try:
-            token = await self._get_portainer_token()
-            endpoint = endpoint_id if endpoint_id else self._get_endpoint_id()
-            
-            url = f"{self.portainer_url}/api/endpoints/{endpoint}/docker/containers/{container_id}/logs"
-            params = {
-                "stdout": 1,
-                "stderr": 1,
-                "tail": tail
-            }
-            
-            async with self.session.get(url, params=params, ssl=self.verify_ssl) as resp:
-                if resp.status == 200:
-                    data = await resp.read()
-                    
-                    # 使用自定义编码检测
-                    encoding = self._detect_encoding(data)
-                    
-                    # 尝试检测到的编码
-                    if encoding:
-                        try:
-                            decoded = data.decode(encoding)
-                            if encoding.lower() != 'utf-8':
-                                # 转换为UTF-8确保一致性
-                                decoded = decoded.encode('utf-8', errors='ignore').decode('utf-8')
-                            return decoded
-                        except UnicodeDecodeError:
-                            pass
-                    
-                    # 保底方案：尝试常见编码
-                    for enc in ['utf-8', 'gb18030', 'gbk', 'big5']:
-                        try:
-                            decoded = data.decode(enc)
-                            if enc != 'utf-8':
-                                decoded = decoded.encode('utf-8', errors='ignore').decode('utf-8')
-                            return decoded
-                        except UnicodeDecodeError:
-                            continue
-                    
-                    # 最终方案：损失性解码
-                    return data.decode('utf-8', errors='ignore')
-                else:
-                    error_msg = await resp.text() or "Unknown error"
-                    return f"获取容器日志失败：{resp.status} {error_msg}"
-                
+            compression = (compression or "gzip").strip().lower()
+            compression = {"gz": "gzip", "zst": "zstd"}.get(compression, compression)
+            if compression not in _LOG_EXPORT_SUFFIXES:
+                return f"不支持的压缩格式：{compression}，可选值为{'、'.join(_LOG_EXPORT_SUFFIXES)}"
+            log_filter = LogFilter(pattern, level) if pattern or level else None
+
+            inst = self._instance(instance)
+            endpoint = endpoint_id if endpoint_id else await inst.get_endpoint_id()
+            container_id = await inst.resolve_container(endpoint, container_id)
+            cache_key = (inst.name, str(endpoint), container_id)
+            container = inst.index(endpoint).by_id.get(container_id)
+            container_name = (_container_name(container) if container else "") or container_id[:12]
+
+            tail = str(tail).strip().lower() if tail is not None else "all"
+            if tail != "all" and not tail.isdigit():
+                tail = "all"
+            url = f"{inst.url}/api/endpoints/{endpoint}/docker/containers/{container_id}/logs"
+            params = {"stdout": 1, "stderr": 1, "timestamps": 1, "tail": tail}
+            if _parse_time_arg(since):
+                params["since"] = _parse_time_arg(since)
+            if _parse_time_arg(until):
+                params["until"] = _parse_time_arg(until)
+
+            path = self._log_export_path(container_name, compression)
+            writer = CompressedLogWriter(path, compression)
+            truncated = False
+            scanned = 0
+            try:
+                async with inst.request("GET", url, params=params, timeout=self.slow_timeout) as resp:
+                    if resp.status != 200:
+                        writer.abort()
+                        error_msg = await resp.text() or "Unknown error"
+                        return f"导出容器日志失败：{resp.status} {error_msg}"
+
+                    stream = self._log_stream(resp, cache_key)
+                    async for name, lines in stream.batches():
+                        if stream.bytes_read > self.log_export_max_bytes:
+                            truncated = True
+                            break
+                        prefix = "[stderr] " if name == "stderr" else ""
+                        scanned += len(lines)
+                        if log_filter:
+                            # 整批都不含匹配时一次跳过；导出不需要上下文和分隔符，直接逐行匹配
+                            if log_filter.match("\n".join(lines)):
+                                await writer.write_lines([line for line in lines if log_filter.match(line)], prefix)
+                        else:
+                            await writer.write_lines(lines, prefix)
+                size = await writer.close()
+            except BaseException:
+                writer.abort()
+                raise
+            self._prune_log_exports(os.path.dirname(path))
+
+            summary = f"大小 {_format_bytes(size)}（原始 {_format_bytes(writer.raw_bytes)}，{compression}），共 {writer.lines} 行"
+            if log_filter:
+                summary += f"，从 {scanned} 行中过滤"
+            if truncated:
+                summary += f"，已达到导出上限 {_format_bytes(self.log_export_max_bytes)}，后续日志未导出"
+            result = [f"已导出容器 {container_name} 的日志：{path}", summary]
+            if writer.lines:
+                result.append("开头:")
+                result.extend(line[:300] for line in writer.head)
+                if writer.lines > len(writer.head):
+                    result.append("结尾:")
+                    result.extend(line[:300] for line in list(writer.tail)[-(writer.lines - len(writer.head)):])
+
+            if _as_bool(send_file) and event is not None:
+                try:
+                    await event.send(event.chain_result([File(name=os.path.basename(path), file=path)]))
+                    result.append("文件已作为附件发送")
+                except Exception as e:
+                    result.append(f"发送文件失败：{e}")
+            return "\n".join(result)
+
         except Exception as e:
-            return f"获取容器日志出错: {str(e)}"
+            return f"导出容器日志出错: {str(e)}"
 
     async def terminate(self):
         '''可选择实现 terminate 函数，当插件被卸载/停用时会调用。'''
-        await self.session.close()
+        for follower in self._log_followers.values():
+            follower.task.cancel()
+        await asyncio.gather(*(inst.close() for inst in self._instances.values()))
 
-    async def _get_csrf_token(self):
-        """从/settings端点获取CSRF令牌"""
-        url = f"{self.portainer_url}/api/settings"
-        async with self.session.get(url, ssl=self.verify_ssl) as resp:
-            return resp.headers.get('X-Csrf-Token', '')
+    async def _fan_out(self, targets, fetch):
+        """并发地对多个节点执行fetch(实例, 节点ID, timeout)
 
-    async def _portainer_login(self):
-        """登录Portainer获取JWT Token和CSRF Token"""
-        url = f"{self.portainer_url}/api/auth"
-        data = {"Username": self.username, "Password": self.password}
-        
-        # 确保session headers是干净的但保留必要headers
-        self.session.headers.clear()
-        self.session.headers.update({
-            'Referer': self.portainer_url,
-            'Origin': self.portainer_url
-        })
-        
-        # 先获取CSRF令牌
-        csrf_token = await self._get_csrf_token()
-        if csrf_token:
-            self.session.headers.update({'X-Csrf-Token': csrf_token})
-        
-        async with self.session.post(url, json=data, ssl=self.verify_ssl) as response:
-            if response.status == 200:
-                json_data = await response.json()
-                token = json_data.get("jwt")
-                if not token:
-                    raise Exception("登录Portainer失败：未返回JWT令牌")
-                
-                # 更新CSRF令牌
-                csrf_token = response.headers.get('X-CSRF-TOKEN', '') or await self._get_csrf_token()
-                if not csrf_token:
-                    raise Exception("登录Portainer失败：未获取到CSRF令牌")
-                
-                # 更新session headers
-                self.session.headers.update({
-                    'Authorization': f"Bearer {token}",
-                    'X-CSRF-TOKEN': csrf_token
-                })
-                return token
-            else:
-                text = await response.text()
-                raise Exception(f"登录Portainer失败：{response.status} {text}")
+        targets为[(实例, 节点)]，返回[(实例, 节点, 结果或异常)]。并发数受fanout_concurrency限制，
+        单个节点超时或失败不影响其他节点。
+        """
+        semaphore = asyncio.Semaphore(self.fanout_concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.fanout_timeout)
 
-    async def _get_portainer_token(self):
-        """获取有效的JWT Token（缓存未过期则直接返回，否则重新登录）"""
-        if (self._token is None or 
-            time.time() - self._token_time > self.token_cache_ttl):
-            # 强制重新登录获取最新token和CSRF token
-            self._token = await self._portainer_login()
-            self._token_time = time.time()
-            self._endpoint_id = None  # 清除之前缓存的环境ID
-            
-            # 获取端点列表验证token有效性
-            async with self.session.get(
-                f"{self.portainer_url}/api/endpoints",
-                ssl=self.verify_ssl
-            ) as resp:
-                if resp.status == 200:
-                    endpoints = await resp.json()
-                    if not endpoints:
-                        raise Exception("未找到任何Portainer环境")
-                    self._endpoint_id = endpoints[0]["Id"]
-                else:
-                    text = await resp.text()
-                    raise Exception(f"获取Portainer环境列表失败：{resp.status} {text}")
-        return self._token
+        async def run(inst, ep):
+            async with semaphore:
+                try:
+                    return inst, ep, await asyncio.wait_for(fetch(inst, ep["Id"], timeout), self.fanout_timeout)
+                except asyncio.TimeoutError:
+                    return inst, ep, Exception(f"请求超时（{self.fanout_timeout}秒）")
+                except Exception as e:
+                    return inst, ep, e
 
-    async def _get_endpoint_id(self):
-        """获取默认的Portainer环境ID"""
-        await self._get_portainer_token()
-        if self._endpoint_id is None:
-            raise Exception("无法确定Portainer环境ID")
-        return self._endpoint_id
+        return await asyncio.gather(*(run(inst, ep) for inst, ep in targets))
+
+    async def _list_endpoints(self, instance=None):
+        """并发获取节点列表，instance为空时覆盖所有实例，返回[(实例, 节点列表或异常)]
+
+        只涉及一个实例时获取失败直接抛出异常。
+        """
+        instances = [self._instance(instance)] if instance else list(self._instances.values())
+
+        async def run(inst):
+            try:
+                return inst, await inst.fetch_endpoints()
+            except Exception as e:
+                if len(instances) == 1:
+                    raise
+                return inst, e
+
+        return await asyncio.gather(*(run(inst) for inst in instances))
 
     @filter.llm_tool(name="list_containers")
-    async def list_containers(self, event: AstrMessageEvent, endpoint_id: str = None) -> str:
-        '''获取指定节点上运行的容器列表及其状态信息。在执行前需要先询问用户是否需要查询某个特定节点，除非用户特别指定查询默认节点，否则不执行该工具。
+    @_timed_tool
+    async def list_containers(
+        self,
+        event: AstrMessageEvent,
+        endpoint_id: str = None,
+        all_endpoints: bool = False,
+        compact: bool = False,
+        group_by: str = None,
+        filters: str = None,
+        instance: str = None
+    ) -> str:
+        '''获取指定节点上运行的容器列表及其状态信息。在执行前需要先询问用户是否需要查询某个特定节点，除非用户特别指定查询默认节点或全部节点，否则不执行该工具。容器较多时建议使用compact、group_by或filters缩小输出。
         
         Args:
             endpoint_id (string): 可选，指定节点ID，默认为当前默认节点
+            all_endpoints (boolean): 可选，为true时并发查询所有节点的容器，忽略endpoint_id
+            compact (boolean): 可选，为true时使用紧凑的表格格式输出
+            group_by (string): 可选，按state(运行状态)或image(镜像)分组输出
+            filters (string): 可选，Docker过滤条件，格式如"status=running,name=web,label=app=blog"
+            instance (string): 可选，Portainer实例名称，默认为第一个实例；all_endpoints为true且未指定时查询所有实例
             
         Returns:
             string: 格式化后的容器信息，每行包含:
@@ -226,58 +2485,71 @@ class MyPlugin(Star):
                 - 镜像名称  
                 - 运行状态
                 - 状态详情
+            超出输出长度上限时末尾附带未显示数量的汇总行
         '''
         try:
-            token = await self._get_portainer_token()
-            endpoint = endpoint_id if endpoint_id else self._get_endpoint_id()
-            url = f"{self.portainer_url}/api/endpoints/{endpoint}/docker/containers/json?all=true"
-            
-            async with self.session.get(url, ssl=self.verify_ssl) as resp:
-                if resp.status != 200:
-                    return f"获取容器列表失败：{resp.status}"
-                
-                containers = await resp.json()
-                if not containers:
-                    return "当前没有运行中的容器"
-                
-                # 构建结构化数据并格式化输出
+            inst = self._instance(instance)
+            compact = _as_bool(compact)
+            filters = parse_container_filters(filters)
+
+            if _as_bool(all_endpoints):
+                listed = await self._list_endpoints(instance)
+                multiple = len(listed) > 1
                 result = []
-                for c in containers:
-                    cid = c.get("Id", "")
-                    short_id = cid[:12] if cid else ""
-                    names = c.get("Names", [])
-                    name = names[0] if names else ""
-                    if name.startswith("/"):
-                        name = name[1:]
-                    result.append(
-                        f"容器 {name} (ID: {short_id}): "
-                        f"状态 {c.get('State', '未知')}, "
-                        f"镜像 {c.get('Image', '未知')}, "
-                        f"详情: {c.get('Status', '未知')}"
-                    )
-                
-                return "\n".join(result)
+                targets = []
+                for target, endpoints in listed:
+                    if isinstance(endpoints, Exception):
+                        result.append(f"实例 {target.name}: 获取节点列表失败：{endpoints}")
+                    else:
+                        targets.extend((target, ep) for ep in endpoints)
+                if not targets and not result:
+                    return "当前没有可用节点"
+
+                fetch = lambda target, ep_id, timeout: target.fetch_containers(ep_id, timeout, filters)
+                for target, ep, containers in await self._fan_out(targets, fetch):
+                    header = f"节点 {ep.get('Name', '未知')} (ID: {ep.get('Id', '未知')})"
+                    if multiple:
+                        header = f"[{target.name}] {header}"
+                    if isinstance(containers, Exception):
+                        result.append(f"{header}: 查询失败：{containers}")
+                    elif not containers:
+                        result.append(f"{header}: 没有容器")
+                    else:
+                        result.append(f"{header}: {len(containers)} 个容器")
+                        result.extend(format_containers(containers, compact, group_by))
+                return truncate_lines(result, self.output_max_chars)
+
+            endpoint = endpoint_id if endpoint_id else await inst.get_endpoint_id()
+            containers = await inst.fetch_containers(endpoint, filters=filters)
+            if not containers:
+                return "没有符合条件的容器" if filters else "当前没有运行中的容器"
+            
+            return truncate_lines(format_containers(containers, compact, group_by), self.output_max_chars)
             
         except Exception as e:
             return f"获取容器信息出错: {str(e)}"
 
     @filter.llm_tool(name="start_container")
-    async def start_container(self, event: AstrMessageEvent, container: str, endpoint_id: str = None) -> str:
+    @_timed_tool
+    async def start_container(self, event: AstrMessageEvent, container: str, endpoint_id: str = None, instance: str = None) -> str:
         '''启动指定的Docker容器
         
         Args:
-            container (string): 容器ID或名称
+            container (string): 容器完整名称或ID(ID至少12位)，不接受名称前缀
             endpoint_id (string): 可选，指定节点ID，默认为当前默认节点
+            instance (string): 可选，Portainer实例名称，默认为第一个实例
             
         Returns:
             string: 操作结果信息
         '''
         try:
-            token = await self._get_portainer_token()
-            endpoint = endpoint_id if endpoint_id else self._get_endpoint_id()
-            url = f"{self.portainer_url}/api/endpoints/{endpoint}/docker/containers/{container}/start"
+            inst = self._instance(instance)
+            endpoint = endpoint_id if endpoint_id else await inst.get_endpoint_id()
+            container_id = await inst.resolve_container(endpoint, container, strict=True)
+            url = f"{inst.url}/api/endpoints/{endpoint}/docker/containers/{container_id}/start"
             
-            async with self.session.post(url, ssl=self.verify_ssl) as resp:
+            async with inst.request("POST", url) as resp:
+                inst.cache.invalidate(endpoint, "/containers")
                 if resp.status == 204:
                     return f"容器 {container} 已启动"
                 elif resp.status == 304:
@@ -290,33 +2562,37 @@ class MyPlugin(Star):
             return f"启动容器出错: {str(e)}"
 
     @filter.llm_tool(name="stop_container")
-    async def stop_container(self, event: AstrMessageEvent, container: str, endpoint_id: str = None) -> str:
+    @_timed_tool
+    async def stop_container(self, event: AstrMessageEvent, container: str, endpoint_id: str = None, instance: str = None) -> str:
         '''停止指定的Docker容器
         
         Args:
-            container (string): 容器ID或名称
+            container (string): 容器完整名称或ID(ID至少12位)，不接受名称前缀
             endpoint_id (string): 可选，指定节点ID，默认为当前默认节点
+            instance (string): 可选，Portainer实例名称，默认为第一个实例
             
         Returns:
             string: 操作结果信息
         '''
         try:
-            token = await self._get_portainer_token()
-            endpoint = endpoint_id if endpoint_id else self._get_endpoint_id()
+            inst = self._instance(instance)
+            endpoint = endpoint_id if endpoint_id else await inst.get_endpoint_id()
             
-            # 先获取容器状态
-            status_url = f"{self.portainer_url}/api/endpoints/{endpoint}/docker/containers/{container}/json"
-            async with self.session.get(status_url, ssl=self.verify_ssl) as status_resp:
-                if status_resp.status != 200:
-                    return f"获取容器状态失败：{status_resp.status}"
-                    
-                container_info = await status_resp.json()
-                if not container_info["State"]["Running"]:
-                    return f"容器 {container} 已处于停止状态"
+            container_id = await inst.resolve_container(endpoint, container, strict=True)
+
+            # 先获取容器状态，后台状态模型中已知时省去inspect请求
+            running = inst.known_running(endpoint, container_id)
+            if running is None:
+                container_info = await inst.inspect_container(endpoint, container_id)
+                running = container_info["State"]["Running"]
+            if not running:
+                return f"容器 {container} 已处于停止状态"
             
             # 停止容器
-            stop_url = f"{self.portainer_url}/api/endpoints/{endpoint}/docker/containers/{container}/stop"
-            async with self.session.post(stop_url, ssl=self.verify_ssl) as resp:
+            # Docker在容器的停止宽限期结束后才响应，数据库等容器可能超过快速调用的读取超时
+            stop_url = f"{inst.url}/api/endpoints/{endpoint}/docker/containers/{container_id}/stop"
+            async with inst.request("POST", stop_url, timeout=self.slow_timeout) as resp:
+                inst.cache.invalidate(endpoint, "/containers")
                 if resp.status == 204:
                     return f"容器 {container} 已停止"
                 elif resp.status == 304:
@@ -328,92 +2604,766 @@ class MyPlugin(Star):
         except Exception as e:
             return f"停止容器出错: {str(e)}"
 
+    def _select_containers(self, index, selectors):
+        """按完整名称、完整ID(或至少12位的ID前缀)或标签选择器(label:键=值)从容器索引中选出容器
+
+        返回([(选择器, 容器)], [(未匹配的选择器, 原因)])，同一容器只出现一次。
+        """
+        selected = {}
+        missing = []
+        for selector in selectors:
+            if selector.startswith("label:"):
+                key, _, value = selector[len("label:"):].partition("=")
+                matches = index.with_label(key, value or None)
+            else:
+                matches, candidates = index.resolve(selector, strict=True)
+                if len(matches) > 1:
+                    missing.append((selector, "匹配到多个容器"))
+                    continue
+                if not matches and candidates:
+                    missing.append((selector, f"没有完全匹配的容器，未执行操作，您是否指：{'、'.join(candidates)}"))
+                    continue
+            if not matches:
+                missing.append((selector, "未找到容器"))
+            for c in matches:
+                selected.setdefault(c["Id"], (selector, c))
+        return list(selected.values()), missing
+
+    async def _post_container_action(self, inst, endpoint, container_id, action):
+        """对容器执行start/stop/restart，返回(状态码, 错误信息)"""
+        url = f"{inst.url}/api/endpoints/{endpoint}/docker/containers/{container_id}/{action}"
+        # Docker在容器的停止宽限期(StopTimeout)结束后才响应stop/restart，可能超过快速调用的读取超时
+        kwargs = {"timeout": self.slow_timeout} if action in ("stop", "restart") else {}
+        async with inst.request("POST", url, **kwargs) as resp:
+            error_msg = "" if resp.status in (204, 304) else (await resp.text() or "Unknown error")
+            return resp.status, error_msg
+
+    @filter.llm_tool(name="batch_container_action")
+    @_timed_tool
+    async def batch_container_action(
+        self,
+        event: AstrMessageEvent,
+        action: str,
+        containers: list,
+        endpoint_id: str = None,
+        instance: str = None
+    ) -> str:
+        '''批量启动、停止或重启多个Docker容器，并发执行并汇总结果
+        
+        Args:
+            action (string): 操作类型，可选值为start、stop、restart
+            containers (array[string]): 容器完整名称、ID(至少12位)或标签选择器列表，标签选择器格式为label:键=值，例如label:com.docker.compose.project=blog
+            endpoint_id (string): 可选，指定节点ID，默认为当前默认节点
+            instance (string): 可选，Portainer实例名称，默认为第一个实例
+            
+        Returns:
+            string: 汇总的操作结果，每个容器一行
+        '''
+        try:
+            action = (action or "").strip().lower()
+            if action not in ("start", "stop", "restart"):
+                return f"不支持的操作：{action}，可选值为start、stop、restart"
+            if isinstance(containers, str):
+                containers = [c for c in containers.replace(",", " ").split() if c]
+            if not containers:
+                return "未指定任何容器"
+
+            inst = self._instance(instance)
+            endpoint = endpoint_id if endpoint_id else await inst.get_endpoint_id()
+
+            # 一次列表查询（可命中缓存）同时完成名称解析和状态判断，省去逐个容器的inspect
+            await inst.fetch_containers(endpoint)
+            selected, missing = self._select_containers(inst.index(endpoint), containers)
+            semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+            async def run(selector, c):
+                name = _container_name(c) or selector
+                state = c.get("State")
+                if action == "start" and state == "running":
+                    return "skipped", f"{name}: 已在运行状态"
+                if action == "stop" and state in _STOPPED_STATES:
+                    return "skipped", f"{name}: 已处于停止状态"
+                async with semaphore:
+                    try:
+                        status, error_msg = await self._post_container_action(inst, endpoint, c["Id"], action)
+                    except Exception as e:
+                        return "failed", f"{name}: 出错 {e}"
+                if status == 204:
+                    return "ok", f"{name}: 已{_ACTION_NAMES[action]}"
+                if status == 304:
+                    return "skipped", f"{name}: 状态未变化"
+                return "failed", f"{name}: 失败 {status} {error_msg}"
+
+            results = await asyncio.gather(*(run(selector, c) for selector, c in selected))
+            if selected:
+                inst.cache.invalidate(endpoint, "/containers")
+
+            counts = {"ok": 0, "skipped": 0, "failed": len(missing)}
+            lines = []
+            for outcome, line in results:
+                counts[outcome] += 1
+                lines.append(f"- {line}")
+            lines.extend(f"- {selector}: {reason}" for selector, reason in missing)
+            header = f"批量{_ACTION_NAMES.get(action, action)}完成：成功 {counts['ok']}，跳过 {counts['skipped']}，失败 {counts['failed']}"
+            return "\n".join([header] + lines)
+
+        except Exception as e:
+            return f"批量操作容器出错: {str(e)}"
+
+    @filter.llm_tool(name="container_stats")
+    @_timed_tool
+    async def container_stats(
+        self,
+        event: AstrMessageEvent,
+        endpoint_id: str = None,
+        sort_by: str = "cpu",
+        top_n: int = 10,
+        instance: str = None
+    ) -> str:
+        '''获取节点上所有运行中容器的资源占用并排序，用于回答"哪个容器最占CPU/内存"等问题
+        
+        Args:
+            endpoint_id (string): 可选，指定节点ID，默认为当前默认节点
+            sort_by (string): 可选，排序依据，可选值为cpu、memory、network、io(默认cpu)
+            top_n (number): 可选，返回排名前几的容器(默认10)
+            instance (string): 可选，Portainer实例名称，默认为第一个实例
+            
+        Returns:
+            string: 按资源占用排序的容器列表，包含CPU百分比(附采样间隔)、内存、网络和磁盘IO及各项速率
+        '''
+        try:
+            sort_keys = {
+                "cpu": lambda s: -1.0 if s.cpu_percent is None else s.cpu_percent,
+                "memory": lambda s: s.mem_usage,
+                "network": lambda s: s.net_rx + s.net_tx,
+                "io": lambda s: s.blk_read + s.blk_write,
+            }
+            sort_by = (sort_by or "cpu").strip().lower()
+            if sort_by not in sort_keys:
+                return f"不支持的排序依据：{sort_by}，可选值为cpu、memory、network、io"
+
+            inst = self._instance(instance)
+            endpoint = endpoint_id if endpoint_id else await inst.get_endpoint_id()
+            containers = await inst.fetch_containers(endpoint, filters={"status": ["running"]})
+            if not containers:
+                return "当前没有运行中的容器"
+
+            semaphore = asyncio.Semaphore(self.stats_concurrency)
+
+            async def sample(c):
+                # 不带one-shot时Docker会在每个请求里等待约1秒采集第二个样本，
+                # one-shot立即返回，CPU占用改为由本插件的两次采样计算
+                url = f"{inst.url}/api/endpoints/{endpoint}/docker/containers/{c['Id']}/stats"
+                async with semaphore:
+                    try:
+                        async with inst.request("GET", url, params={"stream": "false", "one-shot": "true"}) as resp:
+                            if resp.status != 200:
+                                return c, f"{resp.status}"
+                            return c, ContainerStats(c["Id"], _container_name(c), await resp.json())
+                    except Exception as e:
+                        return c, str(e)
+
+            # 整体时间预算：个别节点或容器响应慢时返回已完成的部分，其余列为超时
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.stats_timeout
+
+            async def sample_round(targets):
+                tasks = {asyncio.ensure_future(sample(c)): c for c in targets}
+                done, pending = await asyncio.wait(tasks, timeout=max(deadline - loop.time(), 0))
+                for task in pending:
+                    task.cancel()
+                return [task.result() for task in done], [tasks[task] for task in pending]
+
+            # 过旧的采样算出的是长时间的平均值，不能当作当前占用
+            now = time.monotonic()
+            previous = {
+                cid: s for cid, s in self._stats_samples.get((inst.name, str(endpoint)), {}).items()
+                if now - s.time <= self.stats_sample_max_age
+            }
+            samples = {}
+            bases = {}  # 容器ID -> 计算CPU占用和速率所比较的采样
+            errors = []
+            results, timed_out = await sample_round(containers)
+            for c, result in results:
+                if isinstance(result, ContainerStats):
+                    samples[c["Id"]] = result
+                    if c["Id"] in previous:
+                        bases[c["Id"]] = previous[c["Id"]]
+                        result.apply_previous(previous[c["Id"]])
+                else:
+                    errors.append(f"{_container_name(c)}: 采样失败 {result}")
+
+            # 没有近期采样的容器间隔stats_cpu_window秒再采样一轮，第一次查询也能得出CPU占用
+            first = {cid: s for cid, s in samples.items() if s.cpu_percent is None}
+            if first:
+                wait = max(s.time for s in first.values()) + self.stats_cpu_window - time.monotonic()
+                if deadline - loop.time() > max(wait, 0):
+                    await asyncio.sleep(max(wait, 0))
+                    results, _ = await sample_round([c for c in containers if c["Id"] in first])
+                    for c, result in results:
+                        if isinstance(result, ContainerStats):
+                            result.apply_previous(first[c["Id"]])
+                            samples[c["Id"]] = result
+                            bases[c["Id"]] = first[c["Id"]]
+
+            if timed_out:
+                names = sorted(_container_name(c) for c in timed_out)
+                more = "等" if len(names) > 10 else ""
+                errors.append(f"{len(names)} 个容器在 {self.stats_timeout} 秒内未完成采样：{'、'.join(names[:10])}{more}")
+            # 超时的容器保留上一次的采样供下次计算，但不计入本次排名
+            self._stats_samples[(inst.name, str(endpoint))] = dict(
+                {c["Id"]: previous[c["Id"]] for c in timed_out if c["Id"] in previous}, **samples
+            )
+
+            ranked = sorted(samples.values(), key=sort_keys[sort_by], reverse=True)
+            top_n = max(1, int(top_n or 10))
+            header = f"运行中容器 {len(containers)} 个，按{sort_by}排序前 {min(top_n, len(ranked))} 个"
+            unknown = sum(1 for s in ranked if s.cpu_percent is None)
+            if sort_by == "cpu" and unknown:
+                header += f"（{unknown} 个容器未能在时间预算内得出CPU占用，排在最后）"
+            lines = [header + ":"]
+            lines.extend(f"{i}. {s.format(bases.get(s.id))}" for i, s in enumerate(ranked[:top_n], 1))
+            lines.extend(errors)
+            return truncate_lines(lines, self.output_max_chars)
+
+        except Exception as e:
+            return f"获取容器资源占用出错: {str(e)}"
+
+    async def _pull_image(self, inst, endpoint, image_name, progress):
+        """在节点上拉取镜像，逐行解析NDJSON进度写入progress，出现error事件立即中止"""
+        url = f"{inst.url}/api/endpoints/{endpoint}/docker/images/create"
+        if "@" in image_name:
+            # 按摘要固定的引用(如postgres:15@sha256:...)整体作为fromImage，不能再拆出标签
+            params = {"fromImage": image_name}
+        else:
+            # 分离镜像名和标签（仓库地址可能带端口，只取最后一个/之后的冒号）
+            img, sep, tag = image_name.rpartition(":")
+            if not sep or "/" in tag:
+                img, tag = image_name, "latest"
+            params = {"fromImage": img, "tag": tag}
+
+        async with inst.request("POST", url, params=params, timeout=self.slow_timeout) as resp:
+            inst.cache.invalidate(endpoint, "/images")
+            if resp.status != 200:
+                text = await resp.text()
+                raise Exception(f"拉取镜像失败：{resp.status} {text}")
+
+            last_report = time.monotonic()
+            async for line in resp.content:
+                line = line.strip()
+                if not line.startswith(b"{"):
+                    continue
+                try:
+                    progress.feed(json.loads(line))
+                except ValueError:
+                    continue
+                if progress.error:
+                    return progress
+                if time.monotonic() - last_report >= 5:
+                    last_report = time.monotonic()
+                    logger.info(f"正在拉取镜像 {image_name}：{progress.summary()}")
+        return progress
+
     @filter.llm_tool(name="pull_image")
-    async def pull_image(self, event: AstrMessageEvent, image_name: str, endpoint_id: str = None) -> str:
+    @_timed_tool
+    async def pull_image(self, event: AstrMessageEvent, image_name: str, endpoint_id: str = None, instance: str = None) -> str:
         '''拉取Docker镜像到指定节点
         
         Args:
             image_name (string): 镜像名称(格式如'nginx:latest'或'ubuntu')
             endpoint_id (string): 可选，指定节点ID，默认为当前默认节点
+            instance (string): 可选，Portainer实例名称，默认为第一个实例
             
         Returns:
-            string: 操作结果信息
+            string: 操作结果信息，包含各层下载/解压进度汇总
         '''
         try:
-            token = await self._get_portainer_token()
-            endpoint = endpoint_id if endpoint_id else self._get_endpoint_id()
-            
-            # 分离镜像名和标签
-            if ":" in image_name:
-                img, tag = image_name.split(":", 1)
-            else:
-                img, tag = image_name, "latest"
+            inst = self._instance(instance)
+            endpoint = endpoint_id if endpoint_id else await inst.get_endpoint_id()
+            progress = await self._pull_image(inst, endpoint, image_name, ImagePullProgress())
+            if progress.error:
+                return f"拉取镜像失败：{progress.error}（{progress.summary()}）"
+            if progress.status:
+                return f"镜像拉取结果：{progress.status}（{progress.summary()}）"
+            return f"镜像 {image_name} 拉取成功（{progress.summary()}）"
                 
-            url = f"{self.portainer_url}/api/endpoints/{endpoint}/docker/images/create?fromImage={img}&tag={tag}"
+        except Exception as e:
+            return f"拉取镜像出错: {str(e)}"
+
+    async def _notify(self, event, text):
+        """向会话发送一条进度消息并写入日志，发送失败不影响工具结果"""
+        logger.info(text)
+        if event is None:
+            return
+        try:
+            await event.send(event.plain_result(text))
+        except Exception as e:
+            logger.debug(f"发送进度消息失败：{e}")
+
+    async def _fetch_stacks(self, inst):
+        return await inst.cached_get(None, "/api/stacks", error="获取stack列表失败")
+
+    async def _find_stack(self, inst, ref):
+        """按ID或名称查找stack，名称不区分大小写"""
+        stacks = await self._fetch_stacks(inst)
+        ref = str(ref).strip()
+        for stack in stacks:
+            if str(stack.get("Id")) == ref:
+                return stack
+        matches = [st for st in stacks if st.get("Name", "").lower() == ref.lower()]
+        if len(matches) == 1:
+            return matches[0]
+        if len(matches) > 1:
+            ids = "、".join(f"{st['Id']}(节点 {st.get('EndpointId')})" for st in matches)
+            raise Exception(f"{ref} 匹配到多个stack：{ids}，请使用stack ID")
+        candidates = difflib.get_close_matches(ref, [st.get("Name", "") for st in stacks], n=3, cutoff=0.6)
+        hint = f"，您是否指：{'、'.join(candidates)}" if candidates else ""
+        raise Exception(f"未找到stack {ref}{hint}")
+
+    async def _stack_file(self, inst, stack_id):
+        data = await inst.cached_get(None, f"/api/stacks/{stack_id}/file", error="获取stack文件失败")
+        return data.get("StackFileContent", "")
+
+    async def _deploy_stack(self, inst, stack, env, prune=False, pull_image=False):
+        """用给定的环境变量重新部署stack，git类stack走git重新部署接口"""
+        if stack.get("GitConfig"):
+            url = f"{inst.url}/api/stacks/{stack['Id']}/git/redeploy"
+            body = {
+                "Env": env,
+                "Prune": prune,
+                "PullImage": pull_image,
+                "RepositoryReferenceName": stack["GitConfig"].get("ReferenceName", ""),
+                "RepositoryAuthentication": bool(stack["GitConfig"].get("Authentication")),
+            }
+        else:
+            url = f"{inst.url}/api/stacks/{stack['Id']}"
+            body = {
+                "StackFileContent": await self._stack_file(inst, stack["Id"]),
+                "Env": env,
+                "Prune": prune,
+                "PullImage": pull_image,
+            }
+        params = {"endpointId": stack["EndpointId"]}
+        async with inst.request("PUT", url, params=params, json=body, timeout=self.slow_timeout) as resp:
+            # 部署会同时改变stack、容器和镜像，直接清空该实例的缓存
+            inst.cache.invalidate()
+            if resp.status != 200:
+                error_msg = await resp.text() or "Unknown error"
+                raise Exception(f"重新部署失败：{resp.status} {error_msg}")
+
+    @filter.llm_tool(name="list_stacks")
+    @_timed_tool
+    async def list_stacks(self, event: AstrMessageEvent, endpoint_id: str = None, instance: str = None) -> str:
+        '''获取Portainer中的stack(compose/swarm应用)列表
+        
+        Args:
+            endpoint_id (string): 可选，只列出指定节点上的stack，默认列出全部
+            instance (string): 可选，Portainer实例名称，默认为第一个实例
+            
+        Returns:
+            string: 每行一个stack，包含ID、名称、类型、所在节点、状态和环境变量数量
+        '''
+        try:
+            inst = self._instance(instance)
+            stacks = await self._fetch_stacks(inst)
+            if endpoint_id:
+                stacks = [st for st in stacks if str(st.get("EndpointId")) == str(endpoint_id)]
+            if not stacks:
+                return "当前没有stack"
+
+            lines = []
+            for st in sorted(stacks, key=lambda st: st.get("Name", "")):
+                git = st.get("GitConfig")
+                source = f", git: {git.get('URL', '')}@{git.get('ReferenceName', '')}" if git else ""
+                lines.append(
+                    f"ID: {st.get('Id')}, 名称: {st.get('Name', '未知')}, "
+                    f"类型: {_STACK_TYPES.get(st.get('Type'), '未知')}, 节点: {st.get('EndpointId')}, "
+                    f"状态: {_STACK_STATUS.get(st.get('Status'), '未知')}, "
+                    f"环境变量: {len(st.get('Env') or [])} 个{source}"
+                )
+            return truncate_lines(lines, self.output_max_chars)
+
+        except Exception as e:
+            return f"获取stack列表出错: {str(e)}"
+
+    @filter.llm_tool(name="redeploy_stack")
+    @_timed_tool
+    async def redeploy_stack(
+        self,
+        event: AstrMessageEvent,
+        stack: str,
+        pull: bool = True,
+        prune: bool = False,
+        instance: str = None
+    ) -> str:
+        '''重新部署stack以更新其中的所有服务。pull为true时先在stack所在节点上并发拉取compose文件中的全部镜像，全部成功后一次性重新部署，用于代替逐个pull_image和启停容器。swarm stack不预拉取，由Portainer在部署时拉取。
+        
+        Args:
+            stack (string): stack名称或ID
+            pull (boolean): 可选，是否先拉取最新镜像(默认true)
+            prune (boolean): 可选，是否删除compose文件中已不存在的服务(默认false)
+            instance (string): 可选，Portainer实例名称，默认为第一个实例
             
-            async with self.session.post(url, ssl=self.verify_ssl) as resp:
-                if resp.status == 200:
-                    text = (await resp.text()).strip()
-                    if not text:
-                        return f"镜像 {image_name} 拉取成功"
-                        
-                    lines = text.splitlines()
-                    last_line = lines[-1].strip() if lines else ""
-                    
-                    if last_line.startswith("{"):
+        Returns:
+            string: 部署结果，包含每个镜像的拉取结果
+        '''
+        try:
+            inst = self._instance(instance)
+            st = await self._find_stack(inst, stack)
+            name = st.get("Name", stack)
+            if st.get("Type") == 3:
+                return f"stack {name} 是kubernetes应用，暂不支持重新部署"
+            endpoint = st["EndpointId"]
+            env = st.get("Env") or []
+
+            lines = []
+            pull_on_deploy = False
+            if _as_bool(pull) and st.get("Type") == 1:
+                # swarm stack的服务会调度到集群中任意节点，只在管理节点预拉取没有意义，交给Portainer部署时拉取
+                pull_on_deploy = True
+                lines.append("- swarm stack：镜像由Portainer在部署时拉取")
+            elif _as_bool(pull):
+                content = await self._stack_file(inst, st["Id"])
+                images, unresolved = compose_images(content, {e["name"]: e["value"] for e in env})
+                await self._notify(event, f"stack {name}：开始并发拉取 {len(images)} 个镜像")
+                progresses = {image: ImagePullProgress() for image in images}
+                semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+                async def pull_one(image):
+                    async with semaphore:
                         try:
-                            last_json = json.loads(last_line)
-                            status_msg = last_json.get("status") or last_json.get("error")
-                            if status_msg:
-                                return f"镜像拉取结果：{status_msg}"
-                        except:
-                            pass
-                            
-                    return f"镜像 {image_name} 拉取成功"
-                else:
-                    text = await resp.text()
-                    raise Exception(f"拉取镜像失败：{resp.status} {text}")
-                
+                            await self._pull_image(inst, endpoint, image, progresses[image])
+                        except Exception as e:
+                            progresses[image].error = str(e)
+
+                await asyncio.gather(*(pull_one(image) for image in images))
+                for image, progress in progresses.items():
+                    outcome = f"失败 {progress.error}" if progress.error else "已拉取"
+                    lines.append(f"- {image}: {outcome}（{progress.summary()}）")
+                # 含未解析变量的镜像交给Portainer在部署时拉取
+                lines.extend(f"- {image}: 含未解析的变量，部署时由Portainer拉取" for image in unresolved)
+                pull_on_deploy = bool(unresolved)
+                failed = sum(1 for progress in progresses.values() if progress.error)
+                if failed:
+                    return "\n".join([f"stack {name}：{failed} 个镜像拉取失败，未重新部署"] + lines)
+                await self._notify(event, f"stack {name}：镜像已就绪，正在重新部署")
+
+            await self._deploy_stack(inst, st, env, _as_bool(prune), pull_on_deploy)
+            return "\n".join([f"stack {name} 已重新部署（节点 {endpoint}）"] + lines)
+
         except Exception as e:
-            return f"拉取镜像出错: {str(e)}"
+            return f"重新部署stack出错: {str(e)}"
+
+    @filter.llm_tool(name="update_stack_env")
+    @_timed_tool
+    async def update_stack_env(
+        self,
+        event: AstrMessageEvent,
+        stack: str,
+        env: list = None,
+        remove: list = None,
+        pull: bool = False,
+        instance: str = None
+    ) -> str:
+        '''修改stack的环境变量并重新部署使其生效
+        
+        Args:
+            stack (string): stack名称或ID
+            env (array[string]): 可选，要新增或修改的环境变量，每项格式为KEY=VALUE
+            remove (array[string]): 可选，要删除的环境变量名
+            pull (boolean): 可选，重新部署时是否拉取最新镜像(默认false)
+            instance (string): 可选，Portainer实例名称，默认为第一个实例
+            
+        Returns:
+            string: 变更的变量名（不显示变量值）和部署结果
+        '''
+        try:
+            updates = parse_env_assignments(env)
+            if isinstance(remove, str):
+                remove = remove.replace(",", " ").split()
+            removals = {str(key).strip() for key in remove or [] if str(key).strip()}
+            if not updates and not removals:
+                return "未指定要修改的环境变量"
+
+            inst = self._instance(instance)
+            st = await self._find_stack(inst, stack)
+            name = st.get("Name", stack)
+            current = {e["name"]: e["value"] for e in st.get("Env") or []}
+            added = [key for key in updates if key not in current]
+            changed = [key for key in updates if key in current and current[key] != updates[key]]
+            removed = [key for key in sorted(removals) if key in current]
+            if not added and not changed and not removed:
+                return f"stack {name} 的环境变量没有变化，未重新部署"
+
+            merged = {key: value for key, value in current.items() if key not in removals}
+            merged.update(updates)
+            env_list = [{"name": key, "value": value} for key, value in merged.items()]
+            await self._deploy_stack(inst, st, env_list, pull_image=_as_bool(pull))
+
+            parts = []
+            for label, keys in (("新增", added), ("修改", changed), ("删除", removed)):
+                if keys:
+                    parts.append(f"{label} {'、'.join(keys)}")
+            return f"stack {name} 的环境变量已更新并重新部署：{'；'.join(parts)}"
+
+        except Exception as e:
+            return f"更新stack环境变量出错: {str(e)}"
+
+    async def _image_targets(self, endpoint_id=None, all_endpoints=False, instance=None):
+        """确定镜像相关工具要查询的节点，返回([(实例, 节点)], 获取节点列表失败的信息, 是否涉及多个实例)"""
+        if all_endpoints:
+            listed = await self._list_endpoints(instance)
+            targets = [(inst, ep) for inst, endpoints in listed if not isinstance(endpoints, Exception) for ep in endpoints]
+            errors = [f"实例 {inst.name}: 获取节点列表失败：{endpoints}" for inst, endpoints in listed if isinstance(endpoints, Exception)]
+            return targets, errors, len(listed) > 1
+
+        inst = self._instance(instance)
+        endpoint = endpoint_id if endpoint_id else await inst.get_endpoint_id()
+        endpoints = await inst.fetch_endpoints()
+        ep = next((ep for ep in endpoints if str(ep.get("Id")) == str(endpoint)), {"Id": endpoint, "Name": str(endpoint)})
+        return [(inst, ep)], [], False
+
+    async def _collect_images(self, targets, multiple, fresh=False):
+        """并发获取各节点的镜像列表和磁盘占用，返回(ImageInventory, {节点: (实例, 节点)}, 失败信息)"""
+        async def fetch(inst, ep_id, timeout):
+            if fresh:
+                inst.cache.invalidate(ep_id, "/images")
+                inst.cache.invalidate(ep_id, "/system")
+            return await asyncio.gather(
+                inst.cached_get(ep_id, "/images/json", timeout=timeout, error="获取镜像列表失败"),
+                inst.cached_get(ep_id, "/system/df", timeout=timeout, error="获取磁盘占用失败"),
+            )
+
+        inventory = ImageInventory()
+        nodes = {}
+        errors = []
+        for inst, ep, result in await self._fan_out(targets, fetch):
+            node = f"{ep.get('Name', '未知')} (ID: {ep.get('Id')})"
+            if multiple:
+                node = f"{inst.name}/{node}"
+            if isinstance(result, Exception):
+                errors.append(f"节点 {node}: 查询失败({result})")
+                continue
+            inventory.add(node, *result)
+            nodes[node] = (inst, ep)
+        return inventory, nodes, errors
+
+    @filter.llm_tool(name="image_inventory")
+    @_timed_tool
+    async def image_inventory(
+        self,
+        event: AstrMessageEvent,
+        endpoint_id: str = None,
+        all_endpoints: bool = True,
+        top_n: int = 10,
+        instance: str = None
+    ) -> str:
+        '''并发统计各节点的镜像和磁盘占用，用于回答"哪个节点磁盘快满了"等问题。会按镜像摘要找出多个节点上重复存储的镜像，以及悬空/未使用镜像的可回收空间。
+        
+        Args:
+            endpoint_id (string): 可选，只统计指定节点，需同时把all_endpoints设为false
+            all_endpoints (boolean): 可选，是否统计所有节点(默认true)
+            top_n (number): 可选，重复镜像和可回收镜像各列出前几个(默认10)
+            instance (string): 可选，Portainer实例名称，默认统计所有实例
+            
+        Returns:
+            string: 每个节点的镜像/容器/卷/构建缓存占用与可回收空间（按总占用排序），以及重复镜像和可回收镜像列表
+        '''
+        try:
+            targets, errors, multiple = await self._image_targets(endpoint_id, _as_bool(all_endpoints), instance)
+            if not targets and not errors:
+                return "当前没有可用节点"
+            inventory, nodes, fetch_errors = await self._collect_images(targets, multiple)
+            errors.extend(fetch_errors)
+            top_n = max(1, int(top_n or 10))
+
+            def total(summary):
+                return summary["image_bytes"] + summary["container_bytes"] + summary["volume_bytes"] + summary["cache_bytes"]
+
+            reclaimable = sum(summary["reclaimable"] for summary in inventory.nodes.values())
+            lines = [
+                f"镜像清单：{len(nodes)} 个节点，{len(inventory.by_digest)} 个不同镜像（按摘要去重），"
+                f"共可回收 {_format_bytes(reclaimable)}"
+            ]
+            for node, summary in sorted(inventory.nodes.items(), key=lambda item: total(item[1]), reverse=True):
+                lines.append(
+                    f"{node}: 共 {_format_bytes(total(summary))}，镜像 {summary['images']} 个 {_format_bytes(summary['image_bytes'])}，"
+                    f"容器可写层 {_format_bytes(summary['container_bytes'])}，卷 {_format_bytes(summary['volume_bytes'])}，"
+                    f"构建缓存 {_format_bytes(summary['cache_bytes'])}；悬空 {len(summary['dangling'])} 个，"
+                    f"未使用 {len(summary['unused'])} 个，可回收 {_format_bytes(summary['reclaimable'])}"
+                )
+
+            duplicates = inventory.duplicates()
+            if duplicates:
+                lines.append(f"多节点重复存储的镜像（{len(duplicates)} 个）:")
+                for digest, copies, wasted in duplicates[:top_n]:
+                    image = next(iter(copies.values()))
+                    lines.append(
+                        f"- {_image_label(image)} {digest[:19]}: {len(copies)} 个节点，重复占用 {_format_bytes(wasted)}"
+                    )
+
+            unused = [
+                (node, img) for node in inventory.nodes
+                for img in inventory.candidates(node, dangling_only=False)
+            ]
+            if unused:
+                unused.sort(key=lambda item: item[1].get("Size") or 0, reverse=True)
+                lines.append(f"可回收的镜像（{len(unused)} 个，可使用prune_images清理）:")
+                for node, img in unused[:top_n]:
+                    kind = "未使用" if _image_tags(img) else "悬空"
+                    lines.append(f"- {node}: {_image_label(img)} {kind} {_format_bytes(img.get('Size'))}")
+
+            lines.extend(errors)
+            return truncate_lines(lines, self.output_max_chars)
+
+        except Exception as e:
+            return f"获取镜像清单出错: {str(e)}"
+
+    @filter.llm_tool(name="prune_images")
+    @_timed_tool
+    async def prune_images(
+        self,
+        event: AstrMessageEvent,
+        endpoint_id: str = None,
+        all_endpoints: bool = False,
+        dangling_only: bool = True,
+        confirm: str = None,
+        instance: str = None
+    ) -> str:
+        '''清理节点上未被容器使用的镜像。不带confirm调用时只预览将删除的镜像和可回收空间并返回确认码，必须把预览告知用户并得到明确同意后，才能带上确认码再次调用以真正删除。
+        
+        Args:
+            endpoint_id (string): 可选，指定节点ID，默认为当前默认节点
+            all_endpoints (boolean): 可选，为true时清理所有节点，忽略endpoint_id
+            dangling_only (boolean): 可选，为true(默认)时只清理悬空镜像，为false时清理所有未被容器使用的镜像
+            confirm (string): 可选，预览返回的确认码，只有用户同意后才能填写
+            instance (string): 可选，Portainer实例名称，默认为第一个实例；all_endpoints为true且未指定时覆盖所有实例
+            
+        Returns:
+            string: 预览时为待删除镜像列表和确认码，执行后为各节点删除的镜像层数和回收的空间
+        '''
+        try:
+            dangling_only = _as_bool(dangling_only)
+            targets, errors, multiple = await self._image_targets(endpoint_id, _as_bool(all_endpoints), instance)
+            # 执行前重新获取清单，确认码只对预览时看到的镜像集合有效
+            inventory, nodes, fetch_errors = await self._collect_images(targets, multiple, fresh=bool(confirm))
+            errors.extend(fetch_errors)
+            kind = "悬空" if dangling_only else "未使用"
+            plan = {node: inventory.candidates(node, dangling_only) for node in nodes}
+            plan = {node: images for node, images in plan.items() if images}
+            if not plan:
+                return "\n".join([f"没有可清理的{kind}镜像"] + errors)
+
+            digest = hashlib.sha256(kind.encode())
+            for node in sorted(plan):
+                inst, ep = nodes[node]
+                digest.update(f"{inst.name}/{ep.get('Id')}:".encode())
+                digest.update(",".join(sorted(img.get("Id", "") for img in plan[node])).encode())
+            code = digest.hexdigest()[:8]
+
+            if str(confirm or "").strip() != code:
+                count = sum(len(images) for images in plan.values())
+                size = sum(_image_reclaimable(img) for images in plan.values() for img in images)
+                lines = [
+                    f"预览：将在 {len(plan)} 个节点上删除 {count} 个{kind}镜像，预计回收 {_format_bytes(size)}",
+                    f"用户同意后，以confirm={code}再次调用即可执行删除",
+                ]
+                if confirm:
+                    lines.insert(0, "确认码已失效：预览后镜像发生了变化，请重新向用户确认")
+                for node, images in plan.items():
+                    lines.extend(f"- {node}: {_image_label(img)} {_format_bytes(img.get('Size'))}" for img in images)
+                lines.extend(errors)
+                return truncate_lines(lines, self.output_max_chars)
+
+            filters = json.dumps({"dangling": ["true" if dangling_only else "false"]})
+            semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+            async def prune(node):
+                inst, ep = nodes[node]
+                url = f"{inst.url}/api/endpoints/{ep['Id']}/docker/images/prune"
+                async with semaphore:
+                    try:
+                        async with inst.request("POST", url, params={"filters": filters}, timeout=self.slow_timeout) as resp:
+                            inst.cache.invalidate(ep["Id"], "/images")
+                            inst.cache.invalidate(ep["Id"], "/system")
+                            if resp.status != 200:
+                                error_msg = await resp.text() or "Unknown error"
+                                return f"{node}: 失败 {resp.status} {error_msg}", 0
+                            data = await resp.json()
+                    except Exception as e:
+                        return f"{node}: 出错 {e}", 0
+                deleted = sum(1 for item in data.get("ImagesDeleted") or [] if item.get("Deleted"))
+                reclaimed = data.get("SpaceReclaimed") or 0
+                return f"{node}: 删除 {deleted} 个镜像层，回收 {_format_bytes(reclaimed)}", reclaimed
+
+            results = await asyncio.gather(*(prune(node) for node in plan))
+            lines = [f"清理{kind}镜像完成：共回收 {_format_bytes(sum(reclaimed for _, reclaimed in results))}"]
+            lines.extend(f"- {line}" for line, _ in results)
+            lines.extend(errors)
+            return "\n".join(lines)
+
+        except Exception as e:
+            return f"清理镜像出错: {str(e)}"
 
     @filter.llm_tool(name="list_endpoints")
-    async def list_endpoints(self, event: AstrMessageEvent) -> str:
+    @_timed_tool
+    async def list_endpoints(self, event: AstrMessageEvent, with_containers: bool = False, instance: str = None) -> str:
         '''获取Portainer可用节点列表
         
+        Args:
+            with_containers (boolean): 可选，为true时并发统计每个节点的容器数量(运行中/总数)
+            instance (string): 可选，只列出指定Portainer实例的节点，默认列出所有实例
+            
         Returns:
             string: 格式化后的节点信息，每行包含:
                 - 节点ID
                 - 节点名称
                 - 节点URL
                 - GPU信息(如果有)
+                - 容器数量(如果请求)
         '''
         try:
-            token = await self._get_portainer_token()
-            url = f"{self.portainer_url}/api/endpoints"
-            
-            async with self.session.get(url, ssl=self.verify_ssl) as resp:
-                if resp.status != 200:
-                    return f"获取节点列表失败：{resp.status}"
-                    
-                endpoints = await resp.json()
-                if not endpoints:
-                    return "当前没有可用节点"
-                    
-                result = ["可用节点列表:"]
+            listed = await self._list_endpoints(instance)
+            multiple = len(listed) > 1
+            targets = [
+                (inst, ep) for inst, endpoints in listed
+                if not isinstance(endpoints, Exception) for ep in endpoints
+            ]
+            if not targets and not multiple:
+                return "当前没有可用节点"
+
+            counts = {}
+            if _as_bool(with_containers):
+                fetch = lambda inst, ep_id, timeout: inst.fetch_containers(ep_id, timeout)
+                for inst, ep, containers in await self._fan_out(targets, fetch):
+                    key = (inst.name, ep.get("Id"))
+                    if isinstance(containers, Exception):
+                        counts[key] = f", 容器: 查询失败({containers})"
+                    else:
+                        running = sum(1 for c in containers if c.get("State") == "running")
+                        counts[key] = f", 容器: {running}/{len(containers)} 运行中"
+
+            result = ["可用节点列表:"]
+            for inst, endpoints in listed:
+                if multiple:
+                    if isinstance(endpoints, Exception):
+                        result.append(f"实例 {inst.name}: 获取节点列表失败：{endpoints}")
+                        continue
+                    result.append(f"实例 {inst.name} ({inst.url}):")
                 for ep in endpoints:
                     gpu_info = ""
                     if "Gpus" in ep and ep["Gpus"]:
                         gpu_info = f", GPU: {ep['Gpus'][0]['name']}"
-                        
+
                     result.append(
                         f"ID: {ep.get('Id', '未知')}, "
                         f"名称: {ep.get('Name', '未知')}, "
                         f"URL: {ep.get('URL', '未知')}"
                         f"{gpu_info}"
+                        f"{counts.get((inst.name, ep.get('Id')), '')}"
                     )
-                    
-                return "\n".join(result)
-            
+
+            return "\n".join(result)
+
         except Exception as e:
             return f"获取节点信息出错: {str(e)}"
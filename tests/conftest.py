@@ -0,0 +1,119 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# AstrBot在导入时会在根目录下创建data/，测试时指向临时目录，避免在仓库中留下运行时文件
+os.environ.setdefault("ASTRBOT_ROOT", tempfile.mkdtemp(prefix="astrbot-test-"))
+
+from main import MyPlugin  # noqa: E402
+from mock_portainer import MockPortainer  # noqa: E402
+
+BENCH_OUTPUT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench_output.txt")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "bench: 性能基准，默认不运行，使用 -m bench 执行")
+
+
+def pytest_collection_modifyitems(config, items):
+    """未通过-m指定标记表达式时跳过性能基准"""
+    if config.getoption("markexpr"):
+        return
+    selected = [item for item in items if item.get_closest_marker("bench") is None]
+    if len(selected) < len(items):
+        config.hook.pytest_deselected(items=[item for item in items if item.get_closest_marker("bench")])
+        items[:] = selected
+
+
+def make_plugin(url, **overrides):
+    """创建指向模拟服务的插件实例"""
+    config = {"url": url, "username": "admin", "password": "secret", "verify_ssl": False}
+    config.update(overrides)
+    return MyPlugin(None, {"portainer": config})
+
+
+def run_scenario(scenario, mock_options=None, plugin_options=None):
+    """启动模拟服务和插件，执行scenario(plugin, mock)并返回其结果"""
+    async def main():
+        mock = MockPortainer(**(mock_options or {}))
+        url = await mock.start()
+        plugin = make_plugin(url, **(plugin_options or {}))
+        try:
+            return await scenario(plugin, mock)
+        finally:
+            await plugin.terminate()
+            await mock.close()
+
+    return asyncio.run(main())
+
+
+class BenchResult:
+    def __init__(self, name, rounds, elapsed, peak, upstream_bytes):
+        self.name = name
+        self.rounds = rounds
+        self.elapsed = elapsed
+        self.peak = peak
+        self.upstream_bytes = upstream_bytes
+
+    @property
+    def latency_ms(self):
+        return self.elapsed / self.rounds * 1000
+
+    @property
+    def throughput(self):
+        return self.rounds / self.elapsed if self.elapsed else float("inf")
+
+    def __str__(self):
+        return (
+            f"{self.name:<40} {self.latency_ms:>10.2f} ms {self.throughput:>10.1f} ops/s "
+            f"{self.peak / 1024 / 1024:>8.2f} MiB {self.upstream_bytes / 1024 / 1024:>9.2f} MiB"
+        )
+
+
+@pytest.fixture(scope="session")
+def bench_report():
+    """收集各基准的结果，测试结束后写入bench_output.txt"""
+    results = []
+    yield results
+    if results:
+        with open(BENCH_OUTPUT, "w", encoding="utf-8") as f:
+            f.write(f"{'基准':<40} {'平均延迟':>13} {'吞吐':>15} {'峰值内存':>12} {'上游流量':>13}\n")
+            for result in results:
+                f.write(f"{result}\n")
+
+
+@pytest.fixture
+def bench(bench_report):
+    """测量一个异步操作的平均延迟、吞吐、上游流量与Python堆峰值内存
+
+    用法：bench(名称, 操作(plugin, mock), rounds=次数, mock_options=..., plugin_options=...)
+    """
+    def measure(name, operation, rounds=5, mock_options=None, plugin_options=None, warmup=1):
+        async def scenario(plugin, mock):
+            for _ in range(warmup):
+                await operation(plugin, mock)
+            sent_before = mock.bytes_sent
+            start = time.perf_counter()
+            last = None
+            for _ in range(rounds):
+                last = await operation(plugin, mock)
+            elapsed = time.perf_counter() - start
+            upstream = mock.bytes_sent - sent_before
+            # tracemalloc会显著拖慢执行，峰值内存单独再跑一轮测量
+            tracemalloc.start()
+            await operation(plugin, mock)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return last, BenchResult(name, rounds, elapsed, peak, upstream)
+
+        last, result = run_scenario(scenario, mock_options, plugin_options)
+        bench_report.append(result)
+        return last, result
+
+    return measure
@@ -0,0 +1,502 @@
+"""本地模拟的Portainer服务，用于离线测试和性能基准
+
+覆盖插件用到的/api/auth、/api/settings、/api/endpoints、/api/stacks及Docker代理路由，
+支持配置延迟、数据规模（容器数量、日志大小）和故障注入。
+"""
+import asyncio
+import base64
+import collections
+import hashlib
+import json
+import re
+import struct
+import time
+
+from aiohttp import web
+
+
+def make_jwt(ttl=3600, serial=0):
+    """生成带exp声明的伪JWT（不签名）"""
+    payload = json.dumps({"exp": int(time.time() + ttl), "n": serial}).encode()
+    return "header." + base64.urlsafe_b64encode(payload).decode().rstrip("=") + ".signature"
+
+
+LOG_EPOCH_NS = 1704110400 * 10**9  # 基础日志的起始时间 2024-01-01 12:00:00 UTC
+_LOG_FRAME_OVERHEAD = 9  # 帧头8字节加换行符
+
+
+def parse_docker_time(value):
+    """把since/until参数("秒"或"秒.纳秒")转换为纳秒，避免浮点数丢失精度"""
+    if not value:
+        return None
+    seconds, _, fraction = value.partition(".")
+    return int(seconds) * 10**9 + int(fraction[:9].ljust(9, "0") or 0)
+
+
+def format_docker_time(ns):
+    """按Docker timestamps=1的格式输出RFC3339Nano时间戳"""
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ns // 10**9)) + f".{ns % 10**9:09d}Z"
+
+
+def log_frame(stream, payload):
+    """按Docker多路复用格式封装一帧日志"""
+    return struct.pack(">BxxxL", stream, len(payload)) + payload
+
+
+def make_containers(count, endpoint=1):
+    """生成指定数量的容器列表条目"""
+    states = ("running", "running", "running", "exited", "paused")
+    return [
+        {
+            "Id": f"{endpoint:04x}{i:060x}",
+            "Names": [f"/svc-{endpoint}-{i}"],
+            "Image": f"registry.local/app{i % 7}:latest",
+            "State": states[i % len(states)],
+            "Status": "Up 3 hours" if states[i % len(states)] == "running" else "Exited (0) 1 hour ago",
+            "Labels": {"com.docker.compose.project": f"stack{i % 10}"},
+        }
+        for i in range(count)
+    ]
+
+
+def make_images(endpoint):
+    """生成节点上的镜像：各节点相同的应用镜像和nginx，以及一个节点独有的悬空镜像"""
+    def digest(name):
+        return "sha256:" + hashlib.sha256(name.encode()).hexdigest()
+
+    images = [
+        {
+            "Id": digest(f"app{k}"),
+            "RepoTags": [f"registry.local/app{k}:latest"],
+            "RepoDigests": [f"registry.local/app{k}@{digest(f'app{k}-manifest')}"],
+            "Size": (50 + k * 10) * 1_000_000,
+            "SharedSize": 20_000_000,
+            "Containers": -1,
+        }
+        for k in range(7)
+    ]
+    images.append({
+        "Id": digest("nginx"), "RepoTags": ["nginx:1.25"], "RepoDigests": [f"nginx@{digest('nginx-manifest')}"],
+        "Size": 70_000_000, "SharedSize": 0, "Containers": -1,
+    })
+    images.append({
+        "Id": digest(f"dangling{endpoint}"), "RepoTags": ["<none>:<none>"], "RepoDigests": [],
+        "Size": 30_000_000, "SharedSize": 0, "Containers": -1,
+    })
+    return images
+
+
+STACK_COMPOSE = """services:
+  web:
+    image: nginx:1.25
+  app:
+    image: "registry.local/app1:${TAG}"
+  cache:
+    image: redis:7
+"""
+
+
+class MockPortainer:
+    """可配置的模拟Portainer服务
+
+    Args:
+        endpoints: 节点数量
+        containers: 每个节点的容器数量
+        log_bytes: 每次日志请求返回的字节数
+        latency: 每个请求的额外延迟(秒)
+        failures: {路径正则: HTTP状态码}，匹配的请求直接返回该状态码
+        endpoint_latency: {节点ID: 延迟秒数}，单独放慢某些节点
+        stalls: {路径正则: 延迟秒数}，只放慢第一个匹配的请求，模拟偶发的长尾延迟
+        stats_latency: 每次stats采样的耗时(秒)，不带one-shot时另外等待1秒的采样周期
+    """
+
+    def __init__(self, endpoints=1, containers=10, log_bytes=64 * 1024, latency=0.0,
+                 failures=None, endpoint_latency=None, stalls=None, token_ttl=3600, stats_latency=0.02):
+        self.endpoints = [
+            {"Id": i, "Name": f"node{i}", "URL": f"tcp://10.0.0.{i}:2375"}
+            for i in range(1, endpoints + 1)
+        ]
+        self.containers = {ep["Id"]: make_containers(containers, ep["Id"]) for ep in self.endpoints}
+        self.images = {ep["Id"]: make_images(ep["Id"]) for ep in self.endpoints}
+        self.log_bytes = log_bytes
+        self.latency = latency
+        self.failures = {re.compile(k): v for k, v in (failures or {}).items()}
+        self.endpoint_latency = endpoint_latency or {}
+        self.stalls = {re.compile(k): v for k, v in (stalls or {}).items()}
+        self.token_ttl = token_ttl
+        self.stats_latency = stats_latency
+        self.stats_requests = []
+        self.stacks = [
+            {"Id": 1, "Name": "blog", "Type": 2, "EndpointId": 1, "Status": 1,
+             "Env": [{"name": "TAG", "value": "v1"}], "GitConfig": None},
+        ]
+        self.stack_files = {1: STACK_COMPOSE}
+        self.stack_updates = []
+        self.pulls = []
+        self.hits = {}
+        self.bytes_sent = 0
+        self.in_flight = 0
+        self._event_queues = []
+        self.appended_logs = {}  # 容器ID -> 追加的日志条目
+        self._log_queues = {}  # 容器ID -> follow订阅的队列
+        self.max_in_flight = 0  # 同时处理中的请求数峰值，用于断言并发而不依赖耗时
+        self.token = None
+        self.logins = 0
+        self.url = None
+        self._runner = None
+
+    # -- 生命周期 --
+
+    async def start(self):
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get("/api/settings", self._settings)
+        app.router.add_post("/api/auth", self._auth)
+        app.router.add_get("/api/endpoints", self._endpoints)
+        app.router.add_get("/api/stacks", self._stacks)
+        app.router.add_get("/api/stacks/{stack}/file", self._stack_file)
+        app.router.add_put("/api/stacks/{stack}", self._update_stack)
+        app.router.add_put("/api/stacks/{stack}/git/redeploy", self._update_stack)
+        prefix = "/api/endpoints/{endpoint}/docker"
+        app.router.add_get(prefix + "/containers/json", self._containers)
+        app.router.add_get(prefix + "/containers/{container}/json", self._inspect)
+        app.router.add_get(prefix + "/containers/{container}/logs", self._logs)
+        app.router.add_get(prefix + "/containers/{container}/stats", self._stats)
+        app.router.add_post(prefix + "/containers/{container}/{action:start|stop|restart}", self._action)
+        app.router.add_post(prefix + "/images/create", self._pull)
+        app.router.add_get(prefix + "/images/json", self._images)
+        app.router.add_post(prefix + "/images/prune", self._prune_images)
+        app.router.add_get(prefix + "/system/df", self._system_df)
+        app.router.add_get(prefix + "/events", self._events)
+        self._runner = web.AppRunner(app, handler_cancellation=True, shutdown_timeout=1)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self.url
+
+    async def close(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def hit_count(self, pattern=""):
+        return sum(v for k, v in self.hits.items() if pattern in k)
+
+    # -- 通用处理 --
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        key = f"{request.method} {request.path}"
+        self.hits[key] = self.hits.get(key, 0) + 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return await self._handle(request, handler)
+        finally:
+            self.in_flight -= 1
+
+    async def _handle(self, request, handler):
+        delay = self.latency + self.endpoint_latency.get(int(request.match_info.get("endpoint", 0) or 0), 0)
+        for pattern in list(self.stalls):
+            if pattern.search(request.path):
+                delay += self.stalls.pop(pattern)
+        if delay:
+            await asyncio.sleep(delay)
+        for pattern, status in self.failures.items():
+            if pattern.search(request.path):
+                return web.Response(status=status, text="injected failure")
+        if request.path.startswith(("/api/endpoints", "/api/stacks")) and request.headers.get("Authorization") != f"Bearer {self.token}":
+            return web.Response(status=401, text="Unauthorized")
+        return await handler(request)
+
+    def _json(self, data):
+        body = json.dumps(data).encode()
+        self.bytes_sent += len(body)
+        return web.Response(body=body, content_type="application/json")
+
+    def _endpoint_containers(self, request):
+        return self.containers.get(int(request.match_info["endpoint"]), [])
+
+    def _find(self, request):
+        ref = request.match_info["container"]
+        for c in self._endpoint_containers(request):
+            if c["Id"] == ref or c["Names"][0] == "/" + ref:
+                return c
+        return None
+
+    # -- 认证 --
+
+    async def _settings(self, request):
+        return web.json_response({}, headers={"X-Csrf-Token": "csrf-token"})
+
+    async def _auth(self, request):
+        data = await request.json()
+        if not data.get("Username"):
+            return web.Response(status=422, text="missing username")
+        self.logins += 1
+        self.token = make_jwt(self.token_ttl, self.logins)
+        return web.json_response({"jwt": self.token}, headers={"X-CSRF-TOKEN": "csrf-token"})
+
+    async def _endpoints(self, request):
+        return self._json(self.endpoints)
+
+    # -- stack --
+
+    def _find_stack(self, request):
+        stack_id = int(request.match_info["stack"])
+        return next((st for st in self.stacks if st["Id"] == stack_id), None)
+
+    async def _stacks(self, request):
+        return self._json(self.stacks)
+
+    async def _stack_file(self, request):
+        stack = self._find_stack(request)
+        if stack is None:
+            return web.Response(status=404, text="Stack not found")
+        return self._json({"StackFileContent": self.stack_files[stack["Id"]]})
+
+    async def _update_stack(self, request):
+        """记录重新部署请求并更新stack的环境变量"""
+        stack = self._find_stack(request)
+        if stack is None:
+            return web.Response(status=404, text="Stack not found")
+        if int(request.query.get("endpointId", 0)) != stack["EndpointId"]:
+            return web.Response(status=400, text="Invalid endpoint")
+        body = await request.json()
+        self.stack_updates.append(body)
+        stack["Env"] = body.get("Env") or []
+        if "StackFileContent" in body:
+            self.stack_files[stack["Id"]] = body["StackFileContent"]
+        return self._json(stack)
+
+    # -- 容器 --
+
+    async def _containers(self, request):
+        containers = self._endpoint_containers(request)
+        filters = json.loads(request.query.get("filters", "{}"))
+        if "status" in filters:
+            containers = [c for c in containers if c["State"] in filters["status"]]
+        if "name" in filters:
+            containers = [c for c in containers if any(n in c["Names"][0] for n in filters["name"])]
+        return self._json(containers)
+
+    async def _inspect(self, request):
+        c = self._find(request)
+        if c is None:
+            return web.Response(status=404, text="No such container")
+        # 与Docker一致：paused和restarting时Running也为true
+        running = c["State"] in ("running", "paused", "restarting")
+        return self._json({"Id": c["Id"], "Name": c["Names"][0], "State": {"Status": c["State"], "Running": running}})
+
+    async def _action(self, request):
+        c = self._find(request)
+        if c is None:
+            return web.Response(status=404, text="No such container")
+        action = request.match_info["action"]
+        target = "exited" if action == "stop" else "running"
+        if action != "restart" and c["State"] == target:
+            return web.Response(status=304)
+        c["State"] = target
+        return web.Response(status=204)
+
+    def append_logs(self, container_id, lines, stream=1):
+        """在基础日志之后追加日志行，时间戳晚于基础日志，并推送给follow=1的订阅"""
+        appended = self.appended_logs.setdefault(container_id, [])
+        for text in lines:
+            entry = (LOG_EPOCH_NS + (3600 + len(appended)) * 10**9, stream, text)
+            appended.append(entry)
+            for queue in self._log_queues.get(container_id, []):
+                queue.put_nowait(entry)
+
+    def _log_entries(self, container_id):
+        """按需生成(时间戳纳秒, 流, 文本)：先是约log_bytes大小的基础日志，然后是追加的行"""
+        sent = 0
+        i = 0
+        while sent < self.log_bytes:
+            level = "ERROR" if i % 1000 == 999 else "INFO"
+            text = f"2024-01-01 12:00:00 [{level}] 请求处理完成 request_id={i} status=200"
+            yield LOG_EPOCH_NS + i * 1000, 2 if level == "ERROR" else 1, text
+            sent += _LOG_FRAME_OVERHEAD + len(text.encode())
+            i += 1
+        yield from self.appended_logs.get(container_id, [])
+
+    async def _logs(self, request):
+        """按需生成多路复用日志，支持tail、since、until、timestamps和follow"""
+        c = self._find(request)
+        if c is None:
+            return web.Response(status=404, text="No such container")
+        query = request.query
+        tail = query.get("tail", "all")
+        since = parse_docker_time(query.get("since"))
+        until = parse_docker_time(query.get("until"))
+        timestamps = query.get("timestamps") in ("1", "true")
+
+        def frame(entry):
+            ts, stream, text = entry
+            if timestamps:
+                text = f"{format_docker_time(ts)} {text}"
+            return log_frame(stream, (text + "\n").encode())
+
+        entries = (
+            e for e in self._log_entries(c["Id"])
+            if (since is None or e[0] >= since) and (until is None or e[0] <= until)
+        )
+        if tail.isdigit():
+            entries = collections.deque(entries, maxlen=int(tail))
+
+        queue = None
+        if query.get("follow") in ("1", "true"):
+            queue = asyncio.Queue()
+            self._log_queues.setdefault(c["Id"], []).append(queue)
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        try:
+            batch = []
+            for entry in entries:
+                batch.append(frame(entry))
+                if len(batch) >= 512:
+                    if not await self._write(resp, b"".join(batch)):
+                        return resp
+                    batch.clear()
+            if batch and not await self._write(resp, b"".join(batch)):
+                return resp
+            while queue is not None:
+                if not await self._write(resp, frame(await queue.get())):
+                    break
+        except asyncio.CancelledError:
+            pass
+        finally:
+            if queue is not None:
+                self._log_queues[c["Id"]].remove(queue)
+        return resp
+
+    async def _write(self, resp, data):
+        """写出一段响应体，客户端提前断开时返回False"""
+        try:
+            await resp.write(data)
+        except (ConnectionResetError, RuntimeError):
+            return False
+        self.bytes_sent += len(data)
+        return True
+
+    async def _stats(self, request):
+        c = self._find(request)
+        if c is None:
+            return web.Response(status=404, text="No such container")
+        n = int(c["Id"][-4:], 16)
+        one_shot = request.query.get("one-shot") == "true"
+        self.stats_requests.append(one_shot)
+        await asyncio.sleep(self.stats_latency)
+        if not one_shot:
+            # 与Docker一致：非one-shot时等待下一个采样周期，用两次采样填充precpu_stats
+            await asyncio.sleep(1)
+        # CPU计数随时间单调增长，每个容器的占用率固定
+        ticks = time.monotonic() * 1000
+        cpu_usage = int(ticks * (10_000 + n * 10))
+        system_usage = int(ticks * 100_000)
+        precpu = {"cpu_usage": {"total_usage": 0}}
+        if not one_shot:
+            precpu = {"cpu_usage": {"total_usage": cpu_usage - 10_000_000 - n * 10_000}, "system_cpu_usage": system_usage - 100_000_000}
+        return self._json({
+            "cpu_stats": {"cpu_usage": {"total_usage": cpu_usage}, "system_cpu_usage": system_usage, "online_cpus": 4},
+            "precpu_stats": precpu,
+            "memory_stats": {"usage": 50_000_000 + n * 100_000, "limit": 8_000_000_000, "stats": {"inactive_file": 1_000_000}},
+            "networks": {"eth0": {"rx_bytes": n * 1024, "tx_bytes": n * 512}},
+            "blkio_stats": {"io_service_bytes_recursive": [{"op": "read", "value": n * 4096}, {"op": "write", "value": n * 2048}]},
+        })
+
+    # -- 镜像与事件 --
+
+    async def _pull(self, request):
+        image = request.query.get("fromImage", "")
+        tag = request.query.get("tag")
+        self.pulls.append((image, tag))
+        if "@" in image and tag:
+            # 与Docker一致：按摘要引用时再附加标签会组成非法引用
+            return web.json_response({"message": "invalid reference format"}, status=400)
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        events = [{"status": f"Pulling from {image}", "id": tag or "latest"}]
+        if "@" not in image:
+            image = f"{image}:{tag or 'latest'}"
+        for layer in range(8):
+            layer_id = f"layer{layer}"
+            events.append({"status": "Pulling fs layer", "progressDetail": {}, "id": layer_id})
+            for step in range(1, 51):
+                events.append({"status": "Downloading", "progressDetail": {"current": step * 1_000_000, "total": 50_000_000}, "id": layer_id})
+            events.append({"status": "Download complete", "progressDetail": {}, "id": layer_id})
+            events.append({"status": "Extracting", "progressDetail": {"current": 50_000_000, "total": 50_000_000}, "id": layer_id})
+            events.append({"status": "Pull complete", "progressDetail": {}, "id": layer_id})
+            if image.startswith("broken") and layer == 2:
+                events.append({"errorDetail": {"message": "unexpected EOF"}, "error": "unexpected EOF"})
+                break
+        else:
+            events.append({"status": "Digest: sha256:0123456789abcdef"})
+            events.append({"status": f"Status: Downloaded newer image for {image}"})
+        for event in events:
+            if not await self._write(resp, json.dumps(event).encode() + b"\r\n"):
+                break
+        return resp
+
+    def _image_usage(self, request):
+        """返回节点上的镜像及各自被多少容器引用"""
+        endpoint = int(request.match_info["endpoint"])
+        containers = self._endpoint_containers(request)
+        return [
+            dict(img, Containers=sum(1 for c in containers if c["Image"] in img["RepoTags"]))
+            for img in self.images.get(endpoint, [])
+        ]
+
+    async def _images(self, request):
+        """与Docker一致：未指定shared-size=1时SharedSize为-1，引用数始终为-1"""
+        images = self.images.get(int(request.match_info["endpoint"]), [])
+        if request.query.get("shared-size") not in ("1", "true"):
+            images = [dict(img, SharedSize=-1) for img in images]
+        return self._json(images)
+
+    async def _system_df(self, request):
+        images = self._image_usage(request)
+        return self._json({
+            "LayersSize": sum(img["Size"] - img["SharedSize"] for img in images) + 20_000_000,
+            "Images": images,
+            "Containers": [{"Id": c["Id"], "SizeRw": 1_000_000} for c in self._endpoint_containers(request)],
+            "Volumes": [{"Name": "data", "UsageData": {"Size": 500_000_000, "RefCount": 1}}],
+            "BuildCache": [],
+        })
+
+    async def _prune_images(self, request):
+        filters = json.loads(request.query.get("filters", "{}"))
+        dangling_only = filters.get("dangling", ["true"]) != ["false"]
+        removed = [
+            img for img in self._image_usage(request)
+            if img["Containers"] == 0 and (not dangling_only or img["RepoTags"] == ["<none>:<none>"])
+        ]
+        removed_ids = {img["Id"] for img in removed}
+        endpoint = int(request.match_info["endpoint"])
+        self.images[endpoint] = [img for img in self.images[endpoint] if img["Id"] not in removed_ids]
+        return self._json({
+            "ImagesDeleted": [{"Deleted": img["Id"]} for img in removed],
+            "SpaceReclaimed": sum(img["Size"] for img in removed),
+        })
+
+    def emit(self, event):
+        """向所有已连接的事件订阅推送一条Docker事件"""
+        for queue in self._event_queues:
+            queue.put_nowait(event)
+
+    async def _events(self, request):
+        """保持连接，只推送通过emit()注入的事件，直到客户端断开"""
+        queue = asyncio.Queue()
+        self._event_queues.append(queue)
+        resp = web.StreamResponse()
+        await resp.prepare(request)
+        try:
+            while True:
+                event = await queue.get()
+                if not await self._write(resp, json.dumps(event).encode() + b"\n"):
+                    break
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._event_queues.remove(queue)
+        return resp
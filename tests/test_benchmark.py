@@ -0,0 +1,179 @@
+"""基于本地模拟Portainer的性能基准，默认不运行，使用 python -m pytest tests -m bench 执行
+
+每个用例把延迟、吞吐、峰值内存和上游流量记录到bench_output.txt，数值以报告为准；
+断言只校验结果正确以及与耗时无关的指标（如上游流量），不对时间和内存设阈值。
+功能行为由其余test_*.py覆盖。
+"""
+import time
+
+import pytest
+from conftest import BenchResult
+from main import detect_encoding
+
+pytestmark = pytest.mark.bench
+
+MiB = 1024 * 1024
+
+
+def test_list_containers_large_inventory(bench):
+    result, stats = bench(
+        "list_containers 1000个容器",
+        lambda plugin, mock: plugin.list_containers(None),
+        mock_options={"containers": 1000},
+        plugin_options={"cache_ttl": 0},
+    )
+    assert result.startswith("容器 svc-1-0")
+
+
+def test_list_containers_compact_grouped(bench):
+    result, stats = bench(
+        "list_containers 紧凑+按状态分组",
+        lambda plugin, mock: plugin.list_containers(None, compact=True, group_by="state"),
+        mock_options={"containers": 1000},
+        plugin_options={"cache_ttl": 0},
+    )
+    assert "[running] 600 个" in result
+
+
+def test_list_containers_server_side_filter(bench):
+    result, stats = bench(
+        "list_containers filters=status=exited",
+        lambda plugin, mock: plugin.list_containers(None, compact=True, filters="status=exited"),
+        mock_options={"containers": 1000},
+        plugin_options={"cache_ttl": 0},
+    )
+    assert "running" not in result.split("\n", 1)[1]
+
+
+def test_list_containers_all_endpoints_concurrent(bench):
+    result, stats = bench(
+        "list_containers 20个节点并发",
+        lambda plugin, mock: plugin.list_containers(None, all_endpoints=True, compact=True),
+        rounds=3,
+        mock_options={"endpoints": 20, "containers": 5, "latency": 0.05},
+        plugin_options={"cache_ttl": 0, "output_max_chars": 0},
+    )
+    assert result.count("节点 node") == 20
+
+
+def test_list_endpoints_with_containers(bench):
+    result, stats = bench(
+        "list_endpoints 附带容器统计",
+        lambda plugin, mock: plugin.list_endpoints(None, with_containers=True),
+        mock_options={"endpoints": 10, "containers": 100},
+        plugin_options={"cache_ttl": 0},
+    )
+    assert "容器: 60/100 运行中" in result
+
+
+def test_start_stop_container(bench):
+    async def operation(plugin, mock):
+        stopped = await plugin.stop_container(None, "svc-1-0")
+        started = await plugin.start_container(None, "svc-1-0")
+        return stopped, started
+
+    (stopped, started), stats = bench("stop_container + start_container", operation, rounds=10)
+    assert started == "容器 svc-1-0 已启动"
+
+
+def test_batch_restart_by_label(bench):
+    result, stats = bench(
+        "batch_container_action 按标签重启",
+        lambda plugin, mock: plugin.batch_container_action(
+            None, "restart", ["label:com.docker.compose.project=stack1"]
+        ),
+        mock_options={"containers": 200, "latency": 0.01},
+    )
+    assert "成功 20" in result
+
+
+def test_pull_image_streaming(bench):
+    result, stats = bench(
+        "pull_image 8层进度流",
+        lambda plugin, mock: plugin.pull_image(None, "nginx:1.25"),
+    )
+    assert "8/8 个层完成" in result
+
+
+def test_get_container_logs_tail(bench):
+    result, stats = bench(
+        "get_container_logs tail=100000",
+        lambda plugin, mock: plugin.get_container_logs(None, "svc-1-0", tail="100000"),
+        mock_options={"log_bytes": 50 * MiB},
+    )
+    # tail被限制在log_max_lines以内，不会把50MB日志全部拉下来
+    assert stats.upstream_bytes < 5 * MiB
+
+
+def test_get_container_logs_grep_50mb(bench):
+    result, stats = bench(
+        "get_container_logs 50MB日志 level=error",
+        lambda plugin, mock: plugin.get_container_logs(
+            None, "svc-1-0", tail="all", level="error", context=0, max_matches=1000
+        ),
+        rounds=1,
+        warmup=0,
+        mock_options={"log_bytes": 50 * MiB},
+    )
+    assert "处匹配" in result
+    assert stats.upstream_bytes >= 50 * MiB
+
+
+def test_container_stats(bench):
+    result, stats = bench(
+        "container_stats 300个运行中容器",
+        lambda plugin, mock: plugin.container_stats(None, sort_by="memory", top_n=5),
+        rounds=3,
+        mock_options={"containers": 500},
+    )
+    assert result.startswith("运行中容器 300 个")
+
+
+def test_redeploy_stack(bench):
+    result, stats = bench(
+        "redeploy_stack 并发拉取3个镜像",
+        lambda plugin, mock: plugin.redeploy_stack(None, "blog"),
+        rounds=3,
+        mock_options={"latency": 0.05},
+    )
+    assert result.startswith("stack blog 已重新部署")
+
+
+def test_image_inventory(bench):
+    result, stats = bench(
+        "image_inventory 3个节点",
+        lambda plugin, mock: plugin.image_inventory(None),
+        mock_options={"endpoints": 3, "latency": 0.02},
+        plugin_options={"cache_ttl": 0},
+    )
+    assert result.startswith("镜像清单：3 个节点")
+
+
+def test_export_container_logs(bench, tmp_path):
+    result, stats = bench(
+        "export_container_logs 16MB日志 gzip",
+        lambda plugin, mock: plugin.export_container_logs(None, "svc-1-0"),
+        rounds=1,
+        mock_options={"log_bytes": 16 * MiB},
+        plugin_options={"log_export_dir": str(tmp_path)},
+    )
+    assert result.startswith("已导出容器 svc-1-0 的日志")
+    assert stats.upstream_bytes >= 16 * MiB
+
+
+@pytest.mark.parametrize("encoding", ["ascii", "utf-8", "gb18030", "big5"])
+def test_detect_encoding(bench_report, encoding):
+    # 只采样前64KB，耗时应与语料大小无关；带BOM的UTF-16在第一步即返回，不单独测量
+    line = "2024-01-01 12:00:00 [INFO] service started, listening on port 8080\n"
+    if encoding in ("utf-8", "gb18030"):
+        line = "2024-01-01 12:00:00 [INFO] 服务启动完成，监听端口8080，当前连接数为零\n"
+    elif encoding == "big5":
+        line = "2024-01-01 12:00:00 [INFO] 服務啟動完成，監聽埠8080，目前連線數為零\n"
+    data = line.encode(encoding) * (4 * MiB // len(line.encode(encoding)))
+    rounds = 20
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = detect_encoding(data)
+    elapsed = time.perf_counter() - start
+    bench_report.append(BenchResult(f"detect_encoding 4MB {encoding}", rounds, elapsed, 0, 0))
+    assert result == ("utf-8" if encoding == "ascii" else encoding)
@@ -0,0 +1,145 @@
+"""Portainer连接层的功能测试：Token、缓存、重试与熔断、对冲请求、多实例和持久化"""
+import asyncio
+
+from conftest import make_plugin, run_scenario
+from mock_portainer import MockPortainer
+
+
+def test_cache_shares_concurrent_requests():
+    async def scenario(plugin, mock):
+        await asyncio.gather(*(plugin.list_containers(None) for _ in range(20)))
+        return mock.hit_count("/docker/containers/json"), mock.logins
+
+    requests, logins = run_scenario(scenario, mock_options={"containers": 100, "latency": 0.02})
+    assert requests == 1
+    assert logins == 1
+
+
+def test_token_refresh_after_revocation():
+    async def scenario(plugin, mock):
+        await plugin.list_containers(None)
+        mock.token = "revoked"
+        result = await plugin.list_containers(None)
+        return result, mock.logins
+
+    result, logins = run_scenario(scenario, plugin_options={"cache_ttl": 0})
+    assert result.startswith("容器 ")
+    assert logins == 2
+
+
+def test_fan_out_timeout_on_slow_endpoint():
+    result = run_scenario(
+        lambda plugin, mock: plugin.list_endpoints(None, with_containers=True),
+        mock_options={"endpoints": 3, "endpoint_latency": {2: 5}},
+        plugin_options={"fanout_timeout": 1},
+    )
+    assert "查询失败(请求超时" in result
+    assert result.count("运行中") == 2
+
+
+def test_metrics_report():
+    async def scenario(plugin, mock):
+        await plugin.list_containers(None)
+        await plugin.list_containers(None)
+        await plugin.stop_container(None, "svc-1-0")
+        instances = list(plugin._instances.values())
+        return plugin._metrics.format(instances), plugin._metrics.prometheus(instances)
+
+    text, exported = run_scenario(scenario)
+    assert "Token刷新 1 次" in text
+    assert "list_containers: 2 次" in text
+    assert "GET /api/endpoints/{id}/docker/containers/json" in text
+    assert "POST /api/endpoints/{id}/docker/containers/{id}/stop" in text
+    assert 'portainer_plugin_tool_duration_seconds_count{tool="list_containers"} 2' in exported
+    assert 'portainer_plugin_upstream_requests_total{portainer="default",method="POST",route="/api/auth",status="200"} 1' in exported
+
+
+def test_circuit_breaker_fails_fast():
+    async def scenario(plugin, mock):
+        results = [await plugin.list_containers(None) for _ in range(5)]
+        return results, mock.hit_count("/docker/containers/json")
+
+    results, hits = run_scenario(
+        scenario,
+        mock_options={"failures": {r"/endpoints/1/docker": 502}},
+        plugin_options={"cache_ttl": 0, "retry_base_delay": 0.01},
+    )
+    # 第一次调用重试2次后达到熔断阈值，之后的调用不再访问上游
+    assert hits == 3
+    assert results[-1].startswith("获取容器信息出错: 节点 1 暂时不可用")
+
+
+def test_hedged_read_avoids_stalled_request():
+    async def scenario(plugin, mock):
+        await plugin.list_endpoints(None)
+        result = await plugin.list_containers(None)
+        return result, plugin._metrics.hedged, mock.hit_count("/docker/containers/json")
+
+    result, hedged, hits = run_scenario(
+        scenario,
+        mock_options={"stalls": {r"/docker/containers/json": 30}},
+        plugin_options={"cache_ttl": 0, "hedge_delay": 0.1},
+    )
+    # 第一个请求被卡住30秒，结果来自对冲请求
+    assert result.startswith("容器 ")
+    assert hedged == 1
+    assert hits == 2
+
+
+def test_multiple_instances():
+    async def scenario():
+        east = MockPortainer(endpoints=2, containers=3)
+        west = MockPortainer(endpoints=1, containers=4)
+        east_url, west_url = await east.start(), await west.start()
+        plugin = make_plugin(east_url, name="east", instances=[
+            {"name": "west", "url": west_url, "username": "admin", "password": "secret", "verify_ssl": False},
+        ])
+        try:
+            endpoints = await plugin.list_endpoints(None, with_containers=True)
+            containers = await plugin.list_containers(None, instance="west")
+            missing = await plugin.start_container(None, "svc-1-0", instance="north")
+            return endpoints, containers, missing, east.logins, west.logins
+        finally:
+            await plugin.terminate()
+            await east.close()
+            await west.close()
+
+    endpoints, containers, missing, east_logins, west_logins = asyncio.run(scenario())
+    assert "实例 east (" in endpoints and "实例 west (" in endpoints
+    assert endpoints.count("容器: 3/3 运行中") == 2 and "容器: 3/4 运行中" in endpoints
+    # 每个实例各自登录一次
+    assert east_logins == 1 and west_logins == 1
+    assert containers.startswith("容器 svc-1-0") and "svc-1-3" in containers
+    assert missing == "启动容器出错: 未找到Portainer实例 north，可用实例：east、west"
+
+
+def test_persistent_cache_warm_start(tmp_path):
+    async def scenario():
+        mock = MockPortainer()
+        url = await mock.start()
+        options = {"persistent_cache": True, "persistent_cache_dir": str(tmp_path)}
+        try:
+            async def run():
+                plugin = make_plugin(url, **options)
+                try:
+                    before = mock.hit_count()
+                    result = await plugin.list_containers(None)
+                    return result, mock.hit_count() - before
+                finally:
+                    await plugin.terminate()
+
+            cold = await run()
+            warm = await run()
+            # Token被吊销时惰性地重新登录
+            mock.token = "revoked"
+            revoked = await run()
+            return cold, warm, revoked, mock.logins
+        finally:
+            await mock.close()
+
+    (cold, cold_requests), (warm, warm_requests), (revoked, _), logins = asyncio.run(scenario())
+    assert cold_requests == 4
+    assert warm_requests == 1
+    assert warm == cold
+    assert revoked == cold
+    assert logins == 2
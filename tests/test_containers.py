@@ -0,0 +1,208 @@
+"""容器列表、启停、批量操作与资源占用工具的功能测试"""
+import re
+
+from conftest import run_scenario
+from main import ContainerIndex
+
+
+def test_list_containers_truncated():
+    result = run_scenario(
+        lambda plugin, mock: plugin.list_containers(None),
+        mock_options={"containers": 1000},
+    )
+    assert result.startswith("容器 svc-1-0")
+    assert len(result) <= 4000
+    assert "行未显示" in result
+
+
+def test_list_containers_compact_grouped():
+    result = run_scenario(
+        lambda plugin, mock: plugin.list_containers(None, compact=True, group_by="state"),
+        mock_options={"containers": 1000},
+    )
+    assert result.startswith("名称|ID|状态|镜像|详情")
+    assert "[running] 600 个" in result
+
+
+def test_list_containers_server_side_filter():
+    async def scenario(plugin, mock):
+        result = await plugin.list_containers(None, compact=True, filters="status=exited")
+        return result, mock.hits
+
+    result, hits = run_scenario(scenario, mock_options={"containers": 100})
+    assert "running" not in result.split("\n", 1)[1]
+    assert "exited" in result
+
+
+def test_list_containers_all_endpoints_concurrent():
+    async def scenario(plugin, mock):
+        result = await plugin.list_containers(None, all_endpoints=True, compact=True)
+        return result, mock.max_in_flight
+
+    result, max_in_flight = run_scenario(
+        scenario,
+        mock_options={"endpoints": 20, "containers": 5, "latency": 0.05},
+        plugin_options={"output_max_chars": 0},
+    )
+    assert result.count("节点 node") == 20
+    # 并发数受fanout_concurrency(默认8)限制
+    assert max_in_flight == 8
+
+
+def test_list_containers_partial_failure():
+    result = run_scenario(
+        lambda plugin, mock: plugin.list_containers(None, all_endpoints=True),
+        mock_options={"endpoints": 3, "containers": 2, "failures": {r"/endpoints/2/docker": 500}},
+    )
+    assert "节点 node2 (ID: 2): 查询失败" in result
+    assert "svc-1-0" in result and "svc-3-0" in result
+
+
+def test_list_endpoints_with_containers():
+    result = run_scenario(
+        lambda plugin, mock: plugin.list_endpoints(None, with_containers=True),
+        mock_options={"endpoints": 10, "containers": 100},
+    )
+    assert "容器: 60/100 运行中" in result
+
+
+def test_start_stop_container():
+    async def scenario(plugin, mock):
+        stopped = await plugin.stop_container(None, "svc-1-0")
+        started = await plugin.start_container(None, "svc-1-0")
+        return stopped, started
+
+    stopped, started = run_scenario(scenario)
+    assert stopped == "容器 svc-1-0 已停止"
+    assert started == "容器 svc-1-0 已启动"
+
+
+def test_stop_paused_container():
+    async def scenario(plugin, mock):
+        # svc-1-4为paused状态，Docker视其为运行中，停止请求会真正执行
+        stopped = await plugin.stop_container(None, "svc-1-4")
+        mock.containers[1][9]["State"] = "restarting"
+        batch = await plugin.batch_container_action(None, "stop", ["svc-1-9", "svc-1-3"])
+        return stopped, batch, mock.containers[1]
+
+    stopped, batch, containers = run_scenario(scenario)
+    assert stopped == "容器 svc-1-4 已停止"
+    assert batch.startswith("批量停止完成：成功 1，跳过 1，失败 0")
+    assert "- svc-1-3: 已处于停止状态" in batch
+    assert containers[4]["State"] == containers[9]["State"] == "exited"
+
+
+def test_stop_waits_for_grace_period():
+    async def scenario(plugin, mock):
+        # stop/restart要等容器的停止宽限期结束才返回，耗时超过read_timeout
+        mock.stalls[re.compile("/stop$")] = 0.5
+        mock.stalls[re.compile("/restart$")] = 0.5
+        stopped = await plugin.stop_container(None, "svc-1-0")
+        batch = await plugin.batch_container_action(None, "restart", ["svc-1-1"])
+        breaker = plugin._instance().breakers.get("1")
+        return stopped, batch, breaker.failures if breaker else 0
+
+    stopped, batch, failures = run_scenario(scenario, plugin_options={"read_timeout": 0.2})
+    assert stopped == "容器 svc-1-0 已停止"
+    assert batch.startswith("批量重启完成：成功 1，跳过 0，失败 0")
+    assert failures == 0
+
+
+def test_batch_restart_by_label():
+    result = run_scenario(
+        lambda plugin, mock: plugin.batch_container_action(
+            None, "restart", ["label:com.docker.compose.project=stack1"]
+        ),
+        mock_options={"containers": 200},
+    )
+    assert result.startswith("批量重启完成：成功 20，跳过 0，失败 0")
+
+
+def test_container_stats():
+    result = run_scenario(
+        lambda plugin, mock: plugin.container_stats(None, sort_by="memory", top_n=5),
+        mock_options={"containers": 50},
+    )
+    assert result.startswith("运行中容器 30 个，按memory排序前 5 个")
+    # 内存占用随容器序号增大，排在第一的是序号最大的运行中容器(47)
+    assert result.split("\n")[1].startswith("1. svc-1-47 ")
+
+
+def test_container_stats_one_shot_cpu():
+    async def scenario(plugin, mock):
+        first = await plugin.container_stats(None, sort_by="cpu", top_n=3)
+        first_requests = len(mock.stats_requests)
+        second = await plugin.container_stats(None, sort_by="cpu", top_n=3)
+        for sample in plugin._stats_samples[("default", "1")].values():
+            sample.time -= 3600
+        stale = await plugin.container_stats(None, sort_by="cpu", top_n=3)
+        return first, first_requests, second, stale, mock.stats_requests
+
+    first, first_requests, second, stale, requests = run_scenario(scenario, mock_options={"containers": 50})
+    assert all(requests)
+    # 第一次查询没有近期采样，间隔约1秒再采样一轮，直接得出CPU占用并标明采样间隔
+    assert first_requests == 60
+    assert first.split("\n")[1].startswith("1. svc-1-47 ")
+    assert "CPU 41.9%（近 1." in first.split("\n")[1]
+    # 近期有采样时只采样一轮，与上一次比较
+    assert len(requests) == 60 + 30 + 60
+    assert second.split("\n")[1].startswith("1. svc-1-47 ") and "CPU 41.9%（近 " in second
+    # 一小时前的采样不再使用，重新两轮采样
+    assert "CPU 41.9%（近 1." in stale.split("\n")[1]
+
+
+def test_container_stats_partial_within_budget():
+    async def scenario(plugin, mock):
+        slow = mock.containers[1][0]["Id"]
+        mock.stalls[re.compile(f"{slow}/stats")] = 5
+        return await plugin.container_stats(None, sort_by="cpu", top_n=50)
+
+    result = run_scenario(
+        scenario,
+        mock_options={"containers": 50},
+        plugin_options={"stats_timeout": 0.5},
+    )
+    # 超出整体时间预算的容器列为未完成，其余照常返回
+    # 第一轮等到预算用完，来不及第二轮采样时明确说明CPU占用未知
+    assert result.startswith("运行中容器 30 个，按cpu排序前 29 个（29 个容器未能在时间预算内得出CPU占用，排在最后）:\n")
+    assert result.endswith("1 个容器在 0.5 秒内未完成采样：svc-1-0")
+
+
+def test_state_changing_tools_require_exact_reference():
+    async def scenario(plugin, mock):
+        prefix = await plugin.stop_container(None, "svc")
+        short_id = await plugin.start_container(None, "0001")
+        batch = await plugin.batch_container_action(None, "stop", ["svc-1-1", "svc-1-"])
+        full_id = await plugin.stop_container(None, mock.containers[1][2]["Id"])
+        return prefix, short_id, batch, full_id, mock.containers[1]
+
+    prefix, short_id, batch, full_id, containers = run_scenario(scenario, mock_options={"containers": 3})
+    assert prefix.startswith("停止容器出错: 没有名称或ID为 svc 的容器，未执行任何操作")
+    assert "svc-1-0" in prefix
+    assert short_id.startswith("启动容器出错: 没有名称或ID为 0001 的容器")
+    assert batch.startswith("批量停止完成：成功 1，跳过 0，失败 1")
+    assert "- svc-1-: 没有完全匹配的容器，未执行操作，您是否指：svc-1-0、svc-1-1、svc-1-2" in batch
+    # 只有完整名称和完整ID（或至少12位的唯一前缀）会真正执行
+    assert full_id == f"容器 {containers[2]['Id']} 已停止"
+    assert [c["State"] for c in containers] == ["running", "exited", "exited"]
+
+
+def test_read_only_tools_accept_prefix():
+    result = run_scenario(
+        lambda plugin, mock: plugin.get_container_logs(None, "svc-1-", tail="1"),
+        mock_options={"containers": 1, "log_bytes": 1024},
+    )
+    assert "request_id" in result
+
+
+def test_container_index_strict_resolution():
+    index = ContainerIndex()
+    index.update([
+        {"Id": "abcdef1234567890" * 4, "Names": ["/db-backup"]},
+        {"Id": "0123456789abcdef" * 4, "Names": ["/web"]},
+    ])
+    assert index.resolve("db")[0][0]["Names"] == ["/db-backup"]
+    assert index.resolve("db", strict=True) == ([], ["db-backup"])
+    assert index.resolve("abcdef", strict=True) == ([], ["db-backup"])
+    assert index.resolve("abcdef123456", strict=True)[0][0]["Names"] == ["/db-backup"]
+    assert index.resolve("web", strict=True)[0][0]["Names"] == ["/web"]
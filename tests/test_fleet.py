@@ -0,0 +1,111 @@
+"""后台节点状态跟踪(fleet_watch)的功能测试"""
+import asyncio
+import time
+
+from conftest import run_scenario
+from main import EndpointState
+
+
+async def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "后台状态未在限定时间内更新"
+        await asyncio.sleep(0.02)
+
+
+def synced(plugin):
+    state = plugin._instance().fleet.get("1")
+    return state is not None and state.synced_at and state.connected
+
+
+def test_fleet_answers_from_memory_and_applies_events():
+    async def scenario(plugin, mock):
+        await wait_until(lambda: synced(plugin))
+        lists = mock.hit_count("/containers/json")
+        listed = await plugin.list_containers(None)
+        served_from_memory = mock.hit_count("/containers/json") == lists
+
+        c = mock.containers[1][0]
+        c["State"] = "exited"
+        mock.emit({"Type": "container", "Action": "die", "Actor": {"ID": c["Id"], "Attributes": {"name": "svc-1-0"}}})
+        state = plugin._instance().fleet["1"]
+        await wait_until(lambda: state.containers[c["Id"]]["State"] == "exited")
+        stopped = await plugin.stop_container(None, "svc-1-0")
+        paused = await plugin.stop_container(None, "svc-1-4")
+        inspects = sum(mock.hit_count(f"/containers/{c['Id']}/json") for c in mock.containers[1])
+        return listed, served_from_memory, stopped, paused, inspects
+
+    listed, served_from_memory, stopped, paused, inspects = run_scenario(
+        scenario, plugin_options={"fleet_watch": True}
+    )
+    assert listed.startswith("容器 svc-1-0")
+    assert served_from_memory
+    # 停止前的状态检查直接使用事件更新后的内存状态，不再inspect；paused的容器仍会被停止
+    assert stopped == "容器 svc-1-0 已处于停止状态"
+    assert paused == "容器 svc-1-4 已停止"
+    assert inspects == 0
+
+
+def test_fleet_rename_updates_container_index():
+    async def scenario(plugin, mock):
+        await wait_until(lambda: synced(plugin))
+        # 从内存列出一次，让容器索引持有后台状态中的条目
+        await plugin.list_containers(None)
+        c = mock.containers[1][0]
+        c["Names"] = ["/renamed"]
+        mock.emit({"Type": "container", "Action": "rename",
+                   "Actor": {"ID": c["Id"], "Attributes": {"name": "renamed", "oldName": "/svc-1-0"}}})
+        state = plugin._instance().fleet["1"]
+        await wait_until(lambda: state.containers[c["Id"]]["Names"] == ["/renamed"])
+        logs = await plugin.get_container_logs(None, "renamed", tail="1")
+        old_name = await plugin.stop_container(None, "svc-1-0")
+        stopped = await plugin.stop_container(None, "renamed")
+        return logs, old_name, stopped
+
+    logs, old_name, stopped = run_scenario(scenario, plugin_options={"fleet_watch": True})
+    assert "request_id" in logs
+    assert old_name.startswith("停止容器出错: 没有名称或ID为 svc-1-0 的容器")
+    assert stopped == "容器 renamed 已停止"
+
+
+def test_fleet_resyncs_endpoint_without_events():
+    async def scenario(plugin, mock):
+        await wait_until(lambda: synced(plugin))
+        # 节点上的变化没有产生事件，只能靠定时全量同步发现
+        c = mock.containers[1][0]
+        c["State"] = "exited"
+        state = plugin._instance().fleet["1"]
+        await wait_until(lambda: state.containers[c["Id"]]["State"] == "exited")
+        return mock.hit_count("/docker/events")
+
+    subscriptions = run_scenario(
+        scenario, plugin_options={"fleet_watch": True, "fleet_resync_interval": 0.2}
+    )
+    assert subscriptions >= 2
+
+
+def test_fleet_stale_sync_falls_back_to_http():
+    async def scenario(plugin, mock):
+        await wait_until(lambda: synced(plugin))
+        # 模拟半开连接：事件流看起来在线，但全量同步已经超出期限
+        plugin._instance().fleet["1"].synced_at -= 10_000
+        lists = mock.hit_count("/containers/json")
+        await plugin.list_containers(None)
+        return mock.hit_count("/containers/json") - lists
+
+    assert run_scenario(scenario, plugin_options={"fleet_watch": True, "cache_ttl": 0}) == 1
+
+
+def test_endpoint_state_freshness():
+    state = EndpointState()
+    assert not state.is_fresh(30, 300)
+    state.sync([{"Id": "a", "State": "running"}])
+    state.connected = True
+    assert state.is_fresh(30, 300)
+    state.updated_at -= 100
+    assert state.is_fresh(30, 300)
+    state.connected = False
+    assert not state.is_fresh(30, 300)
+    state.connected = True
+    state.synced_at -= 400
+    assert not state.is_fresh(30, 300)
@@ -0,0 +1,63 @@
+"""镜像拉取、镜像清单与清理工具的功能测试"""
+from conftest import run_scenario
+
+
+def test_pull_image_streaming():
+    result = run_scenario(lambda plugin, mock: plugin.pull_image(None, "nginx:1.25"))
+    assert "Status: Downloaded newer image for nginx:1.25" in result
+    assert "8/8 个层完成" in result
+
+
+def test_pull_image_by_digest():
+    async def scenario(plugin, mock):
+        digest = "postgres:15@sha256:" + "ab" * 32
+        result = await plugin.pull_image(None, digest)
+        return digest, result, mock.pulls
+
+    digest, result, pulls = run_scenario(scenario)
+    # 按摘要引用整体作为fromImage发送，不附加tag
+    assert pulls == [(digest, None)]
+    assert f"Status: Downloaded newer image for {digest}" in result
+
+
+def test_pull_image_aborts_on_error():
+    result = run_scenario(lambda plugin, mock: plugin.pull_image(None, "broken"))
+    assert result.startswith("拉取镜像失败：unexpected EOF")
+
+
+def test_image_inventory_across_endpoints():
+    result = run_scenario(
+        lambda plugin, mock: plugin.image_inventory(None),
+        mock_options={"endpoints": 3},
+    )
+    # 7个应用镜像和nginx在3个节点上相同，悬空镜像各节点独有
+    assert result.startswith("镜像清单：3 个节点，11 个不同镜像（按摘要去重），共可回收 286.1 MB")
+    assert "多节点重复存储的镜像（8 个）:\n- registry.local/app6:latest" in result
+    assert result.count("悬空 1 个，未使用 1 个，可回收 95.4 MB") == 3
+
+
+def test_prune_images_requires_confirmation():
+    async def scenario(plugin, mock):
+        preview = await plugin.prune_images(None, all_endpoints=True, dangling_only=False)
+        code = preview.split("confirm=")[1].split("再次")[0]
+        rejected = await plugin.prune_images(None, all_endpoints=True, dangling_only=False, confirm="0000")
+        images_before = sum(len(images) for images in mock.images.values())
+        pruned = await plugin.prune_images(None, all_endpoints=True, dangling_only=False, confirm=code)
+        after = await plugin.prune_images(None, all_endpoints=True)
+        return preview, rejected, images_before, pruned, after, mock.images
+
+    preview, rejected, images_before, pruned, after, images = run_scenario(scenario, mock_options={"endpoints": 2})
+    assert preview.startswith("预览：将在 2 个节点上删除 4 个未使用镜像，预计回收 190.7 MB")
+    assert rejected.startswith("确认码已失效") and images_before == 18
+    assert pruned.startswith("清理未使用镜像完成：共回收 190.7 MB")
+    assert after == "没有可清理的悬空镜像"
+    assert all(len(node_images) == 7 for node_images in images.values())
+
+
+def test_image_inventory_excludes_shared_layers():
+    # 没有容器时应用镜像全部未使用，各自与其他镜像共享的20MB不可回收
+    result = run_scenario(
+        lambda plugin, mock: plugin.image_inventory(None),
+        mock_options={"containers": 0},
+    )
+    assert "悬空 1 个，未使用 8 个，可回收 495.9 MB" in result
@@ -0,0 +1,197 @@
+"""容器日志读取、过滤与导出工具的功能测试"""
+import asyncio
+import gzip
+import os
+import re
+
+from conftest import run_scenario
+from main import DockerLogStream, detect_encoding
+
+MiB = 1024 * 1024
+
+TEXT_CN = "2024-01-01 12:00:00 [INFO] 服务启动完成，监听端口8080，当前连接数为零\n"
+TEXT_TW = "2024-01-01 12:00:00 [INFO] 服務啟動完成，監聽埠8080，目前連線數為零\n"
+
+
+def test_get_container_logs_tail():
+    result = run_scenario(
+        lambda plugin, mock: plugin.get_container_logs(None, "svc-1-0", tail="100000"),
+        mock_options={"log_bytes": 1 * MiB},
+    )
+    # tail被限制在log_max_lines以内
+    assert len(result.splitlines()) <= 2001
+
+
+def test_get_container_logs_tail_keeps_newest_within_byte_budget():
+    async def scenario(plugin, mock):
+        last = await plugin.get_container_logs(None, "svc-1-0", tail="1")
+        result = await plugin.get_container_logs(None, "svc-1-0", tail="500")
+        return last, result
+
+    last, result = run_scenario(
+        scenario,
+        mock_options={"log_bytes": 1 * MiB},
+        plugin_options={"log_max_bytes": 4096, "cache_ttl": 0},
+    )
+    lines = result.splitlines()
+    # 超出字节预算时从头部省略较早的行，最后一行仍是最新的日志
+    assert lines[0].startswith("……日志较长，已省略较早的 ")
+    assert lines[-1] == last
+    assert len("\n".join(lines[1:]).encode()) <= 4096
+
+
+def test_get_container_logs_filtered():
+    result = run_scenario(
+        lambda plugin, mock: plugin.get_container_logs(
+            None, "svc-1-0", tail="all", level="error", context=0, max_matches=5
+        ),
+        mock_options={"log_bytes": 1 * MiB},
+    )
+    assert result.startswith("[stderr] 2024-01-01 12:00:00 [ERROR] 请求处理完成 request_id=999")
+    assert "共 5 处匹配" in result
+
+
+def test_get_container_logs_incremental_delta():
+    async def scenario(plugin, mock):
+        cid = mock.containers[1][0]["Id"]
+        first = await plugin.get_container_logs(None, "svc-1-0", incremental=True)
+        # 两次查询之间的新日志多于默认的tail=100，也必须全部返回
+        mock.append_logs(cid, [f"new line {k}" for k in range(150)])
+        second = await plugin.get_container_logs(None, "svc-1-0", incremental=True)
+        third = await plugin.get_container_logs(None, "svc-1-0", incremental=True)
+        plugin.log_max_lines = 20
+        mock.append_logs(cid, [f"burst {k}" for k in range(30)], stream=2)
+        fourth = await plugin.get_container_logs(None, "svc-1-0", incremental=True)
+        fifth = await plugin.get_container_logs(None, "svc-1-0", incremental=True)
+        return first, second, third, fourth, fifth
+
+    first, second, third, fourth, fifth = run_scenario(scenario, mock_options={"log_bytes": 8 * 1024})
+    assert len(first.splitlines()) == 100 and first.endswith("status=200")
+    assert second.splitlines() == [f"new line {k}" for k in range(150)]
+    assert third == "自上次查询以来没有新日志"
+    # 超出log_max_lines时明确提示，游标只前进到已返回的行，剩余部分下次返回
+    assert fourth.splitlines()[:20] == [f"[stderr] burst {k}" for k in range(20)]
+    assert fourth.splitlines()[20].startswith("……新日志超过本次返回上限，仅返回了最早的 20 行")
+    assert fifth.splitlines() == [f"[stderr] burst {k}" for k in range(20, 30)]
+
+
+def test_get_container_logs_subscribe():
+    async def scenario(plugin, mock):
+        cid = mock.containers[1][0]["Id"]
+        subscribed = await plugin.get_container_logs(None, "svc-1-0", subscribe=True)
+        follower = plugin._log_followers[("default", "1", cid)]
+        # 订阅建立前没有游标时只接收新日志
+        while mock.hit_count("/logs") == 0:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        mock.append_logs(cid, ["followed 0", "followed 1", "followed 2"])
+        while follower.written < 3:
+            await asyncio.sleep(0.01)
+        lines = await plugin.get_container_logs(None, "svc-1-0", incremental=True)
+        empty = await plugin.get_container_logs(None, "svc-1-0", incremental=True)
+        cancelled = await plugin.unsubscribe_container_logs(None, "svc-1-0")
+        return subscribed, lines, empty, cancelled, mock.hit_count("/logs")
+
+    subscribed, lines, empty, cancelled, requests = run_scenario(scenario, mock_options={"log_bytes": 8 * 1024})
+    assert subscribed.startswith("已订阅容器")
+    assert lines.splitlines() == ["followed 0", "followed 1", "followed 2"]
+    assert empty == "自上次查询以来没有新日志"
+    assert cancelled.startswith("已取消容器")
+    # 增量查询直接读取订阅缓冲区，不再请求服务器
+    assert requests == 1
+
+
+def test_export_container_logs(tmp_path):
+    result = run_scenario(
+        lambda plugin, mock: plugin.export_container_logs(None, "svc-1-0"),
+        mock_options={"log_bytes": 1 * MiB},
+        plugin_options={"log_export_dir": str(tmp_path)},
+    )
+    path = result.split("：", 1)[1].split("\n", 1)[0]
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        lines = sum(1 for _ in f)
+    assert f"共 {lines} 行" in result
+    assert "开头:\n2024-01-01T12:00:00.000000000Z 2024-01-01 12:00:00 [INFO] 请求处理完成 request_id=0 " in result
+
+
+def test_export_container_logs_filtered(tmp_path):
+    # 导出目录中不是本插件生成的日志文件，即使更旧也不会被清理
+    foreign = ["app.log.gz", "nginx-access.log.zst", "web_2024.log.gz"]
+    for name in foreign:
+        (tmp_path / name).write_bytes(b"")
+        os.utime(tmp_path / name, (0, 0))
+
+    async def scenario(plugin, mock):
+        results = [await plugin.export_container_logs(None, "svc-1-0", level="error") for _ in range(3)]
+        return results, sorted(os.listdir(tmp_path))
+
+    results, files = run_scenario(
+        scenario,
+        mock_options={"log_bytes": 1 * MiB},
+        plugin_options={"log_export_dir": str(tmp_path), "log_export_keep": 2},
+    )
+    assert "共 12 行，从 12923 行中过滤" in results[0]
+    assert all(line.startswith("[stderr]") for line in results[0].split("开头:\n")[1].splitlines() if line != "结尾:")
+    # 超出保留数量的较早导出会被删除
+    exports = [name for name in files if name not in foreign]
+    assert len(exports) == 2 and all(name.startswith("svc-1-0_") for name in exports)
+    assert set(foreign) <= set(files)
+
+
+def test_failed_export_keeps_previous_exports(tmp_path):
+    async def scenario(plugin, mock):
+        first = await plugin.export_container_logs(None, "svc-1-0")
+        mock.failures[re.compile("/logs")] = 500
+        failed = await plugin.export_container_logs(None, "svc-1-0")
+        return first, failed, sorted(os.listdir(tmp_path))
+
+    first, failed, files = run_scenario(
+        scenario,
+        mock_options={"log_bytes": 64 * 1024},
+        plugin_options={"log_export_dir": str(tmp_path), "log_export_keep": 1},
+    )
+    # 较早的导出只在新导出成功后清理，失败时保留原文件且不留下临时文件
+    assert failed.startswith("导出容器日志失败：500")
+    assert files == [os.path.basename(first.split("：", 1)[1].split("\n", 1)[0])]
+
+
+def test_detect_encoding():
+    assert detect_encoding(b"service started\n" * 10) == "utf-8"
+    assert detect_encoding((TEXT_CN * 2000).encode("utf-8")) == "utf-8"
+    assert detect_encoding((TEXT_CN * 2000).encode("gb18030")) == "gb18030"
+    # 繁体中文的GBK编码不能误判为Big5，Big5也不能误判为GB18030
+    assert detect_encoding((TEXT_TW * 2000).encode("gb18030")) == "gb18030"
+    assert detect_encoding((TEXT_TW * 2000).encode("big5")) == "big5"
+    assert detect_encoding(b"\xff\xfe" + TEXT_CN.encode("utf-16-le")) == "utf-16"
+    assert detect_encoding(TEXT_CN.encode("utf-16-le") * 10) == "utf-16-le"
+
+
+class FakeContent:
+    def __init__(self, data, chunk):
+        self.data = data
+        self.chunk = chunk
+
+    async def iter_chunked(self, size):
+        for i in range(0, len(self.data), self.chunk):
+            yield self.data[i:i + self.chunk]
+
+
+def frame(stream, text, encoding):
+    payload = text.encode(encoding)
+    return bytes([stream, 0, 0, 0]) + len(payload).to_bytes(4, "big") + payload
+
+
+def test_log_stream_detects_encoding_across_frames():
+    # stdout与stderr交替时第一段负载只有一行ASCII，编码要在跨帧累积的样本上检测
+    data = frame(1, "starting\n", "ascii") + frame(2, "warning: slow disk\n", "ascii")
+    for i in range(200):
+        data += frame(1 + i % 2, TEXT_CN, "gb18030")
+
+    async def read():
+        stream = DockerLogStream(FakeContent(data, chunk=4096), detect=detect_encoding, sample_size=4096)
+        return [item async for item in stream.lines()], stream
+
+    lines, stream = asyncio.run(read())
+    assert stream.encoding == "gb18030"
+    assert lines[:3] == [("stdout", "starting"), ("stderr", "warning: slow disk"), ("stdout", TEXT_CN.rstrip())]
+    assert len(lines) == 202 and not any("\ufffd" in line for _, line in lines)
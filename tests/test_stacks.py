@@ -0,0 +1,59 @@
+"""stack列表、重新部署与环境变量修改工具的功能测试"""
+from conftest import run_scenario
+
+
+def test_redeploy_stack_pulls_concurrently():
+    async def scenario(plugin, mock):
+        result = await plugin.redeploy_stack(None, "blog")
+        return result, mock.max_in_flight, mock.hit_count("/images/create"), mock.stack_updates
+
+    result, max_in_flight, pulls, updates = run_scenario(scenario, mock_options={"latency": 0.05})
+    assert result.startswith("stack blog 已重新部署（节点 1）")
+    assert "- registry.local/app1:v1: 已拉取" in result
+    # 3个镜像并发拉取，部署时无需Portainer再次拉取
+    assert pulls == 3 and max_in_flight >= 3
+    assert updates[0]["PullImage"] is False
+
+
+def test_redeploy_swarm_stack_pulls_on_deploy():
+    async def scenario(plugin, mock):
+        mock.stacks.append({"Id": 2, "Name": "api", "Type": 1, "EndpointId": 1, "Status": 1,
+                            "Env": [{"name": "TAG", "value": "v1"}], "GitConfig": None})
+        mock.stack_files[2] = mock.stack_files[1]
+        result = await plugin.redeploy_stack(None, "api")
+        return result, mock.hit_count("/images/create"), mock.stack_updates
+
+    result, pulls, updates = run_scenario(scenario)
+    assert result.startswith("stack api 已重新部署（节点 1）")
+    # swarm服务可能调度到其他节点，不在管理节点预拉取，由Portainer部署时拉取
+    assert pulls == 0
+    assert updates[0]["PullImage"] is True
+
+
+def test_redeploy_stack_aborts_on_pull_failure():
+    async def scenario(plugin, mock):
+        mock.stack_files[1] = mock.stack_files[1].replace("redis:7", "broken")
+        result = await plugin.redeploy_stack(None, "BLOG")
+        return result, mock.stack_updates
+
+    result, updates = run_scenario(scenario)
+    assert result.startswith("stack blog：1 个镜像拉取失败，未重新部署")
+    assert updates == []
+
+
+def test_update_stack_env():
+    async def scenario(plugin, mock):
+        listed = await plugin.list_stacks(None)
+        updated = await plugin.update_stack_env(None, "1", env=["TAG=v2", "DEBUG=1"])
+        unchanged = await plugin.update_stack_env(None, "blog", env=["TAG=v2"])
+        missing = await plugin.update_stack_env(None, "blgo", env=["TAG=v3"])
+        return listed, updated, unchanged, missing, mock.stack_updates
+
+    listed, updated, unchanged, missing, updates = run_scenario(scenario)
+    assert listed == "ID: 1, 名称: blog, 类型: compose, 节点: 1, 状态: 运行中, 环境变量: 1 个"
+    assert updated == "stack blog 的环境变量已更新并重新部署：新增 DEBUG；修改 TAG"
+    assert unchanged == "stack blog 的环境变量没有变化，未重新部署"
+    assert missing == "更新stack环境变量出错: 未找到stack blgo，您是否指：blog"
+    assert len(updates) == 1
+    assert updates[0]["Env"] == [{"name": "TAG", "value": "v2"}, {"name": "DEBUG", "value": "1"}]
+    assert updates[0]["PullImage"] is False and "image: redis:7" in updates[0]["StackFileContent"]